@@ -0,0 +1,515 @@
+import argparse
+import dataclasses
+import datetime
+import functools
+import gc
+import json
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
+
+from book_manager import OrderBookManager
+from demo import generate_orders
+from order import ORDER_TYPE_TO_CODE, SIDE_TO_CODE, create_order
+from order_pool import create_pooled_order_book
+from orderbook import OrderBook
+from price_ladder import PriceLadderOrderQueue
+
+QUANTITIES = list(range(1, 100))
+DELTAS = range(-3, 30)
+CROSSING_DELTAS = range(0, 4)
+
+ADD = "add"
+CANCEL = "cancel"
+AMEND = "amend"
+
+BOOK_FACTORIES: Dict[str, Callable[[], OrderBook]] = {
+    "sorted_list": OrderBook,
+    "price_ladder": lambda: OrderBook(
+        functools.partial(PriceLadderOrderQueue, min_price=1, max_price=20_000)
+    ),
+    "pooled": create_pooled_order_book,
+}
+
+
+def generate_crossing_orders(n):
+    """Limit orders where every other order crosses the spread, often partly filled"""
+    orders = []
+    for i in range(n):
+        side = random.choice(["buy", "sell"])
+        if i % 2 == 0:
+            if side == "buy":
+                price = 99 - random.choice(DELTAS)
+            else:
+                price = 101 + random.choice(DELTAS)
+            quantity = random.choice(QUANTITIES)
+        else:
+            if side == "buy":
+                price = 101 + random.choice(CROSSING_DELTAS)
+            else:
+                price = 99 - random.choice(CROSSING_DELTAS)
+            quantity = random.choice(QUANTITIES) * 3
+        orders.append(
+            create_order(side=side, order_type="limit", quantity=quantity, price=price)
+        )
+    return orders
+
+
+def generate_passive_order(band: int = 30, mid_price: int = 100):
+    """Limit order within band ticks of mid_price that never crosses the spread"""
+    side = random.choice(["buy", "sell"])
+    if side == "buy":
+        price = mid_price - 1 - random.randrange(band)
+    else:
+        price = mid_price + 1 + random.randrange(band)
+    return create_order(side, "limit", random.choice(QUANTITIES), price)
+
+
+def _adds(orders) -> List[Tuple[str, object]]:
+    return [(ADD, order) for order in orders]
+
+
+# Each profile returns untimed setup operations and the timed operations. Operations
+# are (ADD, Order), (CANCEL, order_id) or (AMEND, (order_id, quantity, price)), IDs are
+# predicted from the book assigning one sequence number per accepted order.
+
+
+def demo_profile(n):
+    return [], _adds(generate_orders(n))
+
+
+def passive_only_profile(n):
+    return [], _adds(generate_passive_order() for _ in range(n))
+
+
+def crossing_heavy_profile(n):
+    return [], _adds(generate_crossing_orders(n))
+
+
+def market_sweep_profile(n):
+    """Large market orders sweeping around 20 levels, the book refilled in between"""
+    setup = _adds(
+        generate_passive_order(band=200, mid_price=1_000) for _ in range(20_000)
+    )
+    operations = []
+    for i in range(n):
+        if i % 10 == 0:
+            side = random.choice(["buy", "sell"])
+            quantity = random.randrange(1_000, 4_000)
+            operations.append((ADD, create_order(side, "market", quantity, None)))
+        else:
+            operations.append((ADD, generate_passive_order(band=200, mid_price=1_000)))
+    return setup, operations
+
+
+def market_backlog_profile(n):
+    """
+    n market buys queued on an empty book, then limit sells that each flush around
+    100 of them from the backlog
+    """
+    setup = _adds(
+        create_order("buy", "market", random.choice(QUANTITIES), None) for _ in range(n)
+    )
+    operations = _adds(
+        create_order("sell", "limit", random.randrange(2_500, 7_500), 100)
+        for _ in range(n // 100)
+    )
+    return setup, operations
+
+
+def cancel_heavy_profile(n, cancel_ratio):
+    """Passive adds where cancel_ratio of operations cancel a random live order"""
+    operations = []
+    live_order_ids = []
+    next_order_id = 1
+    for _ in range(n):
+        if live_order_ids and random.random() < cancel_ratio:
+            i = random.randrange(len(live_order_ids))
+            live_order_ids[i], live_order_ids[-1] = (
+                live_order_ids[-1],
+                live_order_ids[i],
+            )
+            operations.append((CANCEL, live_order_ids.pop()))
+        else:
+            operations.append((ADD, generate_passive_order()))
+            live_order_ids.append(next_order_id)
+            next_order_id += 1
+    return [], operations
+
+
+def amend_heavy_profile(n):
+    """Quoting flow where 80% of operations amend a live order, mostly reductions"""
+    setup = _adds(generate_passive_order() for _ in range(1_000))
+    # Copies tracking each order's current quantity and price
+    live_orders = {
+        order_id: dataclasses.replace(order)
+        for order_id, (_, order) in enumerate(setup, start=1)
+    }
+    live_order_ids = list(live_orders)
+    operations = []
+    for _ in range(n):
+        if random.random() < 0.8:
+            order_id = random.choice(live_order_ids)
+            order = live_orders[order_id]
+            if random.random() < 0.7 or order.quantity == 1:
+                # Same price, keeps time priority unless the quantity grows
+                price = None
+                order.quantity = random.randint(1, max(1, order.quantity - 1))
+            else:
+                price = order.price + random.choice([-1, 1])
+                if price == 100:
+                    # Stays on its own side of the 100 mid price
+                    price = 2 * order.price - price
+                order.price = price
+                order.quantity = random.choice(QUANTITIES)
+            operations.append((AMEND, (order_id, order.quantity, price)))
+        else:
+            order = generate_passive_order()
+            operations.append((ADD, order))
+            live_order_ids.append(len(live_orders) + 1)
+            live_orders[len(live_orders) + 1] = dataclasses.replace(order)
+    return setup, operations
+
+
+def deep_book_profile(n):
+    """Few price levels holding long queues, with demo flow on top"""
+    setup = _adds(generate_passive_order(band=5) for _ in range(200_000))
+    return setup, _adds(generate_orders(n))
+
+
+def wide_band_profile(n):
+    """Passive flow spread over thousands of ticks so levels are constantly created"""
+    return [], _adds(
+        generate_passive_order(band=9_000, mid_price=10_000) for _ in range(n)
+    )
+
+
+PROFILES = {
+    "demo": demo_profile,
+    "passive_only": passive_only_profile,
+    "crossing_heavy": crossing_heavy_profile,
+    "market_sweep": market_sweep_profile,
+    "market_backlog": market_backlog_profile,
+    "cancel_heavy_50": functools.partial(cancel_heavy_profile, cancel_ratio=0.5),
+    "cancel_heavy_90": functools.partial(cancel_heavy_profile, cancel_ratio=0.9),
+    "amend_heavy": amend_heavy_profile,
+    "deep_book": deep_book_profile,
+    "wide_band": wide_band_profile,
+}
+
+
+def apply_operations(order_book: OrderBook, operations):
+    for operation, payload in operations:
+        if operation == ADD:
+            order_book.add_order(payload)
+        elif operation == CANCEL:
+            order_book.cancel_order(payload)
+        else:
+            order_book.amend_order(*payload)
+
+
+def time_operations(order_book: OrderBook, operations) -> List[int]:
+    """Per-operation latencies in nanoseconds"""
+    latencies = [0] * len(operations)
+    perf_counter_ns = time.perf_counter_ns
+    add_order = order_book.add_order
+    cancel_order = order_book.cancel_order
+    amend_order = order_book.amend_order
+    for i, (operation, payload) in enumerate(operations):
+        start = perf_counter_ns()
+        if operation == ADD:
+            add_order(payload)
+        elif operation == CANCEL:
+            cancel_order(payload)
+        else:
+            amend_order(*payload)
+        latencies[i] = perf_counter_ns() - start
+    return latencies
+
+
+def percentile(sorted_values: List[int], q: float) -> int:
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def run_profile(profile: str, book: str, order_number: int, seed: int) -> dict:
+    random.seed(seed)
+    setup, operations = PROFILES[profile](order_number)
+
+    order_book = BOOK_FACTORIES[book]()
+    apply_operations(order_book, setup)
+    blocks_before = sys.getallocatedblocks()
+    start_time = time.perf_counter_ns()
+    latencies = time_operations(order_book, operations)
+    elapsed_ns = time.perf_counter_ns() - start_time
+    retained_blocks = sys.getallocatedblocks() - blocks_before
+
+    # Tracing slows execution down, so allocations are measured on a separate run
+    order_book = BOOK_FACTORIES[book]()
+    apply_operations(order_book, setup)
+    tracemalloc.start()
+    apply_operations(order_book, operations)
+    _, peak_traced_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        "profile": profile,
+        "book": book,
+        "operations": len(operations),
+        "seconds": elapsed_ns / 1e9,
+        "operations_per_second": len(operations) / (elapsed_ns / 1e9),
+        "latency_ns": {
+            "p50": percentile(latencies, 0.5),
+            "p99": percentile(latencies, 0.99),
+            "p999": percentile(latencies, 0.999),
+            "max": latencies[-1],
+        },
+        "retained_allocated_blocks": retained_blocks,
+        "peak_traced_bytes": peak_traced_bytes,
+        # ru_maxrss is the process high water mark in KiB on Linux (bytes on macOS)
+        "peak_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def run_sharded(workers: int, order_number: int, symbol_count: int, seed: int) -> dict:
+    """Demo flow spread over symbol_count symbols, timed until every shard caught up"""
+    random.seed(seed)
+    symbols = [f"SYM{i}" for i in range(symbol_count)]
+    symbol_orders = [
+        (random.choice(symbols), order) for order in generate_orders(order_number)
+    ]
+    with OrderBookManager(symbols, workers) as manager:
+        # Waits for the workers to start so process spawn time is not measured
+        manager.sync()
+        start_time = time.perf_counter_ns()
+        for symbol, order in symbol_orders:
+            manager.add_order(symbol, order)
+        manager.sync()
+        elapsed_ns = time.perf_counter_ns() - start_time
+    return {
+        "profile": "sharded",
+        "workers": workers,
+        "symbols": symbol_count,
+        "operations": order_number,
+        "seconds": elapsed_ns / 1e9,
+        "operations_per_second": order_number / (elapsed_ns / 1e9),
+    }
+
+
+def run_side_parallel(profile: str, book: str, order_number: int, seed: int) -> dict:
+    """Throughput of add_orders against add_orders_side_parallel on the same flow"""
+    random.seed(seed)
+    setup, operations = PROFILES[profile](order_number)
+    assert all(
+        operation == ADD for operation, _ in operations
+    ), f"Profile {profile} has cancels, side parallel mode only takes adds"
+    orders = [order for _, order in operations]
+
+    order_book = BOOK_FACTORIES[book]()
+    apply_operations(order_book, setup)
+    start_time = time.perf_counter_ns()
+    order_book.add_orders(orders)
+    serial_ns = time.perf_counter_ns() - start_time
+
+    order_book = BOOK_FACTORIES[book]()
+    apply_operations(order_book, setup)
+    with ThreadPoolExecutor(1) as executor:
+        start_time = time.perf_counter_ns()
+        order_book.add_orders_side_parallel(orders, executor)
+        side_parallel_ns = time.perf_counter_ns() - start_time
+    return {
+        "profile": profile,
+        "book": book,
+        "mode": "side_parallel",
+        "operations": len(orders),
+        "serial_operations_per_second": len(orders) / (serial_ns / 1e9),
+        "side_parallel_operations_per_second": len(orders) / (side_parallel_ns / 1e9),
+    }
+
+
+def run_order_fields(profile: str, book: str, order_number: int, seed: int) -> dict:
+    """
+    Throughput of add_order(create_order(...)) against add_order_fields on the same
+    flow given as raw fields, so order construction and validation are timed too
+    """
+    random.seed(seed)
+    setup, operations = PROFILES[profile](order_number)
+    assert all(
+        operation == ADD for operation, _ in operations
+    ), f"Profile {profile} has cancels, order fields mode only takes adds"
+    rows = [
+        (order.side, order.order_type, order.quantity, order.price)
+        for _, order in operations
+    ]
+    coded_rows = [
+        (SIDE_TO_CODE[side], ORDER_TYPE_TO_CODE[order_type], quantity, price)
+        for side, order_type, quantity, price in rows
+    ]
+
+    order_book = BOOK_FACTORIES[book]()
+    apply_operations(order_book, setup)
+    add_order = order_book.add_order
+    start_time = time.perf_counter_ns()
+    for side, order_type, quantity, price in rows:
+        add_order(create_order(side, order_type, quantity, price))
+    order_ns = time.perf_counter_ns() - start_time
+    # Frees the first book so the second run does not pay for its garbage
+    del order_book, add_order
+    gc.collect()
+
+    order_book = BOOK_FACTORIES[book]()
+    apply_operations(order_book, setup)
+    add_order_fields = order_book.add_order_fields
+    start_time = time.perf_counter_ns()
+    for side, order_type, quantity, price in coded_rows:
+        add_order_fields(side, order_type, quantity, price)
+    fields_ns = time.perf_counter_ns() - start_time
+    return {
+        "profile": profile,
+        "book": book,
+        "mode": "order_fields",
+        "operations": len(rows),
+        "create_order_operations_per_second": len(rows) / (order_ns / 1e9),
+        "order_fields_operations_per_second": len(rows) / (fields_ns / 1e9),
+    }
+
+
+def compare_results(results: List[dict], baseline_path: str):
+    """Prints the throughput change of each result against a previous --output file"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    baseline_results = {
+        (result["profile"], result.get("book"), result.get("workers")): result
+        for result in baseline["results"]
+        if "operations_per_second" in result
+    }
+    commit = (baseline["git_commit"] or "unknown")[:7]
+    for result in results:
+        baseline_result = baseline_results.get(
+            (result["profile"], result.get("book"), result.get("workers"))
+        )
+        if baseline_result is None or "operations_per_second" not in result:
+            continue
+        change = (
+            result["operations_per_second"] / baseline_result["operations_per_second"]
+            - 1
+        )
+        print(
+            f"{result['profile']:>16}: {change:+.1%} ops/second against {commit} "
+            f"({baseline_result['operations_per_second']: .0f} ops/second)"
+        )
+
+
+def get_git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OrderBook workload benchmarks")
+    parser.add_argument(
+        "--profile", action="append", choices=sorted(PROFILES), dest="profiles"
+    )
+    parser.add_argument("--book", choices=sorted(BOOK_FACTORIES), default="sorted_list")
+    parser.add_argument("--orders", type=int, default=200_000)
+    parser.add_argument("--seed", type=int, default=404)
+    parser.add_argument("--output", help="Path to write JSON results to")
+    parser.add_argument(
+        "--compare",
+        help="Path of a previous --output file to report throughput changes against",
+    )
+    parser.add_argument(
+        "--shard-workers",
+        type=int,
+        nargs="+",
+        help="Run the sharded multi-symbol benchmark for each worker count instead",
+    )
+    parser.add_argument("--symbols", type=int, default=64)
+    parser.add_argument(
+        "--side-parallel",
+        action="store_true",
+        help="Compare serial and side parallel adds on add-only profiles instead",
+    )
+    parser.add_argument(
+        "--order-fields",
+        action="store_true",
+        help="Compare create_order plus add_order with add_order_fields instead",
+    )
+    args = parser.parse_args()
+
+    results = []
+    for workers in args.shard_workers or []:
+        result = run_sharded(workers, args.orders, args.symbols, args.seed)
+        print(
+            f"sharded {workers:>2} workers: "
+            f"{result['operations_per_second']: .0f} orders/second"
+        )
+        results.append(result)
+    if args.shard_workers:
+        profiles = []
+    elif args.side_parallel:
+        for profile in args.profiles or ["passive_only", "demo", "crossing_heavy"]:
+            result = run_side_parallel(profile, args.book, args.orders, args.seed)
+            print(
+                f"{profile:>16}: serial "
+                f"{result['serial_operations_per_second']: .0f} ops/second, "
+                "side parallel "
+                f"{result['side_parallel_operations_per_second']: .0f} ops/second"
+            )
+            results.append(result)
+        profiles = []
+    elif args.order_fields:
+        for profile in args.profiles or ["passive_only", "demo", "crossing_heavy"]:
+            result = run_order_fields(profile, args.book, args.orders, args.seed)
+            print(
+                f"{profile:>16}: create_order "
+                f"{result['create_order_operations_per_second']: .0f} ops/second, "
+                "order fields "
+                f"{result['order_fields_operations_per_second']: .0f} ops/second"
+            )
+            results.append(result)
+        profiles = []
+    else:
+        profiles = args.profiles or list(PROFILES)
+    for profile in profiles:
+        result = run_profile(profile, args.book, args.orders, args.seed)
+        latency = result["latency_ns"]
+        print(
+            f"{profile:>16}: {result['operations_per_second']: .0f} ops/second, "
+            f"p50 {latency['p50']}ns, p99 {latency['p99']}ns, p999 {latency['p999']}ns"
+        )
+        results.append(result)
+
+    if args.compare:
+        compare_results(results, args.compare)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "git_commit": get_git_commit(),
+                    "python": platform.python_version(),
+                    "timestamp": datetime.datetime.now(
+                        datetime.timezone.utc
+                    ).isoformat(),
+                    "orders": args.orders,
+                    "seed": args.seed,
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
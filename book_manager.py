@@ -0,0 +1,371 @@
+import multiprocessing
+import struct
+import time
+from multiprocessing import shared_memory
+from typing import Callable, Dict, List, Optional, Sequence
+
+from order import (
+    CODE_TO_ORDER_TYPE,
+    CODE_TO_SIDE,
+    ORDER_TYPE_TO_CODE,
+    SIDE_TO_CODE,
+    Order,
+)
+from orderbook import OrderBook
+from trade_buffer import TradeBuffer
+
+# Record kinds sent to shard workers
+ADD = 0
+CANCEL = 1
+# Worker replies with the stats of its books once every earlier record is processed
+SYNC = 2
+STOP = 3
+# Moves the clock of every book in the shard, expiring due orders
+ADVANCE_TIME = 4
+
+# kind, symbol index, side, order type, quantity, price (0 for market), order ID, stop
+# price (0 unless a stop order), time (an add's expire time or 0, the new time of a
+# clock advance) and account (0 for none)
+RECORD = struct.Struct("<bIbbqqqqqq")
+# Fills sent back by workers: symbol index then a TradeBuffer row (trade price,
+# quantity, aggressor side, maker order ID, taker order ID, best bid, best ask)
+FILL_RECORD = struct.Struct("<Iqqbqqqq")
+# Write (head) and read (tail) counters at the start of the shared memory block
+HEADER_SIZE = 16
+IDLE_SLEEP_SECONDS = 0.0001
+
+
+class SharedMemoryRingBuffer:
+    """
+    Single producer, single consumer ring of fixed-width records in shared memory.
+
+    The producer only advances head and the consumer only advances tail, so no lock is
+    needed: a record is written before head moves past it and read before tail does.
+    Counters go through a native "Q" view so each update is a single aligned store,
+    struct's explicit-endian packers write byte by byte and could be read torn.
+    """
+
+    def __init__(
+        self,
+        capacity: int,
+        name: Optional[str] = None,
+        record: struct.Struct = RECORD,
+    ):
+        self.capacity = capacity
+        self.record = record
+        size = HEADER_SIZE + capacity * record.size
+        if name is None:
+            self.shared_memory = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shared_memory = shared_memory.SharedMemory(name=name)
+        self.name = self.shared_memory.name
+        self.buffer = self.shared_memory.buf
+        self.counters = self.buffer[:HEADER_SIZE].cast("Q")
+        if name is None:
+            self.counters[0] = 0
+            self.counters[1] = 0
+
+    def try_put(self, *record) -> bool:
+        head = self.counters[0]
+        if head - self.counters[1] == self.capacity:
+            return False
+        self.record.pack_into(
+            self.buffer,
+            HEADER_SIZE + (head % self.capacity) * self.record.size,
+            *record,
+        )
+        self.counters[0] = head + 1
+        return True
+
+    def get_batch(self, max_records: int) -> List[tuple]:
+        """Takes up to max_records records, oldest first"""
+        tail = self.counters[1]
+        end = min(self.counters[0], tail + max_records)
+        unpack_from = self.record.unpack_from
+        record_size = self.record.size
+        records = [
+            unpack_from(self.buffer, HEADER_SIZE + (i % self.capacity) * record_size)
+            for i in range(tail, end)
+        ]
+        self.counters[1] = end
+        return records
+
+    def close(self):
+        self.counters.release()
+        self.counters = None
+        self.buffer = None
+        self.shared_memory.close()
+
+    def unlink(self):
+        self.shared_memory.unlink()
+
+
+def _get_book_stats(order_book: OrderBook, orders: int, trades: int) -> dict:
+    return {
+        "orders": orders,
+        "trades": trades,
+        "sequence_number": order_book.sequence_number,
+        "best_bid": order_book.bid_queue.get_best_price(),
+        "best_ask": order_book.ask_queue.get_best_price(),
+    }
+
+
+def _run_shard(
+    ring_name: str,
+    fill_ring_name: Optional[str],
+    capacity: int,
+    symbol_count: int,
+    connection,
+):
+    """Worker loop owning the books of one shard, symbol indexes are shard local"""
+    ring = SharedMemoryRingBuffer(capacity, ring_name)
+    fill_ring = None
+    if fill_ring_name is not None:
+        fill_ring = SharedMemoryRingBuffer(capacity, fill_ring_name, FILL_RECORD)
+    trade_buffers = [TradeBuffer() for _ in range(symbol_count)]
+    order_books = [OrderBook(trade_buffer=buffer) for buffer in trade_buffers]
+    order_counts = [0] * symbol_count
+    trade_counts = [0] * symbol_count
+    running = True
+    while running:
+        records = ring.get_batch(4096)
+        if not records:
+            time.sleep(IDLE_SLEEP_SECONDS)
+            continue
+        for (
+            kind,
+            symbol,
+            side,
+            order_type,
+            quantity,
+            price,
+            order_id,
+            stop_price,
+            record_time,
+            account,
+        ) in records:
+            if kind == ADD:
+                order_books[symbol].add_order(
+                    Order(
+                        CODE_TO_SIDE[side],
+                        CODE_TO_ORDER_TYPE[order_type],
+                        quantity,
+                        price or None,
+                        stop_price or None,
+                        record_time or None,
+                        account or None,
+                    )
+                )
+                order_counts[symbol] += 1
+                trade_buffer = trade_buffers[symbol]
+                if trade_buffer.size:
+                    trade_counts[symbol] += trade_buffer.size
+                    if fill_ring is not None:
+                        _put_fills(fill_ring, symbol, trade_buffer)
+                    trade_buffer.clear()
+            elif kind == CANCEL:
+                order_books[symbol].cancel_order(order_id)
+            elif kind == ADVANCE_TIME:
+                for order_book in order_books:
+                    order_book.advance_time(record_time)
+            elif kind == SYNC:
+                connection.send(
+                    [
+                        _get_book_stats(order_book, orders, trades)
+                        for order_book, orders, trades in zip(
+                            order_books, order_counts, trade_counts
+                        )
+                    ]
+                )
+            elif kind == STOP:
+                running = False
+                break
+    ring.close()
+    if fill_ring is not None:
+        fill_ring.close()
+    connection.close()
+
+
+def _put_fills(
+    fill_ring: SharedMemoryRingBuffer, symbol: int, trade_buffer: TradeBuffer
+):
+    """Sends the buffered fills back, waiting for the manager to drain a full ring"""
+    for row in trade_buffer.rows():
+        while not fill_ring.try_put(symbol, *row):
+            time.sleep(IDLE_SLEEP_SECONDS)
+
+
+class OrderBookManager:
+    """
+    Owns one OrderBook per symbol, sharded across worker processes.
+
+    Symbols are assigned to shards round robin. Each shard is fed through its own
+    shared memory ring, so orders for a symbol are applied in the order they were
+    submitted. Books assign one sequence number per accepted order, which lets the
+    manager hand order IDs back without waiting on the worker.
+
+    When fill_callback is given, workers send every fill back through a second ring per
+    shard and the manager calls fill_callback(symbol, row) for each, row being a
+    TradeBuffer row (best prices 0 for an empty side), in order for each symbol. Fills
+    are delivered whenever the manager drains the rings: in poll_fills, sync and close,
+    and while waiting for space to queue a record.
+    """
+
+    def __init__(
+        self,
+        symbols: Sequence[str],
+        workers: int,
+        ring_capacity: int = 65_536,
+        fill_callback: Optional[Callable[[str, tuple], None]] = None,
+    ):
+        assert workers > 0, f"Workers must be positive, given {workers}"
+        self.symbols = list(symbols)
+        self.symbol_to_shard: Dict[str, int] = {}
+        self.symbol_to_shard_index: Dict[str, int] = {}
+        shard_symbols: List[List[str]] = [[] for _ in range(workers)]
+        for i, symbol in enumerate(self.symbols):
+            shard = i % workers
+            self.symbol_to_shard[symbol] = shard
+            self.symbol_to_shard_index[symbol] = len(shard_symbols[shard])
+            shard_symbols[shard].append(symbol)
+        self.shard_symbols = shard_symbols
+        self.sequence_numbers = {symbol: 0 for symbol in self.symbols}
+        self.current_time = 0
+        self.fill_callback = fill_callback
+
+        context = multiprocessing.get_context("spawn")
+        self.rings = []
+        self.fill_rings = []
+        self.connections = []
+        self.processes = []
+        for symbols_in_shard in shard_symbols:
+            ring = SharedMemoryRingBuffer(ring_capacity)
+            fill_ring = None
+            if fill_callback is not None:
+                fill_ring = SharedMemoryRingBuffer(ring_capacity, record=FILL_RECORD)
+            parent_connection, child_connection = context.Pipe()
+            process = context.Process(
+                target=_run_shard,
+                args=(
+                    ring.name,
+                    None if fill_ring is None else fill_ring.name,
+                    ring_capacity,
+                    len(symbols_in_shard),
+                    child_connection,
+                ),
+                daemon=True,
+            )
+            process.start()
+            self.rings.append(ring)
+            self.fill_rings.append(fill_ring)
+            self.connections.append(parent_connection)
+            self.processes.append(process)
+
+    def _put(self, shard: int, *record):
+        ring = self.rings[shard]
+        while not ring.try_put(*record):
+            if not self.processes[shard].is_alive():
+                raise RuntimeError(f"Shard {shard} worker exited")
+            # The worker may itself be waiting for its fill ring to drain
+            if not self._drain_fills(shard):
+                time.sleep(IDLE_SLEEP_SECONDS)
+
+    def _drain_fills(self, shard: int) -> int:
+        """Delivers the fills shard has sent back so far and returns how many"""
+        fill_ring = self.fill_rings[shard]
+        if fill_ring is None:
+            return 0
+        symbols_in_shard = self.shard_symbols[shard]
+        fill_callback = self.fill_callback
+        count = 0
+        while True:
+            records = fill_ring.get_batch(4096)
+            if not records:
+                return count
+            count += len(records)
+            for symbol, *row in records:
+                fill_callback(symbols_in_shard[symbol], tuple(row))
+
+    def poll_fills(self) -> int:
+        """Delivers the fills every shard has sent back so far and returns how many"""
+        return sum(self._drain_fills(shard) for shard in range(len(self.rings)))
+
+    def add_order(self, symbol: str, order: Order) -> int:
+        """Queues order for symbol's book and returns the ID it will be assigned"""
+        self._put(
+            self.symbol_to_shard[symbol],
+            ADD,
+            self.symbol_to_shard_index[symbol],
+            SIDE_TO_CODE[order.side],
+            ORDER_TYPE_TO_CODE[order.order_type],
+            order.quantity,
+            order.price or 0,
+            0,
+            order.stop_price or 0,
+            order.expire_time or 0,
+            order.account or 0,
+        )
+        self.sequence_numbers[symbol] += 1
+        return self.sequence_numbers[symbol]
+
+    def cancel_order(self, symbol: str, order_id: int):
+        self._put(
+            self.symbol_to_shard[symbol],
+            CANCEL,
+            self.symbol_to_shard_index[symbol],
+            0,
+            0,
+            0,
+            0,
+            order_id,
+            0,
+            0,
+            0,
+        )
+
+    def advance_time(self, time: int):
+        """Queues a clock advance for every book, see OrderBook.advance_time"""
+        # Checked here, a worker failing the book's check would stop its shard
+        assert (
+            time >= self.current_time
+        ), f"Time must not go backwards, given {time} at {self.current_time}"
+        self.current_time = time
+        for shard in range(len(self.rings)):
+            self._put(shard, ADVANCE_TIME, 0, 0, 0, 0, 0, 0, 0, time, 0)
+
+    def sync(self) -> Dict[str, dict]:
+        """Waits for every queued record to be applied and returns stats per symbol"""
+        for shard in range(len(self.rings)):
+            self._put(shard, SYNC, 0, 0, 0, 0, 0, 0, 0, 0, 0)
+        stats = {}
+        for shard, connection in enumerate(self.connections):
+            while not connection.poll(IDLE_SLEEP_SECONDS):
+                self._drain_fills(shard)
+            stats.update(zip(self.shard_symbols[shard], connection.recv()))
+            # Fills of every record before the sync were sent ahead of the stats
+            self._drain_fills(shard)
+        return stats
+
+    def close(self):
+        for shard, process in enumerate(self.processes):
+            if process.is_alive():
+                self._put(shard, STOP, 0, 0, 0, 0, 0, 0, 0, 0, 0)
+        for shard, process in enumerate(self.processes):
+            while process.is_alive():
+                self._drain_fills(shard)
+                process.join(IDLE_SLEEP_SECONDS)
+            self._drain_fills(shard)
+        for ring, fill_ring, connection in zip(
+            self.rings, self.fill_rings, self.connections
+        ):
+            connection.close()
+            for shared_ring in (ring, fill_ring):
+                if shared_ring is not None:
+                    shared_ring.close()
+                    shared_ring.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
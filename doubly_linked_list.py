@@ -21,6 +21,9 @@ class DoublyLinkedList:
         self.head = None
         self.tail = None
         self.length = 0
+        # Total quantity of the orders in the list, owners must adjust it when they
+        # change an order's quantity in place
+        self.quantity = 0
 
     def add_to_tail(self, new_node: Node):
         if new_node.order.order_id == 5:
@@ -33,10 +36,12 @@ class DoublyLinkedList:
             new_node.prev = self.tail
             self.tail = new_node
         self.length += 1
+        self.quantity += new_node.order.quantity
         return self
 
     def remove(self, node: Node):
         self.length -= 1
+        self.quantity -= node.order.quantity
         if node == self.head:
             if node == self.tail:
                 self.head = None
@@ -0,0 +1,41 @@
+import heapq
+from typing import Dict, Iterator, List, Tuple
+
+
+class ExpiryQueue:
+    """
+    Order IDs by expiry time.
+
+    Distinct expiry times are kept in a heap with the IDs expiring at each time in a
+    list, so advancing the clock only pops the due buckets and costs O(expired), not
+    O(book size). Orders filled or cancelled before their time are left in place and
+    dropped by the caller once their bucket comes due.
+    """
+
+    def __init__(self):
+        self.times: List[int] = []
+        self.time_to_order_ids: Dict[int, List[int]] = dict()
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def add(self, order_id: int, expire_time: int):
+        order_ids = self.time_to_order_ids.get(expire_time)
+        if order_ids is None:
+            heapq.heappush(self.times, expire_time)
+            order_ids = self.time_to_order_ids[expire_time] = []
+        order_ids.append(order_id)
+
+    def pop_due(self, time: int) -> List[int]:
+        """IDs expiring at or before time, by expiry time then arrival"""
+        due = []
+        times = self.times
+        while times and times[0] <= time:
+            due.extend(self.time_to_order_ids.pop(heapq.heappop(times)))
+        return due
+
+    def iter_orders(self) -> Iterator[Tuple[int, int]]:
+        """(order ID, expiry time) of every registered order, in no particular order"""
+        for expire_time, order_ids in self.time_to_order_ids.items():
+            for order_id in order_ids:
+                yield order_id, expire_time
@@ -0,0 +1,531 @@
+"""
+asyncio order gateway in front of a single OrderBook.
+
+Every frame in either direction is a big-endian uint32 payload length followed by a
+UTF-8 JSON object. Clients send:
+- {"type": "add", "client_order_id", "side", "order_type", "quantity", "price",
+  "stop_price", "expire_time", "account"}, price and stop_price being optional
+  depending on order_type, expire_time optional (good-till-time against the clock moved
+  by OrderGateway.advance_time) and account optional, checked by the book's
+  RiskManager if it has one
+- {"type": "cancel", "client_order_id", "order_id"}
+- {"type": "subscribe"} to receive market data on this connection
+and receive "execution_report", "cancel_ack" or "reject" replies carrying their
+client_order_id. A session only cancels its own orders. Later fills of an order, as the
+maker or once it is triggered or taken off the market order queue, are sent to the
+session that added it as further "execution_report" messages, and expired orders as
+"expired" messages. Subscribers also receive "trade" (with quantity and both order IDs)
+and "book_update" messages.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import struct
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from demo import generate_orders
+from order import create_order
+from orderbook import OrderBook
+from trade_buffer import AGGRESSOR_SIDE_TO_CODE, NO_PRICE, TradeBuffer
+
+logger = logging.getLogger(__name__)
+
+FRAME_HEADER = struct.Struct("!I")
+
+
+def encode_frame(message: dict) -> bytes:
+    payload = json.dumps(message, separators=(",", ":")).encode()
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Optional[dict]:
+    """
+    Next message from reader, None once the connection is closed. Raises ValueError if
+    the payload is not a JSON object, the next frame can still be read.
+    """
+    try:
+        header = await reader.readexactly(FRAME_HEADER.size)
+        (length,) = FRAME_HEADER.unpack(header)
+        payload = await reader.readexactly(length)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+    message = json.loads(payload)
+    if not isinstance(message, dict):
+        raise ValueError(f"Frame is not a JSON object: {message}")
+    return message
+
+
+class GatewaySession:
+    """
+    One client connection. Outbound frames are queued per matching batch and written
+    by the session's own task, so a client that stops reading only fills its queue.
+    """
+
+    def __init__(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        outbound_queue_size: int,
+    ):
+        self.reader = reader
+        self.writer = writer
+        self.outbound: asyncio.Queue = asyncio.Queue(outbound_queue_size)
+        self.closed = False
+        self.handler_task = asyncio.current_task()
+        self.writer_task = asyncio.create_task(self._write_outbound())
+
+    async def _write_outbound(self):
+        while True:
+            frames = await self.outbound.get()
+            self.writer.writelines(frames)
+            await self.writer.drain()
+
+    def send(self, frames: List[bytes]) -> bool:
+        """Queues frames, False if the client has fallen outbound_queue_size behind"""
+        try:
+            self.outbound.put_nowait(frames)
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.writer_task.cancel()
+            self.writer.close()
+
+
+class OrderGateway:
+    """
+    Accepts orders over TCP and funnels them into a single matching task.
+
+    Connection handlers only parse frames and put requests on the inbound queue. The
+    matching task drains up to max_batch_size requests at a time into the book, then
+    hands each session one list of frames for the whole batch. Sessions whose outbound
+    queue is full are disconnected rather than waited on, so matching never blocks on
+    a slow consumer. kwargs are passed to the OrderBook constructor, the gateway gives
+    the book its own trade buffer to find the orders each fill touched.
+    """
+
+    def __init__(
+        self,
+        max_batch_size: int = 1024,
+        inbound_queue_size: int = 65_536,
+        outbound_queue_size: int = 1024,
+        **kwargs,
+    ):
+        self.max_batch_size = max_batch_size
+        self.inbound_queue_size = inbound_queue_size
+        self.outbound_queue_size = outbound_queue_size
+        self.book_updates = []
+        self.trade_buffer = TradeBuffer()
+        self.order_book = OrderBook(
+            book_update_callback=self.book_updates.append,
+            trade_buffer=self.trade_buffer,
+            **kwargs,
+        )
+        # Session and client_order_id of every order still in the book
+        self.order_owners: Dict[int, Tuple[GatewaySession, Any]] = {}
+        self.sessions: Set[GatewaySession] = set()
+        self.subscribers: Set[GatewaySession] = set()
+        self.batches = 0
+        self.inbound: Optional[asyncio.Queue] = None
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.matching_task: Optional[asyncio.Task] = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        """Starts serving and returns the bound port"""
+        self.inbound = asyncio.Queue(self.inbound_queue_size)
+        self.server = await asyncio.start_server(self._handle_connection, host, port)
+        self.matching_task = asyncio.create_task(self._run_matching())
+        return self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        self.server.close()
+        self.matching_task.cancel()
+        handler_tasks = [session.handler_task for session in self.sessions]
+        for session in list(self.sessions):
+            self._drop(session)
+        # Handlers see their closed connections and return
+        await asyncio.gather(self.matching_task, *handler_tasks, return_exceptions=True)
+        await self.server.wait_closed()
+
+    def _drop(self, session: GatewaySession):
+        session.close()
+        self.sessions.discard(session)
+        self.subscribers.discard(session)
+
+    async def _handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        session = GatewaySession(reader, writer, self.outbound_queue_size)
+        self.sessions.add(session)
+        try:
+            while not session.closed:
+                try:
+                    request = await read_frame(reader)
+                except ValueError as e:
+                    self._reject_frame(session, f"Frame not recognized: {e}")
+                    continue
+                if request is None:
+                    break
+                if request.get("type") == "subscribe":
+                    self.subscribers.add(session)
+                else:
+                    await self.inbound.put((session, request))
+        finally:
+            self._drop(session)
+
+    def _reject_frame(self, session: GatewaySession, reason: str):
+        logger.info(reason)
+        self._send(
+            session,
+            [
+                encode_frame(
+                    {"type": "reject", "client_order_id": None, "reason": reason}
+                )
+            ],
+        )
+
+    async def _run_matching(self):
+        inbound = self.inbound
+        while True:
+            batch = [await inbound.get()]
+            while len(batch) < self.max_batch_size and not inbound.empty():
+                batch.append(inbound.get_nowait())
+            self._process_batch(batch)
+
+    def _process_batch(self, batch: list):
+        replies: Dict[GatewaySession, List[bytes]] = {}
+        market_data = []
+        for session, request in batch:
+            try:
+                reply = self._process_request(session, request)
+            except Exception as e:
+                # One bad request must not stop matching for every session
+                logger.info(f"Request failed: {request}: {e!r}")
+                reply = {
+                    "type": "reject",
+                    "client_order_id": request.get("client_order_id"),
+                    "reason": f"Request failed: {e!r}",
+                }
+            replies.setdefault(session, []).append(encode_frame(reply))
+            reported_order_id = None
+            if reply["type"] == "execution_report":
+                reported_order_id = reply["order_id"]
+                self.order_owners[reported_order_id] = (
+                    session,
+                    reply["client_order_id"],
+                )
+            if len(self.trade_buffer):
+                self._report_fills(reported_order_id, replies, market_data)
+            if reported_order_id is not None and not reply["resting_quantity"]:
+                self.order_owners.pop(reported_order_id, None)
+            self._add_book_updates(market_data)
+        self.batches += 1
+        self._send_all(replies, market_data)
+
+    def advance_time(self, time: int):
+        """
+        Moves the book clock to time, expiring good-till-time orders. Runs between
+        matching batches as the event loop never interleaves them.
+        """
+        replies: Dict[GatewaySession, List[bytes]] = {}
+        for order_id in self.order_book.advance_time(time):
+            owner = self.order_owners.pop(order_id, None)
+            if owner is not None:
+                session, client_order_id = owner
+                replies.setdefault(session, []).append(
+                    encode_frame(
+                        {
+                            "type": "expired",
+                            "client_order_id": client_order_id,
+                            "order_id": order_id,
+                        }
+                    )
+                )
+        market_data = []
+        self._add_book_updates(market_data)
+        self._send_all(replies, market_data)
+
+    def _add_book_updates(self, market_data: List[bytes]):
+        for book_update in self.book_updates:
+            market_data.append(
+                encode_frame(
+                    {
+                        "type": "book_update",
+                        "sequence_number": book_update.sequence_number,
+                        "levels": book_update.levels,
+                    }
+                )
+            )
+        self.book_updates.clear()
+
+    def _send_all(
+        self, replies: Dict[GatewaySession, List[bytes]], market_data: List[bytes]
+    ):
+        for session, frames in replies.items():
+            self._send(session, frames)
+        if market_data:
+            for session in list(self.subscribers):
+                self._send(session, market_data)
+
+    def _report_fills(
+        self,
+        reported_order_id: Optional[int],
+        replies: Dict[GatewaySession, List[bytes]],
+        market_data: List[bytes],
+    ):
+        """
+        Publishes the buffered fills of one request and reports them to the sessions
+        owning the orders they touched, except reported_order_id's own fills which its
+        reply already carries
+        """
+        order_owners = self.order_owners
+        order_fills: Dict[int, list] = {}
+        for (
+            trade_price,
+            quantity,
+            aggressor_side,
+            maker_order_id,
+            taker_order_id,
+            best_bid,
+            best_ask,
+        ) in self.trade_buffer.rows():
+            market_data.append(
+                encode_frame(
+                    {
+                        "type": "trade",
+                        "trade_price": trade_price,
+                        "quantity": quantity,
+                        "aggressor_side": (
+                            "buy"
+                            if aggressor_side == AGGRESSOR_SIDE_TO_CODE["buy"]
+                            else "sell"
+                        ),
+                        "maker_order_id": maker_order_id,
+                        "taker_order_id": taker_order_id,
+                        "bid": None if best_bid == NO_PRICE else best_bid,
+                        "ask": None if best_ask == NO_PRICE else best_ask,
+                    }
+                )
+            )
+            if maker_order_id in order_owners:
+                order_fills.setdefault(maker_order_id, []).append(
+                    [trade_price, quantity, taker_order_id]
+                )
+            if taker_order_id != reported_order_id and taker_order_id in order_owners:
+                order_fills.setdefault(taker_order_id, []).append(
+                    [trade_price, quantity, maker_order_id]
+                )
+        self.trade_buffer.clear()
+        for order_id, fills in order_fills.items():
+            session, client_order_id = order_owners[order_id]
+            resting_quantity = self.order_book.get_order_quantity(order_id)
+            if not resting_quantity:
+                del order_owners[order_id]
+            replies.setdefault(session, []).append(
+                encode_frame(
+                    {
+                        "type": "execution_report",
+                        "client_order_id": client_order_id,
+                        "order_id": order_id,
+                        "fills": fills,
+                        "resting_quantity": resting_quantity,
+                    }
+                )
+            )
+
+    def _send(self, session: GatewaySession, frames: List[bytes]):
+        if session.closed:
+            return
+        if not session.send(frames):
+            peer = session.writer.get_extra_info("peername")
+            logger.info(f"Disconnecting slow consumer {peer}")
+            self._drop(session)
+
+    def _process_request(self, session: GatewaySession, request: dict) -> dict:
+        client_order_id = request.get("client_order_id")
+        request_type = request.get("type")
+        if request_type == "add":
+            try:
+                order = create_order(
+                    request["side"],
+                    request["order_type"],
+                    request["quantity"],
+                    request.get("price"),
+                    request.get("stop_price"),
+                    request.get("expire_time"),
+                    request.get("account"),
+                )
+            except (AssertionError, KeyError, TypeError, ValueError) as e:
+                return {
+                    "type": "reject",
+                    "client_order_id": client_order_id,
+                    "reason": str(e),
+                }
+            report = self.order_book.submit_order(order)
+            if report.reject_reason is not None:
+                return {
+                    "type": "reject",
+                    "client_order_id": client_order_id,
+                    "order_id": report.order_id,
+                    "reason": report.reject_reason,
+                }
+            return {
+                "type": "execution_report",
+                "client_order_id": client_order_id,
+                "order_id": report.order_id,
+                "fills": [
+                    [trade_price, quantity, maker_order_id]
+                    for trade_price, quantity, maker_order_id, _ in report.fills
+                ],
+                "resting_quantity": report.resting_quantity,
+            }
+        if request_type == "cancel" and isinstance(request.get("order_id"), int):
+            order_id = request["order_id"]
+            owner = self.order_owners.get(order_id)
+            if owner is not None and owner[0] is session:
+                del self.order_owners[order_id]
+                if self.order_book.cancel_order(order_id):
+                    return {
+                        "type": "cancel_ack",
+                        "client_order_id": client_order_id,
+                        "order_id": order_id,
+                    }
+            logger.info(f"Cancel of order not owned by session: {order_id}")
+            return {
+                "type": "reject",
+                "client_order_id": client_order_id,
+                "order_id": order_id,
+                "reason": "Order ID not recognized",
+            }
+        logger.info(f"Request not recognized: {request}")
+        return {
+            "type": "reject",
+            "client_order_id": client_order_id,
+            "reason": f"Request not recognized: {request_type}",
+        }
+
+
+async def run_load(
+    host: str, port: int, order_number: int, max_in_flight: int = 256
+) -> dict:
+    """
+    Sends demo order flow over one connection with up to max_in_flight orders awaiting
+    their execution report, and returns end-to-end latency percentiles in microseconds
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    orders = generate_orders(order_number)
+    send_times = [0] * order_number
+    replied = bytearray(order_number)
+    latencies = []
+    window = asyncio.Semaphore(max_in_flight)
+
+    async def receive_replies():
+        while len(latencies) < order_number:
+            reply = await read_frame(reader)
+            if reply is None:
+                raise ConnectionError("Gateway closed the connection")
+            client_order_id = reply["client_order_id"]
+            # Later execution reports of resting orders are not replies to an add
+            if replied[client_order_id]:
+                continue
+            replied[client_order_id] = 1
+            latencies.append(time.perf_counter_ns() - send_times[client_order_id])
+            window.release()
+
+    receiver = asyncio.create_task(receive_replies())
+    start_time = time.perf_counter_ns()
+    for i, order in enumerate(orders):
+        await window.acquire()
+        send_times[i] = time.perf_counter_ns()
+        writer.write(
+            encode_frame(
+                {
+                    "type": "add",
+                    "client_order_id": i,
+                    "side": order.side,
+                    "order_type": order.order_type,
+                    "quantity": order.quantity,
+                    "price": order.price,
+                }
+            )
+        )
+        await writer.drain()
+    await receiver
+    elapsed_ns = time.perf_counter_ns() - start_time
+    writer.close()
+    await writer.wait_closed()
+
+    latencies.sort()
+
+    def percentile(q: float) -> float:
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))] / 1_000
+
+    return {
+        "orders": order_number,
+        "orders_per_second": order_number / (elapsed_ns / 1e9),
+        "latency_us": {
+            "p50": percentile(0.5),
+            "p99": percentile(0.99),
+            "p999": percentile(0.999),
+            "max": latencies[-1] / 1_000,
+        },
+    }
+
+
+async def serve(host: str, port: int):
+    gateway = OrderGateway()
+    port = await gateway.start(host, port)
+    print(f"Order gateway listening on {host}:{port}")
+    await asyncio.Event().wait()
+
+
+async def serve_and_load(order_number: int, max_in_flight: int) -> dict:
+    gateway = OrderGateway()
+    port = await gateway.start()
+    try:
+        return await run_load("127.0.0.1", port, order_number, max_in_flight)
+    finally:
+        await gateway.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="asyncio order gateway")
+    parser.add_argument("mode", choices=["serve", "load"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=0,
+        help="Port to serve on, or of the gateway to load (default: start one)",
+    )
+    parser.add_argument("--orders", type=int, default=100_000)
+    parser.add_argument("--max-in-flight", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=404)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    if args.mode == "serve":
+        asyncio.run(serve(args.host, args.port))
+        return
+    if args.port:
+        result = asyncio.run(
+            run_load(args.host, args.port, args.orders, args.max_in_flight)
+        )
+    else:
+        result = asyncio.run(serve_and_load(args.orders, args.max_in_flight))
+    latency = result["latency_us"]
+    print(
+        f"{result['orders_per_second']: .0f} orders/second, p50 {latency['p50']}us, "
+        f"p99 {latency['p99']}us, p999 {latency['p999']}us, max {latency['max']}us"
+    )
+
+
+if __name__ == "__main__":
+    main()
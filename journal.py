@@ -0,0 +1,370 @@
+"""
+Write-ahead journal of the orders, cancels and clock advances accepted by an OrderBook.
+
+The file starts with magic b"OBJL" and a uint32 version, followed by fixed-width
+little-endian records of RECORD fields plus a crc32 of those fields. A torn record at
+the end of the file, as left by a crash, fails its crc and ends the journal there, and
+is cut off when the journal is reopened for appending. Messages are hashed in the form
+OrderBook returns them without a trade buffer, whichever way the book reports fills.
+"""
+
+import argparse
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import Iterator, NamedTuple, Optional
+
+from order import (
+    CODE_TO_ORDER_TYPE,
+    CODE_TO_SIDE,
+    ORDER_TYPE_TO_CODE,
+    SIDE_TO_CODE,
+    Order,
+)
+from orderbook import OrderBook
+from snapshot import read_snapshot
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"OBJL"
+VERSION = 4
+FILE_HEADER = struct.Struct("<4sI")
+# kind, side, order type, sequence number, quantity, price (0 for market or an amend
+# keeping its price), order ID (cancels and amends), stop price (0 unless a stop order),
+# time (an add's expire time or 0, the new book time of a clock advance), account (0 for
+# none) and the crc32 of the messages the input produced, or of the expired IDs for a
+# clock advance
+RECORD = struct.Struct("<bbbqqqqqqqI")
+RECORD_CRC = struct.Struct("<I")
+FRAME_SIZE = RECORD.size + RECORD_CRC.size
+
+ADD = 1
+CANCEL = 2
+AMEND = 3
+ADVANCE_TIME = 4
+
+
+class JournalRecord(NamedTuple):
+    kind: int
+    side: int
+    order_type: int
+    # Order ID assigned to an add, the book's sequence number otherwise
+    sequence_number: int
+    quantity: int
+    price: int
+    order_id: int
+    stop_price: int
+    time: int
+    account: int
+    messages_crc: int
+
+
+def get_messages_crc(messages: list) -> int:
+    return zlib.crc32(repr(messages).encode())
+
+
+class Journal:
+    """
+    Appends records to the journal at path, fsyncing once per group of records.
+
+    Records are buffered until group_commit_size of them are pending or the oldest has
+    waited max_commit_delay_seconds, then written and fsynced together. A background
+    thread commits a group whose delay runs out with no further records, so an input is
+    durable at most max_commit_delay_seconds (plus the fsync) after it was recorded.
+    Call commit() before acknowledging clients that need durability sooner.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        group_commit_size: int = 1024,
+        max_commit_delay_seconds: float = 0.005,
+    ):
+        self.path = path
+        self.group_commit_size = group_commit_size
+        self.max_commit_delay_seconds = max_commit_delay_seconds
+        self.pending = bytearray()
+        self.pending_records = 0
+        self.first_pending_time = 0.0
+        self.commits = 0
+        # Guards the pending group against the flusher thread
+        self.lock = threading.Lock()
+        self.group_started = threading.Condition(self.lock)
+        self.closed = False
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        # Records appended so far, including any already in the file
+        self.records = 0
+        if size >= FILE_HEADER.size:
+            self.records = sum(1 for _ in iter_journal(path))
+            valid_size = FILE_HEADER.size + self.records * FRAME_SIZE
+            if size > valid_size:
+                # Appending after a torn or corrupt record would hide every later one
+                logger.info(f"Truncating journal {path} after {self.records} records")
+                os.truncate(path, valid_size)
+        elif size > 0:
+            os.truncate(path, 0)
+            size = 0
+        self.file = open(path, "ab")
+        if size == 0:
+            self.file.write(FILE_HEADER.pack(MAGIC, VERSION))
+            self.commit()
+        self.flusher = threading.Thread(target=self._commit_due_groups, daemon=True)
+        self.flusher.start()
+
+    def _append(self, *fields):
+        record = RECORD.pack(*fields)
+        crc = RECORD_CRC.pack(zlib.crc32(record))
+        with self.lock:
+            if self.pending_records == 0:
+                self.first_pending_time = time.monotonic()
+                self.group_started.notify()
+            self.pending += record
+            self.pending += crc
+            self.pending_records += 1
+            self.records += 1
+            if (
+                self.pending_records >= self.group_commit_size
+                or time.monotonic() - self.first_pending_time
+                >= self.max_commit_delay_seconds
+            ):
+                self._commit()
+
+    def _commit_due_groups(self):
+        """Flusher thread, commits a group once it waited max_commit_delay_seconds"""
+        with self.lock:
+            while not self.closed:
+                if not self.pending_records:
+                    self.group_started.wait()
+                    continue
+                delay = (
+                    self.first_pending_time
+                    + self.max_commit_delay_seconds
+                    - time.monotonic()
+                )
+                if delay > 0:
+                    self.group_started.wait(delay)
+                else:
+                    self._commit()
+
+    def record_add(self, order: Order, order_id: int, messages: list):
+        self.record_add_fields(
+            SIDE_TO_CODE[order.side],
+            ORDER_TYPE_TO_CODE[order.order_type],
+            order.quantity,
+            order.price,
+            order_id,
+            messages,
+            order.stop_price,
+            order.expire_time,
+            order.account,
+        )
+
+    def record_add_fields(
+        self,
+        side: int,
+        order_type: int,
+        quantity: int,
+        price: Optional[int],
+        order_id: int,
+        messages: list,
+        stop_price: Optional[int] = None,
+        expire_time: Optional[int] = None,
+        account: Optional[int] = None,
+    ):
+        """record_add for an order given as integer coded fields"""
+        self._append(
+            ADD,
+            side,
+            order_type,
+            order_id,
+            quantity,
+            price or 0,
+            0,
+            stop_price or 0,
+            expire_time or 0,
+            account or 0,
+            get_messages_crc(messages),
+        )
+
+    def record_cancel(self, order_id: int, sequence_number: int):
+        self._append(CANCEL, 0, 0, sequence_number, 0, 0, order_id, 0, 0, 0, 0)
+
+    def record_amend(
+        self,
+        order_id: int,
+        new_quantity: int,
+        new_price: Optional[int],
+        sequence_number: int,
+        messages: list,
+    ):
+        self._append(
+            AMEND,
+            0,
+            0,
+            sequence_number,
+            new_quantity,
+            new_price or 0,
+            order_id,
+            0,
+            0,
+            0,
+            get_messages_crc(messages),
+        )
+
+    def record_advance_time(
+        self, time: int, sequence_number: int, expired_order_ids: list
+    ):
+        self._append(
+            ADVANCE_TIME,
+            0,
+            0,
+            sequence_number,
+            0,
+            0,
+            0,
+            0,
+            time,
+            0,
+            get_messages_crc(expired_order_ids),
+        )
+
+    def commit(self):
+        """Writes pending records and fsyncs them"""
+        with self.lock:
+            self._commit()
+
+    def _commit(self):
+        if self.pending:
+            self.file.write(self.pending)
+            self.pending.clear()
+            self.pending_records = 0
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.commits += 1
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            self.group_started.notify()
+        self.flusher.join()
+        self.commit()
+        self.file.close()
+
+
+def iter_journal(path: str) -> Iterator[JournalRecord]:
+    with open(path, "rb") as f:
+        magic, version = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+        assert magic == MAGIC, f"Not an order book journal: {path}"
+        assert version == VERSION, f"Unsupported journal version {version}"
+        while True:
+            frame = f.read(FRAME_SIZE)
+            if len(frame) < FRAME_SIZE:
+                if frame:
+                    logger.info(f"Ignoring truncated record at end of journal {path}")
+                return
+            record = frame[: RECORD.size]
+            (crc,) = RECORD_CRC.unpack_from(frame, RECORD.size)
+            if zlib.crc32(record) != crc:
+                logger.info(f"Ignoring corrupt record at end of journal {path}")
+                return
+            yield JournalRecord(*RECORD.unpack(record))
+
+
+class ReplayResult(NamedTuple):
+    order_book: OrderBook
+    records: int
+    # Journal positions of records whose regenerated messages differ from the journal
+    mismatched_positions: list
+    seconds: float
+
+
+def replay_journal(
+    journal_path: str, snapshot_path: Optional[str] = None, **kwargs
+) -> ReplayResult:
+    """
+    Rebuilds a book from an optional snapshot plus the journal records after it and
+    checks the regenerated messages of each add and amend, and the expired orders of
+    each clock advance, against the journal. kwargs
+    are passed to the OrderBook constructor.
+    """
+    order_book = OrderBook(**kwargs)
+    # Records before this position were applied before the snapshot was taken
+    start_position = 0
+    if snapshot_path is not None:
+        start_position = read_snapshot(snapshot_path, order_book).journal_records
+    records = 0
+    mismatched_positions = []
+    start_time = time.perf_counter()
+    trade_buffer = order_book.trade_buffer
+    for position, record in enumerate(iter_journal(journal_path)):
+        if position < start_position:
+            continue
+        trade_buffer_start = 0 if trade_buffer is None else len(trade_buffer)
+        if record.kind == ADD:
+            report = order_book.submit_order(
+                Order(
+                    CODE_TO_SIDE[record.side],
+                    CODE_TO_ORDER_TYPE[record.order_type],
+                    record.quantity,
+                    record.price or None,
+                    record.stop_price or None,
+                    record.time or None,
+                    record.account or None,
+                )
+            )
+            messages = report.messages
+            if trade_buffer is not None:
+                messages = trade_buffer.messages(trade_buffer_start)
+            if (
+                report.order_id != record.sequence_number
+                or get_messages_crc(messages) != record.messages_crc
+            ):
+                mismatched_positions.append(position)
+        elif record.kind == AMEND:
+            messages = order_book.amend_order(
+                record.order_id, record.quantity, record.price or None
+            )
+            if trade_buffer is not None:
+                messages = trade_buffer.messages(trade_buffer_start)
+            if get_messages_crc(messages) != record.messages_crc:
+                mismatched_positions.append(position)
+        elif record.kind == ADVANCE_TIME:
+            expired_order_ids = order_book.advance_time(record.time)
+            if get_messages_crc(expired_order_ids) != record.messages_crc:
+                mismatched_positions.append(position)
+        else:
+            order_book.cancel_order(record.order_id)
+        records += 1
+    return ReplayResult(
+        order_book,
+        records,
+        mismatched_positions,
+        time.perf_counter() - start_time,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay an order book journal")
+    parser.add_argument("journal")
+    parser.add_argument("--snapshot", help="Snapshot to restore before the journal")
+    args = parser.parse_args()
+
+    result = replay_journal(args.journal, args.snapshot)
+    print(
+        f"Replayed {result.records} records in {result.seconds: .3f} seconds, "
+        f"{result.records / max(result.seconds, 1e-9): .0f} records/second"
+    )
+    if result.mismatched_positions:
+        print(
+            f"{len(result.mismatched_positions)} records produced different trades, "
+            f"first at journal position {result.mismatched_positions[0]}"
+        )
+    else:
+        print("Regenerated trade stream matches the journal")
+
+
+if __name__ == "__main__":
+    main()
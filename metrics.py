@@ -0,0 +1,110 @@
+import time
+from collections import Counter
+from typing import List
+
+
+class Histogram:
+    """Counts values in power of two buckets, bucket k holding 2**(k-1) to 2**k - 1"""
+
+    def __init__(self):
+        self.buckets: List[int] = [0] * 65
+        self.count = 0
+        self.total = 0
+
+    def record(self, value: int):
+        self.buckets[value.bit_length()] += 1
+        self.count += 1
+        self.total += value
+
+    def snapshot(self) -> dict:
+        """Count, sum and nonempty bucket counts keyed by inclusive upper bound"""
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "buckets": {
+                (1 << k) - 1: count for k, count in enumerate(self.buckets) if count
+            },
+        }
+
+
+class QueueMetrics:
+    """Counters kept by one side's OrderQueue"""
+
+    def __init__(self):
+        self.levels_created = 0
+        self.levels_destroyed = 0
+        # Prices moved by each bisect.insort into the sorted price list
+        self.insort_shifts = Histogram()
+
+    def snapshot(self) -> dict:
+        return {
+            "levels_created": self.levels_created,
+            "levels_destroyed": self.levels_destroyed,
+            "insort_shifts": self.insort_shifts.snapshot(),
+        }
+
+
+class OrderBookMetrics:
+    """
+    Counters and sampled latencies for an OrderBook, see OrderBook's metrics argument.
+
+    Counters are plain attributes updated inline by the book and its queues, a book
+    without metrics only pays an is None check per operation. The latency of one in
+    latency_sample_every operations is timed with perf_counter_ns.
+    """
+
+    def __init__(self, latency_sample_every: int = 64):
+        assert (
+            latency_sample_every > 0
+        ), f"Sample interval must be positive, given {latency_sample_every}"
+        self.latency_sample_every = latency_sample_every
+        self.operations = 0
+        # Keyed by (order_type, side)
+        self.orders: Counter = Counter()
+        self.cancels = 0
+        # Market orders and limit orders that crossed the spread
+        self.fills_per_aggressive_order = Histogram()
+        self.market_flushes = 0
+        self.market_flush_iterations = 0
+        self.bid = QueueMetrics()
+        self.ask = QueueMetrics()
+        self.add_order_latency_ns = Histogram()
+        self.cancel_order_latency_ns = Histogram()
+
+    def start_operation(self) -> int:
+        """perf_counter_ns() if this operation's latency is sampled, otherwise 0"""
+        self.operations += 1
+        if self.operations % self.latency_sample_every == 0:
+            return time.perf_counter_ns()
+        return 0
+
+    def record_add(self, order_type: str, side: str, fills: int, start_ns: int):
+        self.orders[order_type, side] += 1
+        if fills or order_type == "market":
+            self.fills_per_aggressive_order.record(fills)
+        if start_ns:
+            self.add_order_latency_ns.record(time.perf_counter_ns() - start_ns)
+
+    def record_cancel(self, start_ns: int):
+        self.cancels += 1
+        if start_ns:
+            self.cancel_order_latency_ns.record(time.perf_counter_ns() - start_ns)
+
+    def snapshot(self) -> dict:
+        """Current values as plain dicts and ints, for a metrics exporter to scrape"""
+        return {
+            "orders": {
+                f"{order_type}_{side}": count
+                for (order_type, side), count in sorted(self.orders.items())
+            },
+            "cancels": self.cancels,
+            "fills_per_aggressive_order": self.fills_per_aggressive_order.snapshot(),
+            "market_flushes": self.market_flushes,
+            "market_flush_iterations": self.market_flush_iterations,
+            "bid": self.bid.snapshot(),
+            "ask": self.ask.snapshot(),
+            "latency_ns": {
+                "add_order": self.add_order_latency_ns.snapshot(),
+                "cancel_order": self.cancel_order_latency_ns.snapshot(),
+            },
+        }
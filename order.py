@@ -1,33 +1,200 @@
 import dataclasses
 from typing import Literal, Optional
 
-VALID_ORDER_TYPES = {"limit", "market"}
+VALID_ORDER_TYPES = {
+    "limit",
+    "market",
+    # Limit orders whose unfilled remainder is cancelled instead of resting
+    "ioc",
+    # Limit orders that fill completely on arrival or are rejected untouched
+    "fok",
+    # Limit orders that are rejected instead of taking liquidity
+    "post_only",
+    # Market and limit orders held back until a trade prints at their stop price
+    "stop",
+    "stop_limit",
+}
+PRICED_ORDER_TYPES = {"limit", "ioc", "fok", "post_only", "stop_limit"}
+STOP_ORDER_TYPES = {"stop", "stop_limit"}
 VALID_SIDES = {"buy", "sell"}
 
+# Integer codes for side and order type, used by CompactOrder and the binary formats
+BUY = 0
+SELL = 1
+LIMIT = 0
+MARKET = 1
+IOC = 2
+FOK = 3
+POST_ONLY = 4
+STOP = 5
+STOP_LIMIT = 6
+SIDE_TO_CODE = {"buy": BUY, "sell": SELL}
+CODE_TO_SIDE = {code: side for side, code in SIDE_TO_CODE.items()}
+ORDER_TYPE_TO_CODE = {
+    "limit": LIMIT,
+    "market": MARKET,
+    "ioc": IOC,
+    "fok": FOK,
+    "post_only": POST_ONLY,
+    "stop": STOP,
+    "stop_limit": STOP_LIMIT,
+}
+CODE_TO_ORDER_TYPE = {
+    code: order_type for order_type, code in ORDER_TYPE_TO_CODE.items()
+}
+
+
+OrderType = Literal["limit", "market", "ioc", "fok", "post_only", "stop", "stop_limit"]
+
 
 @dataclasses.dataclass()
 class Order:
     side: Literal["buy", "sell"]
-    order_type: Literal["limit", "market"]
+    order_type: OrderType
     quantity: int
     price: Optional[int]
+    # Trade price that triggers a stop or stop_limit order, None for other types
+    stop_price: Optional[int] = None
+    # Time the order leaves the book if still resting (good-till-time), see
+    # OrderBook.advance_time. None keeps it until filled or cancelled
+    expire_time: Optional[int] = None
+    # Owner of the order, used by the book's risk checks, see risk.py
+    account: Optional[int] = None
 
 
-def create_order(
+class CompactOrder:
+    """
+    Order with side and type as integer codes, see create_compact_order. Pass its
+    fields to OrderBook.add_order_fields.
+    """
+
+    __slots__ = (
+        "side",
+        "order_type",
+        "quantity",
+        "price",
+        "stop_price",
+        "expire_time",
+        "account",
+    )
+
+    def __init__(
+        self,
+        side: int,
+        order_type: int,
+        quantity: int,
+        price: Optional[int],
+        stop_price: Optional[int] = None,
+        expire_time: Optional[int] = None,
+        account: Optional[int] = None,
+    ):
+        self.side = side
+        self.order_type = order_type
+        self.quantity = quantity
+        self.price = price
+        self.stop_price = stop_price
+        self.expire_time = expire_time
+        self.account = account
+
+    def __eq__(self, other):
+        if not isinstance(other, CompactOrder):
+            return NotImplemented
+        return (
+            self.side,
+            self.order_type,
+            self.quantity,
+            self.price,
+            self.stop_price,
+            self.expire_time,
+            self.account,
+        ) == (
+            other.side,
+            other.order_type,
+            other.quantity,
+            other.price,
+            other.stop_price,
+            other.expire_time,
+            other.account,
+        )
+
+    def __repr__(self):
+        return (
+            f"CompactOrder(side={self.side}, order_type={self.order_type}, "
+            f"quantity={self.quantity}, price={self.price}, "
+            f"stop_price={self.stop_price}, expire_time={self.expire_time}, "
+            f"account={self.account})"
+        )
+
+
+def _validate_order(
     side: Literal["buy", "sell"],
-    order_type: Literal["limit", "market"],
+    order_type: OrderType,
     quantity: int,
     price: Optional[int],
-) -> Order:
+    stop_price: Optional[int],
+    expire_time: Optional[int],
+    account: Optional[int],
+):
     assert side in VALID_SIDES, f"Unknown side type {side}"
     assert order_type in VALID_ORDER_TYPES, f"Unknown order type {order_type}"
-    assert (order_type == "market" and price is None) or (
-        order_type == "limit" and price is not None
+    assert (order_type in PRICED_ORDER_TYPES) == (
+        price is not None
     ), f"Must choose one of market order or set price, given {order_type}, {price}"
+    assert (order_type in STOP_ORDER_TYPES) == (stop_price is not None) and (
+        stop_price is None or (isinstance(stop_price, int) and stop_price > 0)
+    ), f"Stop price must be a positive int for stop orders only, given {order_type}, {stop_price}"
     assert (
         isinstance(price, int) and price > 0
     ) or price is None, f"Price must be int and positive or None, given type: {type(price)} with value: {price}"
-    assert quantity > 0 and isinstance(
-        quantity, int
+    assert (
+        isinstance(quantity, int) and quantity > 0
     ), f"Quantity must be int and positive, given type: {type(quantity)} with value: {quantity}"
-    return Order(side=side, order_type=order_type, quantity=quantity, price=price)
+    assert expire_time is None or (
+        isinstance(expire_time, int) and expire_time > 0
+    ), f"Expire time must be int and positive or None, given {expire_time}"
+    assert account is None or (
+        isinstance(account, int) and account > 0
+    ), f"Account must be int and positive or None, given {account}"
+
+
+def create_order(
+    side: Literal["buy", "sell"],
+    order_type: OrderType,
+    quantity: int,
+    price: Optional[int],
+    stop_price: Optional[int] = None,
+    expire_time: Optional[int] = None,
+    account: Optional[int] = None,
+) -> Order:
+    _validate_order(side, order_type, quantity, price, stop_price, expire_time, account)
+    return Order(
+        side=side,
+        order_type=order_type,
+        quantity=quantity,
+        price=price,
+        stop_price=stop_price,
+        expire_time=expire_time,
+        account=account,
+    )
+
+
+def create_compact_order(
+    side: Literal["buy", "sell"],
+    order_type: OrderType,
+    quantity: int,
+    price: Optional[int],
+    stop_price: Optional[int] = None,
+    expire_time: Optional[int] = None,
+    account: Optional[int] = None,
+) -> CompactOrder:
+    """Checked like create_order, once, so the book can skip checks and strings"""
+    _validate_order(side, order_type, quantity, price, stop_price, expire_time, account)
+    return CompactOrder(
+        SIDE_TO_CODE[side],
+        ORDER_TYPE_TO_CODE[order_type],
+        quantity,
+        price,
+        stop_price,
+        expire_time,
+        account,
+    )
@@ -0,0 +1,71 @@
+from typing import Dict
+
+# Where a resting order lives, stored as one byte per order ID
+NO_ORDER = 0
+BID = 1
+ASK = 2
+MARKET_BID = 3
+MARKET_ASK = 4
+STOP_BID = 5
+STOP_ASK = 6
+LOCATIONS = (BID, ASK, MARKET_BID, MARKET_ASK, STOP_BID, STOP_ASK)
+
+
+class OrderIndex:
+    """
+    Location of every resting order by ID.
+
+    Order IDs are dense sequence numbers, so locations are kept in a bytearray indexed
+    by ID minus base. Once the array reaches compact_at entries its older half is
+    dropped and base advanced past it, the few orders still resting there move to an
+    overflow dict. Memory stays bounded by compact_at plus the long-lived orders.
+    """
+
+    def __init__(self, compact_at: int = 1 << 20):
+        assert (
+            compact_at >= 2
+        ), f"Compaction size must be at least 2, given {compact_at}"
+        self.compact_at = compact_at
+        self.base = 0
+        self.locations = bytearray()
+        self.overflow: Dict[int, int] = dict()
+
+    def get(self, order_id: int) -> int:
+        i = order_id - self.base
+        if 0 <= i < len(self.locations):
+            return self.locations[i]
+        return self.overflow.get(order_id, NO_ORDER)
+
+    def set(self, order_id: int, location: int):
+        i = order_id - self.base
+        if i < 0:
+            self.overflow[order_id] = location
+            return
+        size = len(self.locations)
+        if i < size:
+            self.locations[i] = location
+            return
+        if i > size:
+            self.locations.extend(bytes(i - size))
+        self.locations.append(location)
+        if i + 1 >= self.compact_at:
+            self.compact()
+
+    def clear(self, order_id: int):
+        i = order_id - self.base
+        if 0 <= i < len(self.locations):
+            self.locations[i] = NO_ORDER
+        else:
+            self.overflow.pop(order_id, None)
+
+    def compact(self):
+        """Moves the older half of the array's orders to overflow and drops it"""
+        cutoff = len(self.locations) // 2
+        locations = self.locations
+        for location in LOCATIONS:
+            i = locations.find(location, 0, cutoff)
+            while i >= 0:
+                self.overflow[self.base + i] = location
+                i = locations.find(location, i + 1, cutoff)
+        del locations[:cutoff]
+        self.base += cutoff
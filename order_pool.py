@@ -0,0 +1,303 @@
+from array import array
+from typing import Dict, Iterator, List, Literal, Optional, Tuple
+
+from doubly_linked_list import OrderBookEntry
+from orderbook import MarketOrderQueue, OrderBook, OrderQueue
+
+NO_SLOT = -1
+# Market orders have no price, prices must be positive so 0 is free to mark that
+NO_PRICE = 0
+
+
+class OrderPool:
+    """
+    Struct-of-arrays store for resting orders.
+
+    Each order occupies a slot across parallel int64 columns for order ID, quantity,
+    price and the prev/next links of the list it sits in, around 40 bytes per order and
+    no per-order objects for the garbage collector to track. Released slots are chained
+    through the next column into a free list and reused before the pool grows.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        assert capacity > 0, f"Capacity must be positive, given {capacity}"
+        self.capacity = 0
+        self.order_ids = array("q")
+        self.quantities = array("q")
+        self.prices = array("q")
+        self.prev = array("q")
+        self.next = array("q")
+        self.free_head = NO_SLOT
+        self.size = 0
+        self._grow(capacity)
+
+    def _grow(self, additional: int):
+        start = self.capacity
+        self.capacity += additional
+        self.order_ids.extend(array("q", [0]) * additional)
+        self.quantities.extend(array("q", [0]) * additional)
+        self.prices.extend(array("q", [NO_PRICE]) * additional)
+        self.prev.extend(array("q", [NO_SLOT]) * additional)
+        # New slots are chained in order and put in front of the current free list
+        self.next.extend(array("q", range(start + 1, self.capacity + 1)))
+        self.next[self.capacity - 1] = self.free_head
+        self.free_head = start
+
+    def allocate(self, order_id: int, quantity: int, price: Optional[int]) -> int:
+        if self.free_head == NO_SLOT:
+            self._grow(self.capacity)
+        slot = self.free_head
+        self.free_head = self.next[slot]
+        self.order_ids[slot] = order_id
+        self.quantities[slot] = quantity
+        self.prices[slot] = NO_PRICE if price is None else price
+        self.prev[slot] = NO_SLOT
+        self.next[slot] = NO_SLOT
+        self.size += 1
+        return slot
+
+    def release(self, slot: int):
+        self.prev[slot] = NO_SLOT
+        self.next[slot] = self.free_head
+        self.free_head = slot
+        self.size -= 1
+
+    def get_entry(self, slot: int) -> OrderBookEntry:
+        price = self.prices[slot]
+        return OrderBookEntry(
+            self.order_ids[slot],
+            self.quantities[slot],
+            None if price == NO_PRICE else price,
+        )
+
+
+class PooledDoublyLinkedList:
+    """DoublyLinkedList of pool slots, links are kept in the pool's prev/next columns"""
+
+    def __init__(self, pool: OrderPool):
+        self.pool = pool
+        self.head = NO_SLOT
+        self.tail = NO_SLOT
+        self.length = 0
+        self.quantity = 0
+
+    def add_to_tail(self, slot: int):
+        if self.length == 0:
+            self.head = slot
+        else:
+            self.pool.next[self.tail] = slot
+            self.pool.prev[slot] = self.tail
+        self.tail = slot
+        self.length += 1
+        self.quantity += self.pool.quantities[slot]
+        return self
+
+    def remove(self, slot: int):
+        prev_slot = self.pool.prev[slot]
+        next_slot = self.pool.next[slot]
+        if prev_slot == NO_SLOT:
+            self.head = next_slot
+        else:
+            self.pool.next[prev_slot] = next_slot
+        if next_slot == NO_SLOT:
+            self.tail = prev_slot
+        else:
+            self.pool.prev[next_slot] = prev_slot
+        self.length -= 1
+        self.quantity -= self.pool.quantities[slot]
+
+
+class PooledOrderQueue(OrderQueue):
+    """OrderQueue keeping resting orders in an OrderPool instead of Node objects"""
+
+    def __init__(self, queue_type: Literal["bid", "ask"], pool: OrderPool = None):
+        super().__init__(queue_type)
+        self.pool = OrderPool() if pool is None else pool
+        # A pool given by the caller may also back the other side
+        self.side_independent = pool is None
+        self.order_id_to_order: Dict[int, int] = dict()
+        self.price_to_order_list: Dict[int, PooledDoublyLinkedList] = dict()
+
+    def _create_order_list(self, price: int) -> PooledDoublyLinkedList:
+        order_list = PooledDoublyLinkedList(self.pool)
+        self.price_to_order_list[price] = order_list
+        return order_list
+
+    def add_order(self, order: OrderBookEntry):
+        order_list = self.price_to_order_list.get(order.price)
+        if order_list is None:
+            self._add_price(order.price)
+            order_list = self._create_order_list(order.price)
+        slot = self.pool.allocate(order.order_id, order.quantity, order.price)
+        order_list.add_to_tail(slot)
+        self.order_id_to_order[order.order_id] = slot
+        if self.changed_prices is not None:
+            self.changed_prices.add(order.price)
+        if self.order_index is not None:
+            self.order_index.set(order.order_id, self.order_location)
+
+    def cancel_order(self, order_id: int):
+        slot = self.order_id_to_order.pop(order_id)
+        price = self.pool.prices[slot]
+        order_list = self.price_to_order_list[price]
+        order_list.remove(slot)
+        self.pool.release(slot)
+        if self.changed_prices is not None:
+            self.changed_prices.add(price)
+        if self.order_index is not None:
+            self.order_index.clear(order_id)
+        # If there are no orders with that price we remove it
+        if order_list.length == 0:
+            self._remove_price(price)
+            del self.price_to_order_list[price]
+
+    def get_order_price(self, order_id: int) -> int:
+        return self.pool.prices[self.order_id_to_order[order_id]]
+
+    def get_order_quantity(self, order_id: int) -> int:
+        return self.pool.quantities[self.order_id_to_order[order_id]]
+
+    def pop_order(self, order_id: int) -> OrderBookEntry:
+        order = self.pool.get_entry(self.order_id_to_order[order_id])
+        self.cancel_order(order_id)
+        return order
+
+    def amend_order(self, order_id: int, new_quantity: int, new_price: int):
+        slot = self.order_id_to_order[order_id]
+        price = self.pool.prices[slot]
+        quantity = self.pool.quantities[slot]
+        order_list = self.price_to_order_list[price]
+        if new_price == price and new_quantity <= quantity:
+            order_list.quantity -= quantity - new_quantity
+            self.pool.quantities[slot] = new_quantity
+            if self.changed_prices is not None:
+                self.changed_prices.add(price)
+            return
+        order_list.remove(slot)
+        if self.changed_prices is not None:
+            self.changed_prices.add(price)
+            self.changed_prices.add(new_price)
+        if order_list.length == 0:
+            self._remove_price(price)
+            del self.price_to_order_list[price]
+        new_order_list = self.price_to_order_list.get(new_price)
+        if new_order_list is None:
+            self._add_price(new_price)
+            new_order_list = self._create_order_list(new_price)
+        self.pool.prices[slot] = new_price
+        self.pool.quantities[slot] = new_quantity
+        self.pool.prev[slot] = NO_SLOT
+        self.pool.next[slot] = NO_SLOT
+        new_order_list.add_to_tail(slot)
+
+    def _unlink_order(self, order_id: int) -> int:
+        slot = self.order_id_to_order.pop(order_id)
+        price = self.pool.prices[slot]
+        self.price_to_order_list[price].remove(slot)
+        self.pool.release(slot)
+        if self.changed_prices is not None:
+            self.changed_prices.add(price)
+        if self.order_index is not None:
+            self.order_index.clear(order_id)
+        return price
+
+    def _release_level(self, price: int) -> List[int]:
+        order_ids = []
+        slot = self.price_to_order_list.pop(price).head
+        while slot != NO_SLOT:
+            next_slot = self.pool.next[slot]
+            order_ids.append(self.pool.order_ids[slot])
+            del self.order_id_to_order[self.pool.order_ids[slot]]
+            self.pool.release(slot)
+            slot = next_slot
+        if self.changed_prices is not None:
+            self.changed_prices.add(price)
+        if self.order_index is not None:
+            for order_id in order_ids:
+                self.order_index.clear(order_id)
+        return order_ids
+
+    def iter_level_orders(self, price: int) -> Iterator[Tuple[int, int]]:
+        slot = self.price_to_order_list[price].head
+        while slot != NO_SLOT:
+            yield self.pool.order_ids[slot], self.pool.quantities[slot]
+            slot = self.pool.next[slot]
+
+    def _match_single(self, order: OrderBookEntry, best_price: int):
+        trade_price = best_price
+        order_list = self.price_to_order_list[trade_price]
+        slot = order_list.head
+        matched_quantity = self.pool.quantities[slot]
+        matched_order_id = self.pool.order_ids[slot]
+        if matched_quantity <= order.quantity:
+            trade_quantity = matched_quantity
+            order.quantity -= trade_quantity
+            self.cancel_order(matched_order_id)
+        else:
+            trade_quantity = order.quantity
+            self.pool.quantities[slot] = matched_quantity - trade_quantity
+            order_list.quantity -= trade_quantity
+            order.quantity = 0
+            if self.changed_prices is not None:
+                self.changed_prices.add(trade_price)
+        return trade_price, trade_quantity, matched_order_id, self.get_best_price()
+
+
+class PooledMarketOrderQueue(MarketOrderQueue):
+    """MarketOrderQueue keeping unexecuted market orders in an OrderPool"""
+
+    def __init__(self, pool: OrderPool = None):
+        super().__init__()
+        self.pool = OrderPool() if pool is None else pool
+        self.order_id_to_order: Dict[int, int] = dict()
+        self.orders = PooledDoublyLinkedList(self.pool)
+
+    def add_order(self, order: OrderBookEntry):
+        slot = self.pool.allocate(order.order_id, order.quantity, order.price)
+        self.order_id_to_order[order.order_id] = slot
+        self.orders.add_to_tail(slot)
+        if self.order_index is not None:
+            self.order_index.set(order.order_id, self.order_location)
+
+    def cancel_order(self, order_id: int):
+        slot = self.order_id_to_order.pop(order_id)
+        self.orders.remove(slot)
+        self.pool.release(slot)
+        if self.order_index is not None:
+            self.order_index.clear(order_id)
+
+    def get_head_order_id(self) -> Optional[int]:
+        if self.orders.length == 0:
+            return None
+        return self.pool.order_ids[self.orders.head]
+
+    def get_order_quantity(self, order_id: int) -> int:
+        return self.pool.quantities[self.order_id_to_order[order_id]]
+
+    def iter_orders(self) -> Iterator[Tuple[int, int]]:
+        slot = self.orders.head
+        while slot != NO_SLOT:
+            yield self.pool.order_ids[slot], self.pool.quantities[slot]
+            slot = self.pool.next[slot]
+
+    def execute_head_order(
+        self, queue: OrderQueue, trades_and_best: Optional[list] = None
+    ) -> list:
+        slot = self.orders.head
+        # The aggressor is a transient entry, only the remaining quantity is stored back
+        order = self.pool.get_entry(slot)
+        trades_and_best = queue.execute_market_order(order, trades_and_best)
+        self.orders.quantity -= self.pool.quantities[slot] - order.quantity
+        self.pool.quantities[slot] = order.quantity
+        if order.quantity == 0:
+            self.cancel_order(order.order_id)
+        return trades_and_best
+
+
+def create_pooled_order_book(capacity: int = 1024) -> OrderBook:
+    """OrderBook whose four queues share one OrderPool"""
+    pool = OrderPool(capacity)
+    return OrderBook(
+        queue_factory=lambda queue_type: PooledOrderQueue(queue_type, pool),
+        market_queue_factory=lambda: PooledMarketOrderQueue(pool),
+    )
@@ -1,57 +1,336 @@
 import bisect
+import itertools
 import logging
-from typing import Dict, List, Literal
+from concurrent.futures import Executor
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Literal,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
 
 from doubly_linked_list import DoublyLinkedList, Node, OrderBookEntry
-from order import Order
+from expiry import ExpiryQueue
+from metrics import OrderBookMetrics, QueueMetrics
+from order import (
+    BUY,
+    CODE_TO_ORDER_TYPE,
+    CODE_TO_SIDE,
+    FOK,
+    IOC,
+    LIMIT,
+    MARKET,
+    ORDER_TYPE_TO_CODE,
+    POST_ONLY,
+    SELL,
+    SIDE_TO_CODE,
+    STOP,
+    STOP_LIMIT,
+    Order,
+)
+from order_index import (
+    ASK,
+    BID,
+    MARKET_ASK,
+    MARKET_BID,
+    NO_ORDER,
+    STOP_ASK,
+    STOP_BID,
+    OrderIndex,
+)
+from risk import RiskManager
+from snapshot import read_snapshot, write_snapshot
+from stop_orders import StopOrder, StopOrderQueue
+from trade_buffer import TradeBuffer
 
 logger = logging.getLogger(__name__)
 
 
 QUEUE_PRICE_TYPE_TO_MULTIPLE = {"ask": 1, "bid": -1}
 
+# Reasons an accepted order was rejected by the book, see ExecutionReport
+REJECT_WOULD_CROSS = "would_cross"
+REJECT_NOT_FILLABLE = "not_fillable"
+REJECT_EXPIRED = "expired"
+REJECT_INVALID_PRICE = "invalid_price"
+
+
+class ExecutionReport(NamedTuple):
+    order_id: Optional[int]
+    # One (trade_price, quantity, maker_order_id, best_price) tuple per fill taken by
+    # the order, best_price being the best maker-side price after that fill
+    fills: list
+    # Quantity left resting in the book, queued as a market order or waiting as a stop
+    resting_quantity: int
+    messages: list
+    # Set when the book rejected the order, e.g. REJECT_WOULD_CROSS for post_only
+    reject_reason: Optional[str] = None
+
+
+class BookUpdate(NamedTuple):
+    """
+    Level changes caused by one input, quantity 0 meaning the level is now empty. A
+    level created and emptied within the same input is also reported with quantity 0.
+    """
+
+    sequence_number: int
+    # (side, price, new total quantity) per changed level, bids then asks
+    levels: Tuple[Tuple[Literal["bid", "ask"], int, int], ...]
+
 
 def get_queue_price_multiple(queue_type: Literal["bid", "ask"]):
     return QUEUE_PRICE_TYPE_TO_MULTIPLE.get(queue_type)
 
 
 class OrderQueue:
+    # True when add_order touches no state shared with the other side's queue, so
+    # OrderBook.add_orders_side_parallel may add to both sides at once
+    side_independent = True
+    # False when is_valid_price accepts every price, so OrderBook can skip the call
+    validates_prices = False
+
     def __init__(self, queue_type: Literal["bid", "ask"]):
         self.queue_price_multiple: int = get_queue_price_multiple(queue_type)
         self.order_id_to_order: Dict[int, Node] = dict()
         self.price_to_order_list: Dict[int, DoublyLinkedList] = dict()
+        # Set by OrderBook to collect prices whose level changed when a feed is enabled
+        self.changed_prices: Optional[Set[int]] = None
+        # Set by OrderBook when metrics are enabled
+        self.metrics: Optional[QueueMetrics] = None
+        # Set by OrderBook, which keeps the location of every resting order
+        self.order_index: Optional[OrderIndex] = None
+        self.order_location = NO_ORDER
+        self._reset_prices()
+
+    def _reset_prices(self):
         self.prices: List[int] = []
 
-    def add_order(self, order: OrderBookEntry):
-        order_node = Node(order)
-        self.order_id_to_order[order.order_id] = order_node
-        if order.price in self.price_to_order_list:
-            self.price_to_order_list[order.price].add_to_tail(order_node)
-        else:
+    def _add_price(self, price: int):
+        if self.metrics is None:
             bisect.insort(
-                self.prices, order.price, key=lambda x: self.queue_price_multiple * x
+                self.prices, price, key=lambda x: self.queue_price_multiple * x
             )
-            self.price_to_order_list[order.price] = DoublyLinkedList().add_to_tail(
-                order_node
+            return
+        i = bisect.bisect(
+            self.prices,
+            price * self.queue_price_multiple,
+            key=lambda x: self.queue_price_multiple * x,
+        )
+        self.metrics.levels_created += 1
+        self.metrics.insort_shifts.record(len(self.prices) - i)
+        self.prices.insert(i, price)
+
+    def _remove_price(self, price: int):
+        if self.metrics is not None:
+            self.metrics.levels_destroyed += 1
+        i = (
+            bisect.bisect(
+                self.prices,
+                price * self.queue_price_multiple,
+                key=lambda x: self.queue_price_multiple * x,
             )
+            - 1
+        )
+        del self.prices[i]
+
+    def iter_prices(self) -> Iterator[int]:
+        """Prices with resting orders, best first"""
+        return iter(self.prices)
+
+    def _append_price(self, price: int):
+        """Adds a price known to be worse than every current price"""
+        if self.metrics is not None:
+            self.metrics.levels_created += 1
+        self.prices.append(price)
+
+    def _create_order_list(self, price: int) -> DoublyLinkedList:
+        order_list = DoublyLinkedList()
+        self.price_to_order_list[price] = order_list
+        return order_list
+
+    def add_order(self, order: OrderBookEntry):
+        order_node = Node(order)
+        order_list = self.price_to_order_list.get(order.price)
+        if order_list is None:
+            # Registering the price first means a rejected price leaves no partial state
+            self._add_price(order.price)
+            order_list = self._create_order_list(order.price)
+        order_list.add_to_tail(order_node)
+        self.order_id_to_order[order.order_id] = order_node
+        if self.changed_prices is not None:
+            self.changed_prices.add(order.price)
+        if self.order_index is not None:
+            self.order_index.set(order.order_id, self.order_location)
 
     def cancel_order(self, order_id: int):
         order_node = self.order_id_to_order[order_id]
         order = order_node.order
         self.price_to_order_list[order.price].remove(order_node)
         del self.order_id_to_order[order_id]
+        if self.changed_prices is not None:
+            self.changed_prices.add(order.price)
+        if self.order_index is not None:
+            self.order_index.clear(order_id)
         # If there are no orders with that price we remove it
         if self.price_to_order_list[order.price].length == 0:
-            i = (
-                bisect.bisect(
-                    self.prices,
-                    order.price * self.queue_price_multiple,
-                    key=lambda x: self.queue_price_multiple * x,
-                )
-                - 1
-            )
-            del self.prices[i]
+            self._remove_price(order.price)
+            del self.price_to_order_list[order.price]
+
+    def pop_order(self, order_id: int) -> OrderBookEntry:
+        """Cancels an order and returns its entry"""
+        order = self.order_id_to_order[order_id].order
+        self.cancel_order(order_id)
+        return order
+
+    def amend_order(self, order_id: int, new_quantity: int, new_price: int):
+        """
+        Changes a resting order's quantity and price. A reduction at the same price
+        keeps time priority, anything else moves the order to the back of new_price's
+        level. new_price must not cross the opposite side.
+        """
+        order_node = self.order_id_to_order[order_id]
+        order = order_node.order
+        order_list = self.price_to_order_list[order.price]
+        if new_price == order.price and new_quantity <= order.quantity:
+            order_list.quantity -= order.quantity - new_quantity
+            order.quantity = new_quantity
+            if self.changed_prices is not None:
+                self.changed_prices.add(order.price)
+            return
+        order_list.remove(order_node)
+        if self.changed_prices is not None:
+            self.changed_prices.add(order.price)
+            self.changed_prices.add(new_price)
+        if order_list.length == 0:
+            self._remove_price(order.price)
             del self.price_to_order_list[order.price]
+        new_order_list = self.price_to_order_list.get(new_price)
+        if new_order_list is None:
+            self._add_price(new_price)
+            new_order_list = self._create_order_list(new_price)
+        order.price = new_price
+        order.quantity = new_quantity
+        # The same node is relinked, clearing links left over from its old level
+        order_node.prev = None
+        order_node.next = None
+        new_order_list.add_to_tail(order_node)
+
+    def _unlink_order(self, order_id: int) -> int:
+        """Removes an order from its level and returns its price, empty levels stay"""
+        order_node = self.order_id_to_order.pop(order_id)
+        order = order_node.order
+        self.price_to_order_list[order.price].remove(order_node)
+        if self.changed_prices is not None:
+            self.changed_prices.add(order.price)
+        if self.order_index is not None:
+            self.order_index.clear(order_id)
+        return order.price
+
+    def _release_level(self, price: int) -> List[int]:
+        """Drops every order at price and returns their IDs, the price stays listed"""
+        order_ids = []
+        node = self.price_to_order_list.pop(price).head
+        while node is not None:
+            order_ids.append(node.order.order_id)
+            del self.order_id_to_order[node.order.order_id]
+            node = node.next
+        if self.changed_prices is not None:
+            self.changed_prices.add(price)
+        if self.order_index is not None:
+            for order_id in order_ids:
+                self.order_index.clear(order_id)
+        return order_ids
+
+    def _remove_price_range(self, low: int, high: int) -> List[int]:
+        """Removes and returns listed prices from low to high inclusive, best first"""
+        key = lambda x: self.queue_price_multiple * x
+        start, end = sorted(
+            [low * self.queue_price_multiple, high * self.queue_price_multiple]
+        )
+        i = bisect.bisect_left(self.prices, start, key=key)
+        j = bisect.bisect_right(self.prices, end, key=key)
+        prices = self.prices[i:j]
+        del self.prices[i:j]
+        if self.metrics is not None:
+            self.metrics.levels_destroyed += len(prices)
+        return prices
+
+    def _remove_prices(self, prices: Set[int]):
+        if len(prices) == 1:
+            self._remove_price(next(iter(prices)))
+            return
+        # One pass over the price list instead of a delete per price
+        self.prices = [price for price in self.prices if price not in prices]
+        if self.metrics is not None:
+            self.metrics.levels_destroyed += len(prices)
+
+    def cancel_orders(self, order_ids: Iterable[int]):
+        """Cancels orders known to be in this queue, removing emptied levels together"""
+        emptied_prices = set()
+        for order_id in order_ids:
+            price = self._unlink_order(order_id)
+            if self.price_to_order_list[price].length == 0:
+                del self.price_to_order_list[price]
+                emptied_prices.add(price)
+        if emptied_prices:
+            self._remove_prices(emptied_prices)
+
+    def cancel_price_range(self, low: int, high: int) -> List[int]:
+        """Cancels the orders priced from low to high inclusive and returns their IDs"""
+        order_ids = []
+        for price in self._remove_price_range(low, high):
+            order_ids.extend(self._release_level(price))
+        return order_ids
+
+    def cancel_all(self) -> List[int]:
+        """Cancels every order and returns their IDs, best level first"""
+        order_ids = []
+        prices = list(self.iter_prices())
+        for price in prices:
+            order_ids.extend(self._release_level(price))
+        self._reset_prices()
+        if self.metrics is not None:
+            self.metrics.levels_destroyed += len(prices)
+        return order_ids
+
+    def restore_orders(self, orders: Iterable[OrderBookEntry]):
+        """
+        Bulk loads orders into an empty queue, orders must come best price first and in
+        time priority within a price so levels are appended without a sorted insert
+        """
+        price = None
+        add_order = self.add_order
+        for order in orders:
+            if order.price != price:
+                price = order.price
+                self._append_price(price)
+                self._create_order_list(price)
+            add_order(order)
+
+    def iter_level_orders(self, price: int) -> Iterator[Tuple[int, int]]:
+        """(order ID, quantity) of the orders at price in time priority"""
+        node = self.price_to_order_list[price].head
+        while node is not None:
+            yield node.order.order_id, node.order.quantity
+            node = node.next
+
+    def get_order_price(self, order_id: int) -> int:
+        return self.order_id_to_order[order_id].order.price
+
+    def get_order_quantity(self, order_id: int) -> int:
+        return self.order_id_to_order[order_id].order.quantity
+
+    def is_valid_price(self, price: int) -> bool:
+        """Whether an order at price can rest in this queue"""
+        return True
 
     def get_best_price(self) -> int:
         best_price = None
@@ -59,34 +338,96 @@ class OrderQueue:
             best_price = self.prices[0]
         return best_price
 
-    def _match_single(self, order: OrderBookEntry):
-        matched_order = self.price_to_order_list[self.prices[0]].head.order
+    def depth(self, n: int) -> List[Tuple[int, int, int]]:
+        """(price, total quantity, order count) for the best n levels, best first"""
+        levels = []
+        for price in itertools.islice(self.iter_prices(), n):
+            order_list = self.price_to_order_list[price]
+            levels.append((price, order_list.quantity, order_list.length))
+        return levels
+
+    def get_level_quantity(self, price: int) -> int:
+        order_list = self.price_to_order_list.get(price)
+        return 0 if order_list is None else order_list.quantity
+
+    def get_available_quantity(self, limit_price: int, quantity: int) -> int:
+        """
+        Quantity an order limited to limit_price could take from this queue, summed
+        from level aggregates best first and stopping once it reaches quantity
+        """
+        queue_price_multiple = self.queue_price_multiple
+        limit = limit_price * queue_price_multiple
+        available = 0
+        for price in self.iter_prices():
+            if price * queue_price_multiple > limit or available >= quantity:
+                break
+            available += self.get_level_quantity(price)
+        return available
+
+    def iter_orders_up_to(
+        self, limit_price: Optional[int]
+    ) -> Iterator[Tuple[int, int]]:
+        """
+        (order ID, quantity) of the orders an order limited to limit_price, None for
+        a market order, would trade with in matching order
+        """
+        queue_price_multiple = self.queue_price_multiple
+        for price in self.iter_prices():
+            if (
+                limit_price is not None
+                and price * queue_price_multiple > limit_price * queue_price_multiple
+            ):
+                return
+            yield from self.iter_level_orders(price)
+
+    def _match_single(self, order: OrderBookEntry, best_price: int):
+        order_list = self.price_to_order_list[best_price]
+        matched_order = order_list.head.order
         trade_price = matched_order.price
         if matched_order.quantity <= order.quantity:
-            order.quantity -= matched_order.quantity
+            trade_quantity = matched_order.quantity
+            order.quantity -= trade_quantity
             self.cancel_order(matched_order.order_id)
         else:
-            matched_order.quantity -= order.quantity
+            trade_quantity = order.quantity
+            matched_order.quantity -= trade_quantity
+            order_list.quantity -= trade_quantity
             order.quantity = 0
-        return trade_price, self.get_best_price()
+            if self.changed_prices is not None:
+                self.changed_prices.add(trade_price)
+        return (
+            trade_price,
+            trade_quantity,
+            matched_order.order_id,
+            self.get_best_price(),
+        )
 
-    def execute_market_order(self, order: OrderBookEntry) -> list:
-        trades_and_queue_best = []
-        while order.quantity > 0 and self.prices:
-            trades_and_queue_best.append(self._match_single(order))
+    def execute_market_order(
+        self, order: OrderBookEntry, trades_and_queue_best: Optional[list] = None
+    ) -> list:
+        """Fills are appended to trades_and_queue_best if given, which is returned"""
+        if trades_and_queue_best is None:
+            trades_and_queue_best = []
+        best_price = self.get_best_price()
+        while order.quantity > 0 and best_price is not None:
+            trade_and_queue_best = self._match_single(order, best_price)
+            trades_and_queue_best.append(trade_and_queue_best)
+            best_price = trade_and_queue_best[3]
         return trades_and_queue_best
 
     def execute_crossed_limit_order(self, order: OrderBookEntry) -> list:
         trades_and_queue_best = []
+        queue_price_multiple = self.queue_price_multiple
+        limit_price = order.price * queue_price_multiple
+        best_price = self.get_best_price()
         while (
-            self.get_best_price() is not None
-            and (
-                self.get_best_price() * self.queue_price_multiple * -1
-                >= order.price * self.queue_price_multiple * -1
-            )
-            and (order.quantity > 0 and len(self.prices) > 0)
+            best_price is not None
+            and best_price * queue_price_multiple <= limit_price
+            and order.quantity > 0
         ):
-            trades_and_queue_best.append(self._match_single(order))
+            trade_and_queue_best = self._match_single(order, best_price)
+            trades_and_queue_best.append(trade_and_queue_best)
+            best_price = trade_and_queue_best[3]
         return trades_and_queue_best
 
 
@@ -94,114 +435,659 @@ class MarketOrderQueue:
     def __init__(self):
         self.order_id_to_order: Dict[int, Node] = dict()
         self.orders = DoublyLinkedList()
+        # Set by OrderBook, which keeps the location of every resting order
+        self.order_index: Optional[OrderIndex] = None
+        self.order_location = NO_ORDER
 
     def add_order(self, order: OrderBookEntry):
         node = Node(order)
         self.order_id_to_order[order.order_id] = node
         self.orders.add_to_tail(node)
+        if self.order_index is not None:
+            self.order_index.set(order.order_id, self.order_location)
 
     def cancel_order(self, order_id: int):
         order_node = self.order_id_to_order[order_id]
         self.orders.remove(order_node)
         del self.order_id_to_order[order_id]
+        if self.order_index is not None:
+            self.order_index.clear(order_id)
+
+    def get_head_order_id(self) -> Optional[int]:
+        if self.orders.length == 0:
+            return None
+        return self.orders.head.order.order_id
+
+    def get_order_quantity(self, order_id: int) -> int:
+        return self.order_id_to_order[order_id].order.quantity
+
+    def iter_orders(self) -> Iterator[Tuple[int, int]]:
+        """(order ID, quantity) of the queued orders in time priority"""
+        node = self.orders.head
+        while node is not None:
+            yield node.order.order_id, node.order.quantity
+            node = node.next
+
+    def execute_head_order(
+        self, queue: OrderQueue, trades_and_best: Optional[list] = None
+    ) -> list:
+        """Executes the oldest queued market order against queue, drops it if filled"""
+        order = self.orders.head.order
+        quantity = order.quantity
+        trades_and_best = queue.execute_market_order(order, trades_and_best)
+        self.orders.quantity -= quantity - order.quantity
+        if order.quantity == 0:
+            self.cancel_order(order.order_id)
+        return trades_and_best
+
+    def execute_orders(
+        self,
+        queue: OrderQueue,
+        trades_and_best: list,
+        taker_order_ids: List[int],
+        before_order_id: Optional[int] = None,
+    ):
+        """
+        Executes queued market orders oldest first against queue until it runs out of
+        liquidity, this queue is empty or the next order's ID is above before_order_id.
+        Fills are appended to trades_and_best and the taker of each to taker_order_ids.
+        """
+        orders = self.orders
+        execute_head_order = self.execute_head_order
+        extend_taker_order_ids = taker_order_ids.extend
+        best_price = queue.get_best_price()
+        while best_price is not None and orders.length > 0:
+            order_id = self.get_head_order_id()
+            if before_order_id is not None and order_id > before_order_id:
+                break
+            fills = len(trades_and_best)
+            execute_head_order(queue, trades_and_best)
+            extend_taker_order_ids(
+                itertools.repeat(order_id, len(trades_and_best) - fills)
+            )
+            # The queue had liquidity so there was at least one fill, the last of
+            # which carries the queue's best price after the order
+            best_price = trades_and_best[-1][3]
+
+
+def _add_entries(queue: OrderQueue, entries: List[OrderBookEntry]):
+    add_order = queue.add_order
+    for entry in entries:
+        add_order(entry)
+
+
+def _cancel_market_orders(market_queue: MarketOrderQueue) -> List[int]:
+    order_ids = [order_id for order_id, _ in market_queue.iter_orders()]
+    for order_id in order_ids:
+        market_queue.cancel_order(order_id)
+    return order_ids
 
 
 class OrderBook:
-    def __init__(self):
+    def __init__(
+        self,
+        queue_factory: Callable[[Literal["bid", "ask"]], OrderQueue] = OrderQueue,
+        market_queue_factory: Callable[[], MarketOrderQueue] = MarketOrderQueue,
+        trade_buffer: Optional[TradeBuffer] = None,
+        book_update_callback: Optional[Callable[[BookUpdate], None]] = None,
+        journal=None,
+        metrics: Optional[OrderBookMetrics] = None,
+        risk: Optional[RiskManager] = None,
+    ):
+        """
+        queue_factory builds the limit order queue for each side, e.g. OrderQueue for
+        the sorted price list or a configured PriceLadderOrderQueue for tick ladders.
+        market_queue_factory builds the queue for each side's unexecuted market orders.
+        When trade_buffer is given fills are appended to it instead of being returned as
+        messages. When book_update_callback is given it receives one BookUpdate per
+        add or cancel that changed any price level. When journal (a journal.Journal)
+        is given every accepted add and cancel is recorded to it. When metrics is given
+        the book and its queues keep its counters up to date. When risk is given orders
+        go through its pre-trade checks and self trade prevention, see risk.py.
+        """
         self.sequence_number: int = 0
+        self.trade_buffer = trade_buffer
+        self.book_update_callback = book_update_callback
+        self.book_update_sequence_number: int = 0
+        self.journal = journal
+        self.metrics = metrics
+        self.risk = risk
 
-        self.bid_queue = OrderQueue("bid")
-        self.ask_queue = OrderQueue("ask")
+        self.bid_queue = queue_factory("bid")
+        self.ask_queue = queue_factory("ask")
 
         # These Queues hold market orders that were not able to execute
-        self.market_bid_queue = MarketOrderQueue()
-        self.market_ask_queue = MarketOrderQueue()
+        self.market_bid_queue = market_queue_factory()
+        self.market_ask_queue = market_queue_factory()
+
+        # Stop orders waiting for a trade at their stop price
+        self.stop_bid_queue = StopOrderQueue(BUY)
+        self.stop_ask_queue = StopOrderQueue(SELL)
+        # Lowest and highest trade prices of the current input while stops are resting
+        self._traded_low_price: Optional[int] = None
+        self._traded_high_price: Optional[int] = None
+
+        # Good-till-time orders by expiry, removed by advance_time
+        self.expiry_queue = ExpiryQueue()
+        self.current_time: int = 0
+
+        self.order_index = OrderIndex()
+        # Indexed by order location, see order_index.py
+        self.queues_by_location = (
+            None,
+            self.bid_queue,
+            self.ask_queue,
+            self.market_bid_queue,
+            self.market_ask_queue,
+            self.stop_bid_queue,
+            self.stop_ask_queue,
+        )
+        for location in (BID, ASK, MARKET_BID, MARKET_ASK, STOP_BID, STOP_ASK):
+            queue = self.queues_by_location[location]
+            queue.order_index = self.order_index
+            queue.order_location = location
+
+        if book_update_callback is not None:
+            self.bid_queue.changed_prices = set()
+            self.ask_queue.changed_prices = set()
+        if metrics is not None:
+            self.bid_queue.metrics = metrics.bid
+            self.ask_queue.metrics = metrics.ask
 
     def _increment_sequence_number(self):
         self.sequence_number += 1
         return self.sequence_number
 
-    def _create_order_and_get_new_sequence_number(self, order: Order):
-        order_id = self._increment_sequence_number()
-        order_book_entry = OrderBookEntry(order_id, order.quantity, order.price)
-        return order_book_entry
-
     def add_order(self, order: Order):
+        messages_for_external_feed = self._add_order(order)[2]
+        return messages_for_external_feed
+
+    def add_order_fields(
+        self,
+        side: int,
+        order_type: int,
+        quantity: int,
+        price: Optional[int],
+        stop_price: Optional[int] = None,
+        expire_time: Optional[int] = None,
+        account: Optional[int] = None,
+    ) -> list:
+        """
+        add_order for an order given as plain fields, side and order_type being the
+        integer codes from order.py, as held by a CompactOrder. No Order is built and
+        no strings are compared, so values must already satisfy create_order's checks.
+        """
+        return self._add_order_fields(
+            side, order_type, quantity, price, stop_price, expire_time, account
+        )[2]
+
+    def submit_order(self, order: Order) -> ExecutionReport:
+        """
+        Adds order and reports its assigned ID, its own fills, resting quantity and
+        reject reason if any
+        """
+        (
+            order_book_entry,
+            trades_and_best,
+            messages_for_external_feed,
+            reject_reason,
+        ) = self._add_order(order)
+        if order_book_entry is None:
+            return ExecutionReport(None, [], 0, messages_for_external_feed)
+        order_id = order_book_entry.order_id
+        # Pooled queues store a copy of the entry, so queued market order flushes after
+        # it was added only show in the owning queue
+        return ExecutionReport(
+            order_id,
+            trades_and_best,
+            self.get_order_quantity(order_id),
+            messages_for_external_feed,
+            reject_reason,
+        )
+
+    def add_orders(self, orders: Iterable[Order]) -> List[Tuple[int, dict]]:
+        """
+        Adds orders in sequence, returns the combined messages with each paired with the
+        position in orders of the order that produced it
+        """
+        messages_for_external_feed = []
+        append_message = messages_for_external_feed.append
+        add_order = self._add_order
+        for i, order in enumerate(orders):
+            for message in add_order(order)[2]:
+                append_message((i, message))
+        return messages_for_external_feed
+
+    def add_orders_batch(
+        self,
+        sides: Sequence[Literal["buy", "sell"]],
+        order_types: Sequence[Literal["limit", "market"]],
+        quantities: Sequence[int],
+        prices: Sequence[Optional[int]],
+    ) -> List[Tuple[int, dict]]:
+        """
+        Columnar form of add_orders, row i of the columns is one order. Values must
+        already satisfy create_order's checks as they are not validated again.
+        """
+        return self.add_orders(map(Order, sides, order_types, quantities, prices))
+
+    def add_orders_side_parallel(
+        self,
+        orders: Iterable[Order],
+        executor: Executor,
+        min_parallel_run: int = 64,
+    ) -> List[Tuple[int, dict]]:
+        """
+        Same result as add_orders, but runs of passive limit orders are added to the bid
+        and ask queues concurrently, the bid side on executor.
+
+        An order is passive when it is a limit order without an expire_time or account
+        that does not cross the opposite best price, counting passive orders earlier in
+        the run, no market orders are queued and the book has no risk checks. Passive
+        orders only touch their own side and produce no trades, so they are given their
+        IDs in input order up front. Any other order is a barrier: the pending run is
+        applied and the order goes through the serial path. Runs with fewer than
+        min_parallel_run orders on either side are applied serially, as are all runs
+        when a queue shares state across sides. Only free-threaded builds get a speedup,
+        under the GIL the threads take turns.
+
+        When a book update callback is set each run publishes a single BookUpdate.
+        """
         messages_for_external_feed = []
-        if order.order_type == "limit":
-            messages_for_external_feed = self._process_limit_order(order)
-        elif order.order_type == "market":
-            messages_for_external_feed = self._process_market_order(order)
+        bid_entries: List[OrderBookEntry] = []
+        ask_entries: List[OrderBookEntry] = []
+        run_orders: List[Tuple[Order, OrderBookEntry]] = []
+        best_bid = self.bid_queue.get_best_price()
+        best_ask = self.ask_queue.get_best_price()
+        market_orders_queued = self._has_queued_market_orders()
+        # Every order must pass the risk checks, which only the serial path runs
+        risk_checked = self.risk is not None
+        for i, order in enumerate(orders):
+            if (
+                order.order_type == "limit"
+                and order.expire_time is None
+                and order.account is None
+                and not market_orders_queued
+                and not risk_checked
+            ):
+                price = order.price
+                if (
+                    order.side == "buy"
+                    and (best_ask is None or price < best_ask)
+                    and self.bid_queue.is_valid_price(price)
+                ):
+                    entry = OrderBookEntry(
+                        self._increment_sequence_number(), order.quantity, price
+                    )
+                    bid_entries.append(entry)
+                    run_orders.append((order, entry))
+                    if best_bid is None or price > best_bid:
+                        best_bid = price
+                    continue
+                if (
+                    order.side == "sell"
+                    and (best_bid is None or price > best_bid)
+                    and self.ask_queue.is_valid_price(price)
+                ):
+                    entry = OrderBookEntry(
+                        self._increment_sequence_number(), order.quantity, price
+                    )
+                    ask_entries.append(entry)
+                    run_orders.append((order, entry))
+                    if best_ask is None or price < best_ask:
+                        best_ask = price
+                    continue
+            if run_orders:
+                self._apply_passive_run(
+                    bid_entries, ask_entries, run_orders, executor, min_parallel_run
+                )
+            for message in self._add_order(order)[2]:
+                messages_for_external_feed.append((i, message))
+            best_bid = self.bid_queue.get_best_price()
+            best_ask = self.ask_queue.get_best_price()
+            market_orders_queued = self._has_queued_market_orders()
+        if run_orders:
+            self._apply_passive_run(
+                bid_entries, ask_entries, run_orders, executor, min_parallel_run
+            )
+        return messages_for_external_feed
+
+    def _apply_passive_run(
+        self,
+        bid_entries: List[OrderBookEntry],
+        ask_entries: List[OrderBookEntry],
+        run_orders: List[Tuple[Order, OrderBookEntry]],
+        executor: Executor,
+        min_parallel_run: int,
+    ):
+        """Adds and then clears a run of passive orders collected for each side"""
+        if (
+            len(bid_entries) >= min_parallel_run
+            and len(ask_entries) >= min_parallel_run
+            and self.bid_queue.side_independent
+            and self.ask_queue.side_independent
+        ):
+            # Growing the index from both threads could race, so every run order
+            # gets its entry up front and the queues only overwrite it in place
+            for _, entry in run_orders:
+                self.order_index.set(entry.order_id, NO_ORDER)
+            bids_added = executor.submit(_add_entries, self.bid_queue, bid_entries)
+            _add_entries(self.ask_queue, ask_entries)
+            # Barrier, the next order may need both sides
+            bids_added.result()
         else:
+            _add_entries(self.bid_queue, bid_entries)
+            _add_entries(self.ask_queue, ask_entries)
+        if self.book_update_callback is not None:
+            self._publish_book_update()
+        if self.journal is not None:
+            for order, entry in run_orders:
+                self.journal.record_add(order, entry.order_id, [])
+        if self.metrics is not None:
+            for order, _ in run_orders:
+                self.metrics.record_add(order.order_type, order.side, 0, 0)
+        bid_entries.clear()
+        ask_entries.clear()
+        run_orders.clear()
+
+    def _add_order(self, order: Order):
+        """
+        Returns the order's entry (None if it was not recognized), the fills it took as
+        aggressor, all messages for the external feed, including queue flushes and
+        triggered stops, and the reject reason. Rejected orders still use up an ID.
+        """
+        order_type = ORDER_TYPE_TO_CODE.get(order.order_type)
+        if order_type is None:
             logger.info(
                 f"Failed to process order, unrecognized type: {order.order_type}"
             )
-        messages_for_external_feed.extend(self._attempt_to_flush_market_order_queues())
-        return messages_for_external_feed
+            return None, [], [], None
+        side = SIDE_TO_CODE.get(order.side)
+        if side is None:
+            logger.info(f"Failed to process order, unrecognized side: {order.side}")
+            return None, [], [], None
+        return self._add_order_fields(
+            side,
+            order_type,
+            order.quantity,
+            order.price,
+            order.stop_price,
+            order.expire_time,
+            order.account,
+        )
 
-    def _flush_single_market_order_from_queue(self):
-        side = None
+    def _add_order_fields(
+        self,
+        side: int,
+        order_type: int,
+        quantity: int,
+        price: Optional[int],
+        stop_price: Optional[int] = None,
+        expire_time: Optional[int] = None,
+        account: Optional[int] = None,
+    ):
+        """_add_order for integer coded side and type"""
+        # Every optional subsystem is looked up once and skipped with an is None check,
+        # so a plain OrderBook pays little for them
+        metrics = self.metrics
+        if metrics is not None:
+            start_ns = metrics.start_operation()
+        journal = self.journal
+        if journal is not None and self.trade_buffer is not None:
+            trade_buffer_start = len(self.trade_buffer)
+        else:
+            trade_buffer_start = 0
+        self.sequence_number += 1
+        order_book_entry = OrderBookEntry(self.sequence_number, quantity, price)
+        risk = self.risk
+        reject_reason = None
+        queue = self.bid_queue if side == BUY else self.ask_queue
+        if expire_time is not None and expire_time <= self.current_time:
+            reject_reason = REJECT_EXPIRED
+        elif (
+            price is not None
+            and queue.validates_prices
+            and not queue.is_valid_price(price)
+        ):
+            # Checked before matching, so an order that could not rest trades nothing
+            reject_reason = REJECT_INVALID_PRICE
+        elif risk is not None:
+            reject_reason = risk.check_order(
+                self, side, order_type, quantity, price, account
+            )
+            if reject_reason is None and account is not None:
+                reject_reason = self._cancel_self_trades(
+                    side, order_type, order_book_entry, account
+                )
+        if reject_reason is not None:
+            order_book_entry.quantity = 0
+            trades_and_best = []
+        elif order_type == LIMIT:
+            trades_and_best = self._process_limit_order(side, order_book_entry)
+        elif order_type == MARKET:
+            trades_and_best = self._process_market_order(side, order_book_entry)
+        else:
+            trades_and_best, reject_reason = self._process_conditional_order(
+                side, order_type, order_book_entry, stop_price
+            )
+        if expire_time is not None and order_book_entry.quantity > 0:
+            self.expiry_queue.add(order_book_entry.order_id, expire_time)
         messages_for_external_feed = []
+        if trades_and_best:
+            messages_for_external_feed = self._convert_trades_and_best_to_messages(
+                trades_and_best, CODE_TO_SIDE[side], order_book_entry.order_id
+            )
+        # After the order's own fills and before queued market orders can fill it
+        if account is not None and risk is not None and order_book_entry.quantity > 0:
+            risk.add_open_order(
+                order_book_entry.order_id, account, side, order_book_entry.quantity
+            )
+        if self.market_bid_queue.orders.length or self.market_ask_queue.orders.length:
+            messages_for_external_feed.extend(
+                self._attempt_to_flush_market_order_queues()
+            )
+        if self._traded_high_price is not None:
+            messages_for_external_feed.extend(self._trigger_stop_orders())
+        if self.book_update_callback is not None:
+            self._publish_book_update()
+        if journal is not None:
+            journal.record_add_fields(
+                side,
+                order_type,
+                quantity,
+                price,
+                order_book_entry.order_id,
+                self._journaled_messages(
+                    messages_for_external_feed, trade_buffer_start
+                ),
+                stop_price,
+                expire_time,
+                account,
+            )
+        if metrics is not None:
+            metrics.record_add(
+                CODE_TO_ORDER_TYPE[order_type],
+                CODE_TO_SIDE[side],
+                len(trades_and_best),
+                start_ns,
+            )
+        return (
+            order_book_entry,
+            trades_and_best,
+            messages_for_external_feed,
+            reject_reason,
+        )
+
+    def _cancel_self_trades(
+        self, side: int, order_type: int, order_book_entry: OrderBookEntry, account: int
+    ) -> Optional[str]:
+        """
+        Cancels account's resting orders that order_book_entry would trade with. An
+        order that may rest also cancels account's queued market orders on the other
+        side, as they could take it at any later flush. A fok order other accounts
+        cannot fill is rejected before anything is cancelled.
+        """
+        risk = self.risk
+        if not risk.limits.self_trade_prevention or order_type in (STOP, STOP_LIMIT):
+            return None
+        if side == BUY:
+            opposite_side, opposite_queue = SELL, self.ask_queue
+            opposite_market_queue = self.market_ask_queue
+        else:
+            opposite_side, opposite_queue = BUY, self.bid_queue
+            opposite_market_queue = self.market_bid_queue
+        if not risk.has_open_quantity(account, opposite_side):
+            return None
+        price = order_book_entry.price
+        opposite_best_price = opposite_queue.get_best_price()
+        opposite_multiple = opposite_queue.queue_price_multiple
+        crosses = opposite_best_price is not None and (
+            price is None
+            or opposite_best_price * opposite_multiple <= price * opposite_multiple
+        )
+        order_ids = []
+        # Crossing post_only orders are rejected without trading
+        if crosses and order_type != POST_ONLY:
+            order_ids, unfilled_quantity = risk.find_self_trades(
+                opposite_queue.iter_orders_up_to(price),
+                order_book_entry.quantity,
+                account,
+            )
+            if order_type == FOK and unfilled_quantity:
+                return REJECT_NOT_FILLABLE
         if (
+            order_type == LIMIT or (order_type == POST_ONLY and not crosses)
+        ) and opposite_market_queue.orders.length > 0:
+            order_ids.extend(
+                order_id
+                for order_id, _ in opposite_market_queue.iter_orders()
+                if risk.get_account(order_id) == account
+            )
+        if order_ids:
+            self._remove_orders(order_ids)
+            risk.remove_open_orders(order_ids)
+            if self.metrics is not None:
+                self.metrics.cancels += len(order_ids)
+        return None
+
+    def _has_queued_market_orders(self) -> bool:
+        return self.market_bid_queue.orders.length > 0 or (
             self.market_ask_queue.orders.length > 0
-            and self.market_bid_queue.orders.length > 0
+        )
+
+    def _attempt_to_flush_market_order_queues(self):
+        """
+        Executes queued market orders against the book in order ID (time) order across
+        both market queues. Consecutive orders of one side are swept in one pass, their
+        fills collected in one buffer and converted to messages together.
+        """
+        market_bid_queue = self.market_bid_queue
+        market_ask_queue = self.market_ask_queue
+        has_bids = bool(self.bid_queue.order_id_to_order)
+        has_asks = bool(self.ask_queue.order_id_to_order)
+        if not (
+            (has_bids and market_ask_queue.orders.length)
+            or (has_asks and market_bid_queue.orders.length)
         ):
+            # No queued order has anything to trade with, which is the common case
+            if self.metrics is not None:
+                self.metrics.market_flushes += 1
+                self.metrics.market_flush_iterations += 1
+            return []
+        messages_for_external_feed = []
+        # A sweep only moves its own queue's head and the best price it trades against,
+        # so the rest is carried over between sweeps instead of read again
+        bid_head_order_id = market_bid_queue.get_head_order_id()
+        ask_head_order_id = market_ask_queue.get_head_order_id()
+        iterations = 0
+        while True:
+            iterations += 1
+            # Same choice as executing one order at a time. Executing one side never
+            # adds liquidity for the other, so a side is swept until the other's head
+            # order would have been picked instead
             if (
-                self.market_ask_queue.orders.head.order.order_id
-                < self.market_bid_queue.orders.head.order.order_id
-            ) and len(self.bid_queue.prices) > 0:
+                ask_head_order_id is not None
+                and has_bids
+                and (bid_head_order_id is None or ask_head_order_id < bid_head_order_id)
+            ):
                 side = "sell"
-            elif len(self.ask_queue.prices) > 0:
+                trades_and_best = []
+                taker_order_ids = []
+                market_ask_queue.execute_orders(
+                    self.bid_queue, trades_and_best, taker_order_ids, bid_head_order_id
+                )
+                ask_head_order_id = market_ask_queue.get_head_order_id()
+                has_bids = trades_and_best[-1][3] is not None
+            elif (
+                bid_head_order_id is not None
+                and has_asks
+                and (
+                    ask_head_order_id is None
+                    or bid_head_order_id < ask_head_order_id
+                    or not has_bids
+                )
+            ):
                 side = "buy"
-        elif self.market_ask_queue.orders.length > 0 and len(self.bid_queue.prices) > 0:
-            side = "sell"
-        elif self.market_bid_queue.orders.length > 0 and len(self.ask_queue.prices) > 0:
-            side = "buy"
-
-        if side is not None:
-            if side == "buy":
-                order_book_entry = self.market_bid_queue.orders.head.order
-                queue = self.ask_queue
-                market_order_queue = self.market_bid_queue
+                trades_and_best = []
+                taker_order_ids = []
+                market_bid_queue.execute_orders(
+                    self.ask_queue,
+                    trades_and_best,
+                    taker_order_ids,
+                    ask_head_order_id if has_bids else None,
+                )
+                bid_head_order_id = market_bid_queue.get_head_order_id()
+                has_asks = trades_and_best[-1][3] is not None
             else:
-                order_book_entry = self.market_ask_queue.orders.head.order
-                queue = self.bid_queue
-                market_order_queue = self.market_ask_queue
-
-            trades_and_best = queue.execute_market_order(order_book_entry)
-            if order_book_entry.quantity == 0:
-                market_order_queue.cancel_order(order_book_entry.order_id)
-
-            messages_for_external_feed = self._convert_trades_and_best_to_messages(
-                trades_and_best, side
-            )
-        return messages_for_external_feed, side
-
-    def _attempt_to_flush_market_order_queues(self):
-        messages_for_external_feed = []
-        side = "start"
-        while side is not None:
-            messages_for_external_feed_from_execute, side = (
-                self._flush_single_market_order_from_queue()
+                break
+            messages_for_external_feed.extend(
+                self._convert_trades_and_best_to_messages(
+                    trades_and_best, side, taker_order_ids
+                )
             )
-            messages_for_external_feed.extend(messages_for_external_feed_from_execute)
+        if self.metrics is not None:
+            self.metrics.market_flushes += 1
+            self.metrics.market_flush_iterations += iterations
         return messages_for_external_feed
 
     def _convert_trades_and_best_to_messages(
-        self, trades_and_best: list, side: str
+        self,
+        trades_and_best: list,
+        side: str,
+        taker_order_id: Union[int, List[int]],
     ) -> list:
+        """taker_order_id is the aggressor's ID or a list of the taker of each fill"""
+        if self.risk is not None:
+            self.risk.record_fills(trades_and_best, taker_order_id)
+        if trades_and_best and (
+            self.stop_bid_queue.order_id_to_stop_price
+            or self.stop_ask_queue.order_id_to_stop_price
+        ):
+            self._record_traded_prices(trades_and_best)
+        if side == "buy":
+            opposite_best = self.bid_queue.get_best_price()
+        else:
+            opposite_best = self.ask_queue.get_best_price()
+        if self.trade_buffer is not None:
+            if isinstance(taker_order_id, list):
+                self.trade_buffer.append_sweep(
+                    trades_and_best, side, taker_order_id, opposite_best
+                )
+            else:
+                self.trade_buffer.append_trades(
+                    trades_and_best, side, taker_order_id, opposite_best
+                )
+            return []
         trades = []
         bids = []
         asks = []
         if side == "buy":
             best = asks
-            opposite_best = self.bid_queue.get_best_price()
             bids = [opposite_best] * len(trades_and_best)
         else:
             best = bids
-            opposite_best = self.ask_queue.get_best_price()
             asks = [opposite_best] * len(trades_and_best)
-        for trade, best_price in trades_and_best:
+        for trade, _, _, best_price in trades_and_best:
             trades.append(trade)
             best.append(best_price)
         return [
@@ -209,85 +1095,430 @@ class OrderBook:
             for bid, ask, trade_price in zip(bids, asks, trades)
         ]
 
+    def _record_traded_prices(self, trades_and_best: list):
+        """Widens the current input's traded price range, checked by stop orders"""
+        # Fills of one execution walk away from the best price, so the first and last
+        # are the extremes
+        low = trades_and_best[0][0]
+        high = trades_and_best[-1][0]
+        if low > high:
+            low, high = high, low
+        if self._traded_high_price is None:
+            self._traded_low_price, self._traded_high_price = low, high
+        else:
+            self._traded_low_price = min(self._traded_low_price, low)
+            self._traded_high_price = max(self._traded_high_price, high)
+
     @staticmethod
     def _output_external_messages(messages: list):
         for message in messages:
             print(message)
 
-    def _process_limit_order(self, order: Order):
+    def _process_limit_order(self, side: int, order_book_entry: OrderBookEntry):
+        """
+        Sweeps the opposite side if the order crosses and rests any remainder under the
+        order's own ID, in a single pass
+        """
+        price = order_book_entry.price
         crossed_order = False
-        messages_for_external_feed = []
-        if order.side == "buy":
+        if side == BUY:
             queue = self.bid_queue
-            best_price_opposite_price = self.ask_queue.get_best_price()
+            opposite_queue = self.ask_queue
+            best_price_opposite_price = opposite_queue.get_best_price()
             if (
                 best_price_opposite_price is not None
-                and order.price >= best_price_opposite_price
+                and price >= best_price_opposite_price
             ):
-                queue = self.ask_queue
                 crossed_order = True
-        elif order.side == "sell":
+        else:
             queue = self.ask_queue
-            best_price_opposite_price = self.bid_queue.get_best_price()
+            opposite_queue = self.bid_queue
+            best_price_opposite_price = opposite_queue.get_best_price()
             if (
                 best_price_opposite_price is not None
-                and order.price <= best_price_opposite_price
+                and price <= best_price_opposite_price
             ):
-                queue = self.bid_queue
                 crossed_order = True
-        else:
-            logger.info(f"Failed to process order, unrecognized side: {order.side}")
-            return messages_for_external_feed
+        trades_and_best = []
         if crossed_order:
-            trades_and_best = self._process_crossed_limit_order(order, queue)
-            messages_for_external_feed = self._convert_trades_and_best_to_messages(
-                trades_and_best, order.side
+            trades_and_best = opposite_queue.execute_crossed_limit_order(
+                order_book_entry
             )
-        else:
-            order_book_entry = self._create_order_and_get_new_sequence_number(order)
-            queue.add_order(order_book_entry)
-        return messages_for_external_feed
-
-    def _process_crossed_limit_order(self, order: Order, queue: OrderQueue):
-        order_book_entry = self._create_order_and_get_new_sequence_number(order)
-        trades_and_best = queue.execute_crossed_limit_order(order_book_entry)
         if order_book_entry.quantity > 0:
-            self._process_limit_order(
-                Order(
-                    order.side, order.order_type, order_book_entry.quantity, order.price
-                )
-            )
+            queue.add_order(order_book_entry)
         return trades_and_best
 
-    def _process_market_order(self, order: Order):
-        messages_for_external_feed = []
-        if order.side == "buy":
-            queue = self.ask_queue
-        elif order.side == "sell":
-            queue = self.bid_queue
-        else:
-            logger.info(f"Failed to process order, unrecognized side: {order.side}")
-            return messages_for_external_feed
-        order_book_entry = self._create_order_and_get_new_sequence_number(order)
+    def _process_market_order(self, side: int, order_book_entry: OrderBookEntry):
+        queue = self.ask_queue if side == BUY else self.bid_queue
         trades_and_best = queue.execute_market_order(order_book_entry)
         if order_book_entry.quantity > 0:
-            if order.side == "buy":
+            if side == BUY:
                 self.market_bid_queue.add_order(order_book_entry)
             else:
                 self.market_ask_queue.add_order(order_book_entry)
-        messages_for_external_feed = self._convert_trades_and_best_to_messages(
-            trades_and_best, order.side
+        return trades_and_best
+
+    def _process_conditional_order(
+        self,
+        side: int,
+        order_type: int,
+        order_book_entry: OrderBookEntry,
+        stop_price: Optional[int],
+    ):
+        """
+        Handles ioc, fok, post_only and stop orders, returning their fills and reject
+        reason. Orders that end up not resting have their entry's quantity set to 0.
+        """
+        if side == BUY:
+            queue, opposite_queue = self.bid_queue, self.ask_queue
+        else:
+            queue, opposite_queue = self.ask_queue, self.bid_queue
+        if order_type == IOC:
+            # Takes whatever crosses, execution stops at the limit price by itself
+            trades_and_best = opposite_queue.execute_crossed_limit_order(
+                order_book_entry
+            )
+            order_book_entry.quantity = 0
+            return trades_and_best, None
+        if order_type == FOK:
+            # Checked against level aggregates before anything is touched
+            if (
+                opposite_queue.get_available_quantity(
+                    order_book_entry.price, order_book_entry.quantity
+                )
+                < order_book_entry.quantity
+            ):
+                order_book_entry.quantity = 0
+                return [], REJECT_NOT_FILLABLE
+            return opposite_queue.execute_crossed_limit_order(order_book_entry), None
+        if order_type == POST_ONLY:
+            opposite_best_price = opposite_queue.get_best_price()
+            opposite_multiple = opposite_queue.queue_price_multiple
+            if opposite_best_price is not None and (
+                opposite_best_price * opposite_multiple
+                <= order_book_entry.price * opposite_multiple
+            ):
+                order_book_entry.quantity = 0
+                return [], REJECT_WOULD_CROSS
+            queue.add_order(order_book_entry)
+            return [], None
+        stop_queue = self.stop_bid_queue if side == BUY else self.stop_ask_queue
+        stop_queue.add_order(
+            StopOrder(
+                order_book_entry.order_id,
+                order_type,
+                order_book_entry.quantity,
+                order_book_entry.price,
+                stop_price,
+            )
         )
+        return [], None
+
+    def _trigger_stop_orders(self) -> list:
+        """
+        Executes the stop orders triggered by the trades of the current input, oldest
+        first and under their own IDs, until their trades trigger no further stops
+        """
+        messages_for_external_feed = []
+        while self._traded_high_price is not None:
+            triggered = [
+                (stop_order, BUY)
+                for stop_order in self.stop_bid_queue.pop_triggered(
+                    self._traded_high_price
+                )
+            ]
+            triggered.extend(
+                (stop_order, SELL)
+                for stop_order in self.stop_ask_queue.pop_triggered(
+                    self._traded_low_price
+                )
+            )
+            self._traded_low_price = self._traded_high_price = None
+            triggered.sort()
+            for stop_order, side in triggered:
+                order_book_entry = OrderBookEntry(
+                    stop_order.order_id, stop_order.quantity, stop_order.price
+                )
+                order_type = MARKET if stop_order.order_type == STOP else LIMIT
+                if self.risk is not None:
+                    account = self.risk.get_account(stop_order.order_id)
+                    if account is not None:
+                        self._cancel_self_trades(
+                            side, order_type, order_book_entry, account
+                        )
+                if order_type == MARKET:
+                    trades_and_best = self._process_market_order(side, order_book_entry)
+                else:
+                    trades_and_best = self._process_limit_order(side, order_book_entry)
+                if trades_and_best:
+                    messages_for_external_feed.extend(
+                        self._convert_trades_and_best_to_messages(
+                            trades_and_best, CODE_TO_SIDE[side], stop_order.order_id
+                        )
+                    )
+                if self._has_queued_market_orders():
+                    messages_for_external_feed.extend(
+                        self._attempt_to_flush_market_order_queues()
+                    )
         return messages_for_external_feed
 
-    def cancel_order(self, order_id: int):
-        if order_id in self.bid_queue.order_id_to_order:
-            self.bid_queue.cancel_order(order_id)
-        elif order_id in self.ask_queue.order_id_to_order:
-            self.ask_queue.cancel_order(order_id)
-        elif order_id in self.market_bid_queue.order_id_to_order:
-            self.market_bid_queue.cancel_order(order_id)
-        elif order_id in self.market_ask_queue.order_id_to_order:
-            self.market_ask_queue.cancel_order(order_id)
-        else:
+    def get_order_quantity(self, order_id: int) -> int:
+        """
+        Quantity order_id has resting, queued as a market order or waiting as a stop, 0
+        once it is filled, cancelled or if it never entered the book
+        """
+        location = self.order_index.get(order_id)
+        if location == NO_ORDER:
+            return 0
+        return self.queues_by_location[location].get_order_quantity(order_id)
+
+    def cancel_order(self, order_id: int) -> bool:
+        """Cancels order_id, False if it was not in the book"""
+        metrics = self.metrics
+        if metrics is not None:
+            start_ns = metrics.start_operation()
+        location = self.order_index.get(order_id)
+        cancelled = location != NO_ORDER
+        if not cancelled:
             logger.info(f"Order ID not recognized: {order_id}")
+        else:
+            self.queues_by_location[location].cancel_order(order_id)
+            if self.risk is not None:
+                self.risk.remove_open_orders([order_id])
+            if self.book_update_callback is not None:
+                self._publish_book_update()
+            if self.journal is not None:
+                self.journal.record_cancel(order_id, self.sequence_number)
+        if metrics is not None:
+            metrics.record_cancel(start_ns)
+        return cancelled
+
+    def amend_order(
+        self, order_id: int, new_quantity: int, new_price: Optional[int] = None
+    ) -> list:
+        """
+        Cancel/replace of a resting limit order, keeping its ID. new_price None keeps
+        the price. Reducing quantity at the same price keeps time priority, increasing
+        it or changing price moves the order to the back of its level. A new price that
+        crosses the spread trades like an incoming limit order and rests any remainder.
+        Returns the messages for the external feed.
+        """
+        assert (
+            isinstance(new_quantity, int) and new_quantity > 0
+        ), f"Quantity must be int and positive, given type: {type(new_quantity)} with value: {new_quantity}"
+        assert new_price is None or (
+            isinstance(new_price, int) and new_price > 0
+        ), f"Price must be int and positive or None, given type: {type(new_price)} with value: {new_price}"
+        location = self.order_index.get(order_id)
+        if location == BID:
+            side, queue, opposite_queue = "buy", self.bid_queue, self.ask_queue
+        elif location == ASK:
+            side, queue, opposite_queue = "sell", self.ask_queue, self.bid_queue
+        else:
+            logger.info(f"Order ID not recognized as a resting limit order: {order_id}")
+            return []
+        if new_price is not None and not queue.is_valid_price(new_price):
+            logger.info(
+                f"Amend of order {order_id} rejected: invalid price {new_price}"
+            )
+            return []
+        trade_buffer_start = 0 if self.trade_buffer is None else len(self.trade_buffer)
+        risk = self.risk
+        if risk is not None:
+            reject_reason = risk.check_amend(
+                self, order_id, SIDE_TO_CODE[side], new_quantity, new_price
+            )
+            if reject_reason is not None:
+                logger.info(f"Amend of order {order_id} rejected: {reject_reason}")
+                return []
+            risk.set_open_quantity(order_id, new_quantity)
+        messages_for_external_feed = []
+        if new_price is None:
+            queue.amend_order(order_id, new_quantity, queue.get_order_price(order_id))
+        else:
+            opposite_best_price = opposite_queue.get_best_price()
+            opposite_multiple = opposite_queue.queue_price_multiple
+            if opposite_best_price is not None and (
+                opposite_best_price * opposite_multiple <= new_price * opposite_multiple
+            ):
+                order_book_entry = queue.pop_order(order_id)
+                order_book_entry.price = new_price
+                order_book_entry.quantity = new_quantity
+                account = None if risk is None else risk.get_account(order_id)
+                if account is not None:
+                    self._cancel_self_trades(
+                        SIDE_TO_CODE[side], LIMIT, order_book_entry, account
+                    )
+                trades_and_best = opposite_queue.execute_crossed_limit_order(
+                    order_book_entry
+                )
+                if order_book_entry.quantity > 0:
+                    queue.add_order(order_book_entry)
+                messages_for_external_feed = self._convert_trades_and_best_to_messages(
+                    trades_and_best, side, order_id
+                )
+            else:
+                queue.amend_order(order_id, new_quantity, new_price)
+        if self._has_queued_market_orders():
+            messages_for_external_feed.extend(
+                self._attempt_to_flush_market_order_queues()
+            )
+        if self._traded_high_price is not None:
+            messages_for_external_feed.extend(self._trigger_stop_orders())
+        if self.book_update_callback is not None:
+            self._publish_book_update()
+        if self.journal is not None:
+            self.journal.record_amend(
+                order_id,
+                new_quantity,
+                new_price,
+                self.sequence_number,
+                self._journaled_messages(
+                    messages_for_external_feed, trade_buffer_start
+                ),
+            )
+        return messages_for_external_feed
+
+    def _journaled_messages(self, messages: list, trade_buffer_start: int) -> list:
+        """
+        An input's messages as they are returned without a trade buffer, so journal
+        crcs do not depend on how the book reports fills
+        """
+        if self.trade_buffer is None:
+            return messages
+        return self.trade_buffer.messages(trade_buffer_start)
+
+    def cancel_orders(self, order_ids: Iterable[int]) -> List[int]:
+        """Cancels the given orders and returns the IDs that were recognized"""
+        return self._finish_bulk_cancel(self._remove_orders(order_ids))
+
+    def _remove_orders(self, order_ids: Iterable[int]) -> List[int]:
+        bid_order_ids = []
+        ask_order_ids = []
+        cancelled_order_ids = []
+        get_location = self.order_index.get
+        # The index is only cleared once the queues cancel, so a repeated ID would
+        # otherwise be unlinked twice
+        for order_id in dict.fromkeys(order_ids):
+            location = get_location(order_id)
+            if location == BID:
+                bid_order_ids.append(order_id)
+            elif location == ASK:
+                ask_order_ids.append(order_id)
+            elif location == NO_ORDER:
+                logger.info(f"Order ID not recognized: {order_id}")
+                continue
+            else:
+                self.queues_by_location[location].cancel_order(order_id)
+            cancelled_order_ids.append(order_id)
+        self.bid_queue.cancel_orders(bid_order_ids)
+        self.ask_queue.cancel_orders(ask_order_ids)
+        return cancelled_order_ids
+
+    def cancel_price_range(
+        self, side: Literal["buy", "sell"], low: int, high: int
+    ) -> List[int]:
+        """Cancels side's limit orders priced from low to high inclusive"""
+        if low > high:
+            # Queues differ on reversed bounds, so they only ever see low <= high
+            low, high = high, low
+        queue = self.bid_queue if side == "buy" else self.ask_queue
+        return self._finish_bulk_cancel(queue.cancel_price_range(low, high))
+
+    def cancel_side(self, side: Literal["buy", "sell"]) -> List[int]:
+        """Cancels every limit, queued market and stop order on side"""
+        if side == "buy":
+            queue, market_queue = self.bid_queue, self.market_bid_queue
+            stop_queue = self.stop_bid_queue
+        else:
+            queue, market_queue = self.ask_queue, self.market_ask_queue
+            stop_queue = self.stop_ask_queue
+        order_ids = queue.cancel_all()
+        order_ids.extend(_cancel_market_orders(market_queue))
+        order_ids.extend(stop_queue.cancel_all())
+        return self._finish_bulk_cancel(order_ids)
+
+    def cancel_all_orders(self) -> List[int]:
+        order_ids = self.bid_queue.cancel_all()
+        order_ids.extend(self.ask_queue.cancel_all())
+        order_ids.extend(_cancel_market_orders(self.market_bid_queue))
+        order_ids.extend(_cancel_market_orders(self.market_ask_queue))
+        order_ids.extend(self.stop_bid_queue.cancel_all())
+        order_ids.extend(self.stop_ask_queue.cancel_all())
+        return self._finish_bulk_cancel(order_ids)
+
+    def advance_time(self, time: int) -> List[int]:
+        """
+        Moves the book clock to time and removes every resting order whose expire_time
+        is at or before it, returning their IDs by expiry then arrival. Only the due
+        expiry buckets are visited, and the removals are published as one BookUpdate.
+        Orders added later with an expire_time at or before time are rejected.
+        """
+        assert (
+            time >= self.current_time
+        ), f"Time must not go backwards, given {time} at {self.current_time}"
+        self.current_time = time
+        get_location = self.order_index.get
+        # Orders filled or cancelled since they were registered are skipped here
+        order_ids = self._remove_orders(
+            [
+                order_id
+                for order_id in self.expiry_queue.pop_due(time)
+                if get_location(order_id) != NO_ORDER
+            ]
+        )
+        if self.journal is not None:
+            self.journal.record_advance_time(time, self.sequence_number, order_ids)
+        return self._finish_bulk_cancel(order_ids, record_cancels=False)
+
+    def _finish_bulk_cancel(
+        self, order_ids: List[int], record_cancels: bool = True
+    ) -> List[int]:
+        """Publishes one BookUpdate for a bulk cancel and returns the cancelled IDs"""
+        if self.book_update_callback is not None:
+            self._publish_book_update()
+        if self.risk is not None:
+            self.risk.remove_open_orders(order_ids)
+        if self.journal is not None and record_cancels:
+            for order_id in order_ids:
+                self.journal.record_cancel(order_id, self.sequence_number)
+        if self.metrics is not None:
+            self.metrics.cancels += len(order_ids)
+        return order_ids
+
+    def _publish_book_update(self):
+        """Sends the levels changed since the last update as a single BookUpdate"""
+        levels = []
+        for side, queue in (("bid", self.bid_queue), ("ask", self.ask_queue)):
+            if queue.changed_prices:
+                for price in sorted(queue.changed_prices):
+                    levels.append((side, price, queue.get_level_quantity(price)))
+                queue.changed_prices.clear()
+        if levels:
+            self.book_update_sequence_number += 1
+            self.book_update_callback(
+                BookUpdate(self.book_update_sequence_number, tuple(levels))
+            )
+
+    def depth(self, n: int) -> Dict[str, List[Tuple[int, int, int]]]:
+        """
+        Top n levels per side as (price, total quantity, order count), read from level
+        aggregates without visiting individual orders
+        """
+        return {"bid": self.bid_queue.depth(n), "ask": self.ask_queue.depth(n)}
+
+    def snapshot(self, path: str):
+        """
+        Writes resting orders and sequence numbers to path, format in snapshot.py. The
+        journal, if any, is committed first so the snapshot only covers durable records.
+        """
+        if self.journal is not None:
+            self.journal.commit()
+        write_snapshot(self, path)
+
+    @classmethod
+    def restore(cls, path: str, **kwargs) -> "OrderBook":
+        """Builds an OrderBook from a snapshot, kwargs are passed to the constructor"""
+        order_book = cls(**kwargs)
+        read_snapshot(path, order_book)
+        return order_book
@@ -0,0 +1,138 @@
+from typing import Iterator, List, Literal, Set
+
+from orderbook import OrderQueue
+
+
+class PriceLadderOrderQueue(OrderQueue):
+    """
+    OrderQueue for instruments with a known tick size and bounded price band.
+
+    Price levels are flagged in a preallocated ladder indexed by tick offset from
+    min_price and the best level is tracked by index, so creating or emptying a level is
+    O(c) instead of a sorted list insert or delete. When the best level empties the next
+    best is found by a byte scan of the ladder, which runs in C.
+    """
+
+    validates_prices = True
+
+    def __init__(
+        self,
+        queue_type: Literal["bid", "ask"],
+        min_price: int,
+        max_price: int,
+        tick_size: int = 1,
+    ):
+        assert (
+            isinstance(tick_size, int) and tick_size > 0
+        ), f"Tick size must be int and positive, given {tick_size}"
+        assert (
+            isinstance(min_price, int) and 0 < min_price <= max_price
+        ), f"Price band must be positive ints with min <= max, given {min_price}, {max_price}"
+        assert (
+            max_price - min_price
+        ) % tick_size == 0, f"Price band {min_price}-{max_price} is not a multiple of tick size {tick_size}"
+        self.min_price = min_price
+        self.max_price = max_price
+        self.tick_size = tick_size
+        self.ladder_size = (max_price - min_price) // tick_size + 1
+        super().__init__(queue_type)
+
+    def _reset_prices(self):
+        # One byte per tick, set while the level has resting orders
+        self.occupied = bytearray(self.ladder_size)
+        self.best_index = -1
+        self.best_price = None
+        self.level_count = 0
+
+    @property
+    def prices(self) -> List[int]:
+        return list(self.iter_prices())
+
+    def is_valid_price(self, price: int) -> bool:
+        return (
+            self.min_price <= price <= self.max_price
+            and (price - self.min_price) % self.tick_size == 0
+        )
+
+    def _price_to_index(self, price: int) -> int:
+        # Not an assert, a wrong index would corrupt the ladder under python -O
+        if not self.is_valid_price(price):
+            raise ValueError(
+                f"Price {price} is not on the ladder {self.min_price}-{self.max_price} with tick {self.tick_size}"
+            )
+        return (price - self.min_price) // self.tick_size
+
+    def _index_to_price(self, index: int) -> int:
+        return self.min_price + index * self.tick_size
+
+    def _add_price(self, price: int):
+        i = self._price_to_index(price)
+        self.occupied[i] = 1
+        self.level_count += 1
+        if self.metrics is not None:
+            self.metrics.levels_created += 1
+        if self.best_index < 0 or self.queue_price_multiple * (i - self.best_index) < 0:
+            self.best_index = i
+            self.best_price = price
+
+    def _append_price(self, price: int):
+        self._add_price(price)
+
+    def _remove_price(self, price: int):
+        i = self._price_to_index(price)
+        self.occupied[i] = 0
+        self.level_count -= 1
+        if self.metrics is not None:
+            self.metrics.levels_destroyed += 1
+        if i == self.best_index:
+            if self.queue_price_multiple > 0:
+                self.best_index = self.occupied.find(1, i + 1)
+            else:
+                self.best_index = self.occupied.rfind(1, 0, i)
+            self.best_price = (
+                None if self.best_index < 0 else self._index_to_price(self.best_index)
+            )
+
+    def _remove_price_range(self, low: int, high: int) -> List[int]:
+        # Clamp to the ladder, rounding low up and high down to a tick
+        i = max(0, -((self.min_price - low) // self.tick_size))
+        j = min(self.ladder_size - 1, (high - self.min_price) // self.tick_size)
+        if i > j:
+            return []
+        prices = []
+        k = self.occupied.find(1, i, j + 1)
+        while k >= 0:
+            prices.append(self._index_to_price(k))
+            k = self.occupied.find(1, k + 1, j + 1)
+        self.occupied[i : j + 1] = bytes(j + 1 - i)
+        self.level_count -= len(prices)
+        if i <= self.best_index <= j:
+            # Every level on the better side of the range was already empty
+            if self.queue_price_multiple > 0:
+                self.best_index = self.occupied.find(1, j + 1)
+            else:
+                self.best_index = self.occupied.rfind(1, 0, i)
+            self.best_price = (
+                None if self.best_index < 0 else self._index_to_price(self.best_index)
+            )
+        if self.metrics is not None:
+            self.metrics.levels_destroyed += len(prices)
+        if self.queue_price_multiple < 0:
+            prices.reverse()
+        return prices
+
+    def _remove_prices(self, prices: Set[int]):
+        for price in prices:
+            self._remove_price(price)
+
+    def iter_prices(self) -> Iterator[int]:
+        i = self.best_index
+        while i >= 0:
+            yield self._index_to_price(i)
+            if self.queue_price_multiple > 0:
+                i = self.occupied.find(1, i + 1)
+            else:
+                i = self.occupied.rfind(1, 0, i)
+
+    def get_best_price(self) -> int:
+        return self.best_price
@@ -0,0 +1,311 @@
+"""
+Streaming replay of recorded order flow into an OrderBook.
+
+Events are read from memory mapped files a chunk at a time, so memory use does not
+depend on file size. Two input formats are supported:
+- CSV with columns event,side,order_type,quantity,price,order_id and an optional
+  stop_price (an optional header row starting with "event" is skipped). event is add,
+  cancel or amend, order_type any of order.py's types, market orders and amends keeping
+  their price leave price empty, and adds leave order_id empty.
+- binary: magic b"OBEV", a uint32 version, then fixed-width little-endian EVENT
+  records of kind, side, order type, quantity, price (0 for none), order ID and stop
+  price (0 for none). Version 1 files, without the stop price, are still read.
+Fills are collected in a TradeBuffer and handed to a sink once per batch of events.
+"""
+
+import argparse
+import logging
+import mmap
+import random
+import struct
+import time
+from typing import Callable, Dict, Iterable, Iterator, NamedTuple, Optional
+
+from order import (
+    CODE_TO_ORDER_TYPE,
+    CODE_TO_SIDE,
+    ORDER_TYPE_TO_CODE,
+    SIDE_TO_CODE,
+    Order,
+)
+from orderbook import OrderBook
+from trade_buffer import COLUMN_TYPECODES, TradeBuffer
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"OBEV"
+VERSION = 2
+FILE_HEADER = struct.Struct("<4sI")
+EVENT = struct.Struct("<bbbqqqq")
+VERSION_1_EVENT = struct.Struct("<bbbqqq")
+
+ADD = 0
+CANCEL = 1
+AMEND = 2
+EVENT_NAME_TO_KIND = {b"add": ADD, b"cancel": CANCEL, b"amend": AMEND}
+SIDE_NAMES = {b"buy": "buy", b"sell": "sell", b"": None}
+ORDER_TYPE_NAMES = {
+    order_type.encode(): order_type for order_type in ORDER_TYPE_TO_CODE
+}
+ORDER_TYPE_NAMES[b""] = None
+
+CSV_CHUNK_BYTES = 1 << 20
+BINARY_CHUNK_EVENTS = 1 << 16
+
+
+class Event(NamedTuple):
+    kind: int
+    side: Optional[str]
+    order_type: Optional[str]
+    quantity: int
+    price: Optional[int]
+    order_id: int
+    stop_price: Optional[int] = None
+
+
+def _parse_csv_line(line: bytes) -> Optional[Event]:
+    fields = line.rstrip(b"\r").split(b",")
+    if fields == [b""] or fields[0] == b"event":
+        return None
+    try:
+        event, side, order_type, quantity, price, order_id, *stop_price = fields
+        if len(stop_price) > 1:
+            raise ValueError(f"Too many fields: {len(fields)}")
+        return Event(
+            EVENT_NAME_TO_KIND[event],
+            SIDE_NAMES[side],
+            ORDER_TYPE_NAMES[order_type],
+            int(quantity) if quantity else 0,
+            int(price) if price else None,
+            int(order_id) if order_id else 0,
+            int(stop_price[0]) if stop_price and stop_price[0] else None,
+        )
+    except (KeyError, ValueError):
+        logger.info(f"Event not recognized: {line}")
+        return None
+
+
+def iter_csv_events(path: str, chunk_bytes: int = CSV_CHUNK_BYTES) -> Iterator[Event]:
+    """Events of a CSV file, parsed chunk_bytes at a time cut at line ends"""
+    with open(path, "rb") as f:
+        if f.seek(0, 2) == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            size = len(mapped)
+            start = 0
+            while start < size:
+                end = min(start + chunk_bytes, size)
+                if end < size:
+                    line_end = mapped.rfind(b"\n", start, end)
+                    if line_end < 0:
+                        # A line longer than the chunk, read up to its end
+                        line_end = mapped.find(b"\n", end)
+                    end = size if line_end < 0 else line_end + 1
+                for line in mapped[start:end].split(b"\n"):
+                    event = _parse_csv_line(line)
+                    if event is not None:
+                        yield event
+                start = end
+
+
+def iter_binary_events(
+    path: str, chunk_events: int = BINARY_CHUNK_EVENTS
+) -> Iterator[Event]:
+    """Events of a binary event file, unpacked chunk_events at a time"""
+    with open(path, "rb") as f, mmap.mmap(
+        f.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mapped:
+        view = memoryview(mapped)
+        try:
+            magic, version = FILE_HEADER.unpack_from(view, 0)
+            assert magic == MAGIC, f"Not an order event file: {path}"
+            assert version in (1, VERSION), f"Unsupported event file version {version}"
+            event = EVENT if version == VERSION else VERSION_1_EVENT
+            assert (
+                len(view) - FILE_HEADER.size
+            ) % event.size == 0, f"Event file {path} ends with a partial event"
+            chunk_size = chunk_events * event.size
+            for start in range(FILE_HEADER.size, len(view), chunk_size):
+                chunk = view[start : start + chunk_size]
+                for (
+                    kind,
+                    side,
+                    order_type,
+                    quantity,
+                    price,
+                    order_id,
+                    *stop_price,
+                ) in event.iter_unpack(chunk):
+                    if kind == ADD:
+                        yield Event(
+                            kind,
+                            CODE_TO_SIDE[side],
+                            CODE_TO_ORDER_TYPE[order_type],
+                            quantity,
+                            price or None,
+                            order_id,
+                            stop_price[0] or None if stop_price else None,
+                        )
+                    else:
+                        yield Event(kind, None, None, quantity, price or None, order_id)
+                chunk.release()
+        finally:
+            view.release()
+
+
+def iter_events(path: str) -> Iterator[Event]:
+    """Events of a CSV (.csv) or binary file"""
+    if path.endswith(".csv"):
+        return iter_csv_events(path)
+    return iter_binary_events(path)
+
+
+def write_binary_events(events: Iterable[Event], path: str) -> int:
+    """Writes events to a binary event file and returns how many were written"""
+    count = 0
+    with open(path, "wb") as f:
+        f.write(FILE_HEADER.pack(MAGIC, VERSION))
+        chunk = bytearray()
+        for kind, side, order_type, quantity, price, order_id, stop_price in events:
+            chunk += EVENT.pack(
+                kind,
+                SIDE_TO_CODE.get(side, 0),
+                ORDER_TYPE_TO_CODE.get(order_type, 0),
+                quantity,
+                price or 0,
+                order_id,
+                stop_price or 0,
+            )
+            count += 1
+            if len(chunk) >= CSV_CHUNK_BYTES:
+                f.write(chunk)
+                chunk.clear()
+        f.write(chunk)
+    return count
+
+
+def iter_generated_events(n: int, cancel_ratio: float = 0.2) -> Iterator[Event]:
+    """Demo style random flow with cancels of earlier orders, generated lazily"""
+    order_id = 0
+    for _ in range(n):
+        if order_id and random.random() < cancel_ratio:
+            yield Event(CANCEL, None, None, 0, None, random.randint(1, order_id))
+            continue
+        order_id += 1
+        side = random.choice(["buy", "sell"])
+        order_type = random.choice(["limit", "market"])
+        price = None
+        if order_type == "limit":
+            delta = random.randrange(-3, 30)
+            price = 99 - delta if side == "buy" else 101 + delta
+        yield Event(ADD, side, order_type, random.randint(1, 99), price, 0)
+
+
+class CsvTradeSink:
+    """Writes each batch of fills as CSV rows of the TradeBuffer columns"""
+
+    def __init__(self, path: str):
+        self.file = open(path, "w")
+        self.file.write(",".join(COLUMN_TYPECODES) + "\n")
+
+    def __call__(self, columns: Dict[str, memoryview]):
+        rows = zip(*(column.tolist() for column in columns.values()))
+        self.file.writelines(",".join(map(str, row)) + "\n" for row in rows)
+
+    def close(self):
+        self.file.close()
+
+
+class ReplayStats(NamedTuple):
+    events: int
+    trades: int
+    seconds: float
+
+
+def replay_events(
+    events: Iterable[Event],
+    order_book: OrderBook,
+    sink: Optional[Callable[[Dict[str, memoryview]], None]] = None,
+    batch_size: int = 4096,
+) -> ReplayStats:
+    """
+    Applies events to order_book, which must have a trade_buffer. The buffered fills
+    are passed to sink as TradeBuffer.columns() every batch_size events and then
+    cleared, so the buffer stays the size of one batch's fills. Files must hold valid
+    orders as they are not checked again.
+    """
+    trade_buffer = order_book.trade_buffer
+    assert trade_buffer is not None, "Replay needs an OrderBook with a trade_buffer"
+    add_order = order_book.add_order
+    cancel_order = order_book.cancel_order
+    amend_order = order_book.amend_order
+    trades = 0
+    count = 0
+    start_time = time.perf_counter()
+    for count, (
+        kind,
+        side,
+        order_type,
+        quantity,
+        price,
+        order_id,
+        stop_price,
+    ) in enumerate(events, start=1):
+        if kind == ADD:
+            add_order(Order(side, order_type, quantity, price, stop_price))
+        elif kind == CANCEL:
+            cancel_order(order_id)
+        else:
+            amend_order(order_id, quantity, price)
+        if count % batch_size == 0 and len(trade_buffer):
+            trades += _flush_trades(trade_buffer, sink)
+    trades += _flush_trades(trade_buffer, sink)
+    return ReplayStats(count, trades, time.perf_counter() - start_time)
+
+
+def _flush_trades(trade_buffer: TradeBuffer, sink) -> int:
+    trades = len(trade_buffer)
+    if trades and sink is not None:
+        columns = trade_buffer.columns()
+        sink(columns)
+        for column in columns.values():
+            column.release()
+    trade_buffer.clear()
+    return trades
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded order flow")
+    parser.add_argument("events", help="CSV (.csv) or binary event file")
+    parser.add_argument("--output", help="CSV file to write fills to")
+    parser.add_argument(
+        "--generate",
+        type=int,
+        help="Write this many random events to the events file (binary) instead",
+    )
+    parser.add_argument("--seed", type=int, default=404)
+    args = parser.parse_args()
+
+    if args.generate:
+        random.seed(args.seed)
+        count = write_binary_events(iter_generated_events(args.generate), args.events)
+        print(f"Wrote {count} events to {args.events}")
+        return
+
+    sink = None if args.output is None else CsvTradeSink(args.output)
+    try:
+        stats = replay_events(
+            iter_events(args.events), OrderBook(trade_buffer=TradeBuffer()), sink
+        )
+    finally:
+        if sink is not None:
+            sink.close()
+    print(
+        f"Replayed {stats.events} events with {stats.trades} fills in "
+        f"{stats.seconds: .3f} seconds, "
+        f"{stats.events / stats.seconds: .0f} events/second"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+Pre-trade risk checks for an OrderBook, see OrderBook(risk=...).
+
+Orders may carry an account. Every order is checked against the order size limit and
+the price band, orders with an account also against their account's open quantity.
+Open quantity is kept per order and per account side, updated on add, fill, amend and
+cancel, so each check is constant time. When self trade prevention is on, an order's
+account's resting orders that it would trade with are cancelled before it matches
+(cancel resting), leaving the order to trade with other accounts' liquidity.
+"""
+
+import itertools
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from order import BUY, FOK, IOC, LIMIT, POST_ONLY
+
+# Reasons an order was rejected by the risk checks, see ExecutionReport
+REJECT_ORDER_QUANTITY = "max_order_quantity"
+REJECT_OPEN_QUANTITY = "max_open_quantity"
+REJECT_PRICE_BAND = "price_band"
+
+# Order types whose price is checked against the band, stop limit prices are only
+# used once the market has moved
+BANDED_ORDER_TYPES = {LIMIT, IOC, FOK, POST_ONLY}
+
+
+class RiskLimits(NamedTuple):
+    # None disables the check
+    max_order_quantity: Optional[int] = None
+    # Per account, resting limit, queued market and stop orders across both sides
+    max_open_quantity: Optional[int] = None
+    # How far a buy may be priced above the best ask, or a sell below the best bid
+    price_band: Optional[int] = None
+    self_trade_prevention: bool = True
+
+
+class RiskManager:
+    def __init__(self, limits: RiskLimits = RiskLimits()):
+        self.limits = limits
+        # Order ID -> [account, side, open quantity] of every open order with an account
+        self.open_orders: Dict[int, list] = dict()
+        # Account -> [buy, sell] open quantity
+        self.open_quantities: Dict[int, List[int]] = dict()
+
+    def check_order(
+        self,
+        order_book,
+        side: int,
+        order_type: int,
+        quantity: int,
+        price: Optional[int],
+        account: Optional[int],
+    ) -> Optional[str]:
+        """Reject reason for a new order, None if it passes"""
+        limits = self.limits
+        if limits.max_order_quantity is not None and (
+            quantity > limits.max_order_quantity
+        ):
+            return REJECT_ORDER_QUANTITY
+        if (
+            account is not None
+            and limits.max_open_quantity is not None
+            and sum(self.open_quantities.get(account, (0, 0))) + quantity
+            > limits.max_open_quantity
+        ):
+            return REJECT_OPEN_QUANTITY
+        if order_type in BANDED_ORDER_TYPES and not self._in_band(
+            order_book, side, price
+        ):
+            return REJECT_PRICE_BAND
+        return None
+
+    def check_amend(
+        self,
+        order_book,
+        order_id: int,
+        side: int,
+        new_quantity: int,
+        new_price: Optional[int],
+    ) -> Optional[str]:
+        """Reject reason for amending a resting limit order, None if it passes"""
+        limits = self.limits
+        if limits.max_order_quantity is not None and (
+            new_quantity > limits.max_order_quantity
+        ):
+            return REJECT_ORDER_QUANTITY
+        open_order = self.open_orders.get(order_id)
+        if (
+            open_order is not None
+            and limits.max_open_quantity is not None
+            and sum(self.open_quantities[open_order[0]]) + new_quantity - open_order[2]
+            > limits.max_open_quantity
+        ):
+            return REJECT_OPEN_QUANTITY
+        if new_price is not None and not self._in_band(order_book, side, new_price):
+            return REJECT_PRICE_BAND
+        return None
+
+    def _in_band(self, order_book, side: int, price: int) -> bool:
+        price_band = self.limits.price_band
+        if price_band is None:
+            return True
+        if side == BUY:
+            best_ask = order_book.ask_queue.get_best_price()
+            return best_ask is None or price <= best_ask + price_band
+        best_bid = order_book.bid_queue.get_best_price()
+        return best_bid is None or price >= best_bid - price_band
+
+    def get_account(self, order_id: int) -> Optional[int]:
+        open_order = self.open_orders.get(order_id)
+        return None if open_order is None else open_order[0]
+
+    def has_open_quantity(self, account: int, side: int) -> bool:
+        open_quantities = self.open_quantities.get(account)
+        return open_quantities is not None and open_quantities[side] > 0
+
+    def add_open_order(self, order_id: int, account: int, side: int, quantity: int):
+        self.open_orders[order_id] = [account, side, quantity]
+        open_quantities = self.open_quantities.get(account)
+        if open_quantities is None:
+            open_quantities = self.open_quantities[account] = [0, 0]
+        open_quantities[side] += quantity
+
+    def set_open_quantity(self, order_id: int, quantity: int):
+        """Updates an amended order's open quantity"""
+        open_order = self.open_orders.get(order_id)
+        if open_order is not None:
+            account, side, open_quantity = open_order
+            self.open_quantities[account][side] += quantity - open_quantity
+            open_order[2] = quantity
+
+    def _reduce_open_quantity(self, order_id: int, quantity: int):
+        open_order = self.open_orders.get(order_id)
+        if open_order is not None:
+            account, side, open_quantity = open_order
+            self.open_quantities[account][side] -= quantity
+            if open_quantity == quantity:
+                del self.open_orders[order_id]
+            else:
+                open_order[2] = open_quantity - quantity
+
+    def record_fills(self, trades_and_best: list, taker_order_id):
+        """taker_order_id is the aggressor's ID or a list of the taker of each fill"""
+        if not self.open_orders:
+            return
+        if isinstance(taker_order_id, list):
+            taker_order_ids = taker_order_id
+        else:
+            taker_order_ids = itertools.repeat(taker_order_id)
+        reduce_open_quantity = self._reduce_open_quantity
+        for (_, quantity, maker_order_id, _), order_id in zip(
+            trades_and_best, taker_order_ids
+        ):
+            reduce_open_quantity(maker_order_id, quantity)
+            reduce_open_quantity(order_id, quantity)
+
+    def remove_open_orders(self, order_ids: Iterable[int]):
+        """Releases the open quantity of cancelled orders"""
+        open_orders = self.open_orders
+        for order_id in order_ids:
+            open_order = open_orders.pop(order_id, None)
+            if open_order is not None:
+                account, side, open_quantity = open_order
+                self.open_quantities[account][side] -= open_quantity
+
+    def find_self_trades(
+        self, orders: Iterator[Tuple[int, int]], quantity: int, account: int
+    ) -> Tuple[List[int], int]:
+        """
+        IDs of account's orders an order for quantity would trade with, given the
+        (order ID, quantity) of the orders it would reach in matching order, and the
+        quantity left unfilled. Other accounts' orders fill it as it goes, account's
+        own are skipped.
+        """
+        self_trade_order_ids = []
+        open_orders = self.open_orders
+        for order_id, order_quantity in orders:
+            open_order = open_orders.get(order_id)
+            if open_order is not None and open_order[0] == account:
+                self_trade_order_ids.append(order_id)
+                continue
+            quantity -= order_quantity
+            if quantity <= 0:
+                break
+        return self_trade_order_ids, max(quantity, 0)
+
+    def iter_open_orders(self) -> Iterator[Tuple[int, int, int, int]]:
+        """(order ID, account, side, open quantity) of open orders with an account"""
+        for order_id, (account, side, quantity) in self.open_orders.items():
+            yield order_id, account, side, quantity
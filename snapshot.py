@@ -0,0 +1,204 @@
+"""
+Binary snapshot of an OrderBook's resting state.
+
+Layout, all fields little-endian int64 unless noted:
+- header: magic b"OBSN", version (uint32), sequence_number, book_update_sequence_number,
+  the number of journal records the snapshot covers (0 without a journal), the book's
+  current_time and the number of records in each of the eight sections
+- sections of fixed-width (order_id, quantity, price) records, in this order: bids and
+  asks (best price first, time priority within a price) then queued market bids and
+  market asks (time priority, price 0)
+- sections of fixed-width (order_id, order_type, quantity, price, stop_price) records
+  for buy and sell stop orders (by stop price then time, price 0 for stop orders)
+- a section of (order_id, expire_time) records for resting good-till-time orders, by
+  expiry then time
+- a section of (order_id, account, side, open quantity) records for the open orders
+  with an account, written when the book has a RiskManager
+
+Order records start at HEADER.size and are 8 byte aligned, so a memory mapped snapshot
+can be read in place, e.g. memoryview(mapped)[HEADER.size:].cast("q").
+"""
+
+import mmap
+import struct
+import sys
+from array import array
+from typing import Iterator, NamedTuple
+
+from doubly_linked_list import OrderBookEntry
+from order_index import NO_ORDER
+from stop_orders import StopOrder
+
+MAGIC = b"OBSN"
+VERSION = 5
+HEADER = struct.Struct("<4sIqqqqqqqqqqqq")
+ORDER_RECORD = struct.Struct("<qqq")
+STOP_ORDER_RECORD = struct.Struct("<qqqqq")
+EXPIRY_RECORD = struct.Struct("<qq")
+ACCOUNT_RECORD = struct.Struct("<qqqq")
+# Market orders have no price, prices must be positive so 0 is free to mark that
+NO_PRICE = 0
+
+
+class SnapshotHeader(NamedTuple):
+    sequence_number: int
+    book_update_sequence_number: int
+    journal_records: int
+    current_time: int
+    bid_orders: int
+    ask_orders: int
+    market_bid_orders: int
+    market_ask_orders: int
+    stop_bid_orders: int
+    stop_ask_orders: int
+    expiring_orders: int
+    account_orders: int
+
+
+def _extend_with_queue(records: array, queue) -> int:
+    start = len(records)
+    for price in queue.iter_prices():
+        for order_id, quantity in queue.iter_level_orders(price):
+            records.extend((order_id, quantity, price))
+    return (len(records) - start) // 3
+
+
+def _extend_with_market_queue(records: array, market_queue) -> int:
+    start = len(records)
+    for order_id, quantity in market_queue.iter_orders():
+        records.extend((order_id, quantity, NO_PRICE))
+    return (len(records) - start) // 3
+
+
+def _extend_with_stop_queue(records: array, stop_queue) -> int:
+    start = len(records)
+    for order_id, order_type, quantity, price, stop_price in stop_queue.iter_orders():
+        records.extend((order_id, order_type, quantity, price or NO_PRICE, stop_price))
+    return (len(records) - start) // 5
+
+
+def _extend_with_expiry_queue(records: array, order_book) -> int:
+    get_location = order_book.order_index.get
+    # Filled and cancelled orders are still in the queue until their time comes
+    expiring_orders = sorted(
+        (expire_time, order_id)
+        for order_id, expire_time in order_book.expiry_queue.iter_orders()
+        if get_location(order_id) != NO_ORDER
+    )
+    for expire_time, order_id in expiring_orders:
+        records.extend((order_id, expire_time))
+    return len(expiring_orders)
+
+
+def _extend_with_risk(records: array, risk) -> int:
+    if risk is None:
+        return 0
+    start = len(records)
+    for open_order in risk.iter_open_orders():
+        records.extend(open_order)
+    return (len(records) - start) // 4
+
+
+def write_snapshot(order_book, path: str):
+    records = array("q")
+    counts = [
+        _extend_with_queue(records, order_book.bid_queue),
+        _extend_with_queue(records, order_book.ask_queue),
+        _extend_with_market_queue(records, order_book.market_bid_queue),
+        _extend_with_market_queue(records, order_book.market_ask_queue),
+        _extend_with_stop_queue(records, order_book.stop_bid_queue),
+        _extend_with_stop_queue(records, order_book.stop_ask_queue),
+        _extend_with_expiry_queue(records, order_book),
+        _extend_with_risk(records, order_book.risk),
+    ]
+    if sys.byteorder == "big":
+        records.byteswap()
+    with open(path, "wb") as f:
+        f.write(
+            HEADER.pack(
+                MAGIC,
+                VERSION,
+                order_book.sequence_number,
+                order_book.book_update_sequence_number,
+                0 if order_book.journal is None else order_book.journal.records,
+                order_book.current_time,
+                *counts,
+            )
+        )
+        records.tofile(f)
+
+
+def _iter_entries(view: memoryview, start: int, count: int) -> Iterator[OrderBookEntry]:
+    section = view[start : start + count * ORDER_RECORD.size]
+    for order_id, quantity, price in ORDER_RECORD.iter_unpack(section):
+        yield OrderBookEntry(order_id, quantity, None if price == NO_PRICE else price)
+    section.release()
+
+
+def read_snapshot(path: str, order_book) -> SnapshotHeader:
+    """Loads the snapshot at path into an empty order_book and returns its header"""
+    with open(path, "rb") as f, mmap.mmap(
+        f.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mapped:
+        view = memoryview(mapped)
+        try:
+            magic, version, *fields = HEADER.unpack_from(view, 0)
+            assert magic == MAGIC, f"Not an order book snapshot: {path}"
+            assert version == VERSION, f"Unsupported snapshot version {version}"
+            header = SnapshotHeader(*fields)
+            order_book.sequence_number = header.sequence_number
+            order_book.book_update_sequence_number = header.book_update_sequence_number
+            order_book.current_time = header.current_time
+            offset = HEADER.size
+            for queue, count in [
+                (order_book.bid_queue, header.bid_orders),
+                (order_book.ask_queue, header.ask_orders),
+            ]:
+                queue.restore_orders(_iter_entries(view, offset, count))
+                offset += count * ORDER_RECORD.size
+            for market_queue, count in [
+                (order_book.market_bid_queue, header.market_bid_orders),
+                (order_book.market_ask_queue, header.market_ask_orders),
+            ]:
+                for entry in _iter_entries(view, offset, count):
+                    market_queue.add_order(entry)
+                offset += count * ORDER_RECORD.size
+            for stop_queue, count in [
+                (order_book.stop_bid_queue, header.stop_bid_orders),
+                (order_book.stop_ask_queue, header.stop_ask_orders),
+            ]:
+                section = view[offset : offset + count * STOP_ORDER_RECORD.size]
+                for (
+                    order_id,
+                    order_type,
+                    quantity,
+                    price,
+                    stop_price,
+                ) in STOP_ORDER_RECORD.iter_unpack(section):
+                    stop_queue.add_order(
+                        StopOrder(
+                            order_id,
+                            order_type,
+                            quantity,
+                            None if price == NO_PRICE else price,
+                            stop_price,
+                        )
+                    )
+                section.release()
+                offset += count * STOP_ORDER_RECORD.size
+            size = header.expiring_orders * EXPIRY_RECORD.size
+            section = view[offset : offset + size]
+            for order_id, expire_time in EXPIRY_RECORD.iter_unpack(section):
+                order_book.expiry_queue.add(order_id, expire_time)
+            section.release()
+            offset += size
+            # Accounts only matter to a RiskManager, skipped by books without one
+            if order_book.risk is not None:
+                size = header.account_orders * ACCOUNT_RECORD.size
+                section = view[offset : offset + size]
+                for open_order in ACCOUNT_RECORD.iter_unpack(section):
+                    order_book.risk.add_open_order(*open_order)
+                section.release()
+        finally:
+            view.release()
+    return header
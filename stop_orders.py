@@ -0,0 +1,98 @@
+import bisect
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+from order import BUY
+from order_index import NO_ORDER, OrderIndex
+
+
+class StopOrder(NamedTuple):
+    order_id: int
+    # STOP or STOP_LIMIT code from order.py
+    order_type: int
+    quantity: int
+    # Limit price once triggered, None for stop (market) orders
+    price: Optional[int]
+    stop_price: int
+
+
+class StopOrderQueue:
+    """
+    Stop orders of one side waiting for their trigger, keyed by stop price.
+
+    Distinct stop prices are kept in a sorted list with the orders of each price in
+    arrival order, so the orders a trade price triggers are found by bisect without a
+    scan: buy stops trigger on trades at or above their stop price, a prefix of the
+    list, and sell stops on trades at or below it, a suffix.
+    """
+
+    def __init__(self, side: int):
+        self.side = side
+        self.stop_prices: List[int] = []
+        self.price_to_orders: Dict[int, Dict[int, StopOrder]] = dict()
+        self.order_id_to_stop_price: Dict[int, int] = dict()
+        # Set by OrderBook, which keeps the location of every resting order
+        self.order_index: Optional[OrderIndex] = None
+        self.order_location = NO_ORDER
+
+    def __len__(self) -> int:
+        return len(self.order_id_to_stop_price)
+
+    def add_order(self, order: StopOrder):
+        orders = self.price_to_orders.get(order.stop_price)
+        if orders is None:
+            bisect.insort(self.stop_prices, order.stop_price)
+            orders = self.price_to_orders[order.stop_price] = dict()
+        orders[order.order_id] = order
+        self.order_id_to_stop_price[order.order_id] = order.stop_price
+        if self.order_index is not None:
+            self.order_index.set(order.order_id, self.order_location)
+
+    def cancel_order(self, order_id: int):
+        stop_price = self.order_id_to_stop_price.pop(order_id)
+        orders = self.price_to_orders[stop_price]
+        del orders[order_id]
+        if not orders:
+            del self.price_to_orders[stop_price]
+            del self.stop_prices[bisect.bisect_left(self.stop_prices, stop_price)]
+        if self.order_index is not None:
+            self.order_index.clear(order_id)
+
+    def get_order_quantity(self, order_id: int) -> int:
+        stop_price = self.order_id_to_stop_price[order_id]
+        return self.price_to_orders[stop_price][order_id].quantity
+
+    def cancel_all(self) -> List[int]:
+        """Removes every order, returning their IDs by stop price then arrival"""
+        order_ids = [order.order_id for order in self.iter_orders()]
+        if self.order_index is not None:
+            for order_id in order_ids:
+                self.order_index.clear(order_id)
+        self.stop_prices.clear()
+        self.price_to_orders.clear()
+        self.order_id_to_stop_price.clear()
+        return order_ids
+
+    def pop_triggered(self, trade_price: int) -> List[StopOrder]:
+        """Removes and returns the orders a trade at trade_price triggers"""
+        if self.side == BUY:
+            end = bisect.bisect_right(self.stop_prices, trade_price)
+            triggered_prices = self.stop_prices[:end]
+            del self.stop_prices[:end]
+        else:
+            start = bisect.bisect_left(self.stop_prices, trade_price)
+            triggered_prices = self.stop_prices[start:]
+            del self.stop_prices[start:]
+        triggered = []
+        for stop_price in triggered_prices:
+            orders = self.price_to_orders.pop(stop_price)
+            for order_id in orders:
+                del self.order_id_to_stop_price[order_id]
+                if self.order_index is not None:
+                    self.order_index.clear(order_id)
+            triggered.extend(orders.values())
+        return triggered
+
+    def iter_orders(self) -> Iterator[StopOrder]:
+        """Orders by stop price, in arrival order within a price"""
+        for stop_price in self.stop_prices:
+            yield from self.price_to_orders[stop_price].values()
@@ -0,0 +1,85 @@
+import random
+
+import pytest
+
+from book_manager import OrderBookManager, SharedMemoryRingBuffer
+from demo import generate_orders
+from order import create_order
+from orderbook import OrderBook
+from trade_buffer import TradeBuffer
+
+
+def test_ring_buffer_is_fifo_and_bounded():
+    ring = SharedMemoryRingBuffer(capacity=2)
+    try:
+        assert ring.try_put(0, 1, 0, 0, 10, 100, 0, 0, 0, 0)
+        assert ring.try_put(0, 2, 1, 1, 5, 0, 0, 0, 30, 4)
+        assert not ring.try_put(0, 3, 0, 0, 1, 1, 0, 0, 0, 0)
+
+        assert ring.get_batch(1) == [(0, 1, 0, 0, 10, 100, 0, 0, 0, 0)]
+        assert ring.try_put(1, 3, 0, 0, 0, 0, 7, 0, 0, 0)
+        assert ring.get_batch(10) == [
+            (0, 2, 1, 1, 5, 0, 0, 0, 30, 4),
+            (1, 3, 0, 0, 0, 0, 7, 0, 0, 0),
+        ]
+        assert ring.get_batch(10) == []
+    finally:
+        ring.close()
+        ring.unlink()
+
+
+def test_manager_matches_single_process_books():
+    random.seed(3)
+    symbols = ["AAA", "BBB", "CCC"]
+    order_books = {symbol: OrderBook(trade_buffer=TradeBuffer()) for symbol in symbols}
+    fills = {symbol: [] for symbol in symbols}
+    # Small rings so both directions fill up and wait on each other
+    with OrderBookManager(
+        symbols,
+        workers=2,
+        ring_capacity=64,
+        fill_callback=lambda symbol, row: fills[symbol].append(row),
+    ) as manager:
+        for order in generate_orders(3_000):
+            symbol = random.choice(symbols)
+            order_id = manager.add_order(symbol, order)
+            order_books[symbol].add_order(order)
+            assert order_id == order_books[symbol].sequence_number
+            if random.random() < 0.1:
+                manager.cancel_order(symbol, order_id - 1)
+                order_books[symbol].cancel_order(order_id - 1)
+        stats = manager.sync()
+
+    for symbol in symbols:
+        expected_fills = order_books[symbol].trade_buffer.rows()
+        assert len(expected_fills) > 100
+        assert fills[symbol] == expected_fills
+        assert stats[symbol]["trades"] == len(expected_fills)
+        assert stats[symbol]["sequence_number"] == order_books[symbol].sequence_number
+        assert stats[symbol]["best_bid"] == (
+            order_books[symbol].bid_queue.get_best_price()
+        )
+        assert stats[symbol]["best_ask"] == (
+            order_books[symbol].ask_queue.get_best_price()
+        )
+
+
+def test_manager_expires_orders_on_advance_time():
+    symbols = ["AAA", "BBB"]
+    with OrderBookManager(symbols, workers=2, ring_capacity=16) as manager:
+        manager.add_order("AAA", create_order("buy", "limit", 10, 99, expire_time=5))
+        manager.add_order("AAA", create_order("buy", "limit", 10, 98, account=7))
+        manager.add_order("BBB", create_order("sell", "limit", 10, 101, expire_time=9))
+        manager.advance_time(5)
+        stats = manager.sync()
+        assert stats["AAA"]["best_bid"] == 98
+        assert stats["BBB"]["best_ask"] == 101
+        manager.advance_time(9)
+        # Arriving already expired, the order is rejected but still uses an ID
+        order = create_order("sell", "limit", 1, 102, expire_time=9)
+        assert manager.add_order("BBB", order) == 2
+        stats = manager.sync()
+        assert stats["BBB"]["best_ask"] is None
+        assert stats["BBB"]["sequence_number"] == 2
+        with pytest.raises(AssertionError, match="Time must not go backwards"):
+            manager.advance_time(8)
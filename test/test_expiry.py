@@ -0,0 +1,13 @@
+from expiry import ExpiryQueue
+
+
+def test_pop_due_returns_ids_by_expiry_then_arrival():
+    queue = ExpiryQueue()
+    for order_id, expire_time in [(1, 30), (2, 10), (3, 20), (4, 10), (5, 40)]:
+        queue.add(order_id, expire_time)
+    assert len(queue) == 4
+    assert queue.pop_due(5) == []
+    assert queue.pop_due(20) == [2, 4, 3]
+    assert sorted(queue.iter_orders()) == [(1, 30), (5, 40)]
+    assert queue.pop_due(100) == [1, 5]
+    assert len(queue) == 0
@@ -0,0 +1,255 @@
+import asyncio
+
+from gateway import FRAME_HEADER, OrderGateway, encode_frame, read_frame, run_load
+
+
+async def _connect(port: int):
+    return await asyncio.open_connection("127.0.0.1", port)
+
+
+async def _request(reader, writer, message: dict) -> dict:
+    writer.write(encode_frame(message))
+    await writer.drain()
+    return await read_frame(reader)
+
+
+def _add(client_order_id: int, side: str, quantity: int, price: int) -> dict:
+    return {
+        "type": "add",
+        "client_order_id": client_order_id,
+        "side": side,
+        "order_type": "limit",
+        "quantity": quantity,
+        "price": price,
+    }
+
+
+def test_gateway_reports_executions_and_market_data():
+    async def run():
+        gateway = OrderGateway()
+        port = await gateway.start()
+        subscriber_reader, subscriber_writer = await _connect(port)
+        subscriber_writer.write(encode_frame({"type": "subscribe"}))
+        await subscriber_writer.drain()
+        reader, writer = await _connect(port)
+        other_reader, other_writer = await _connect(port)
+        while not gateway.subscribers:
+            await asyncio.sleep(0)
+
+        report = await _request(reader, writer, _add(1, "sell", 10, 101))
+        assert report == {
+            "type": "execution_report",
+            "client_order_id": 1,
+            "order_id": 1,
+            "fills": [],
+            "resting_quantity": 10,
+        }
+        report = await _request(other_reader, other_writer, _add(2, "buy", 4, 102))
+        assert report["fills"] == [[101, 4, 1]]
+        assert report["resting_quantity"] == 0
+        # The maker hears of the fill too, with the taker's order ID
+        assert await read_frame(reader) == {
+            "type": "execution_report",
+            "client_order_id": 1,
+            "order_id": 1,
+            "fills": [[101, 4, 2]],
+            "resting_quantity": 6,
+        }
+
+        # Only the owning session cancels, and only orders still in the book
+        for order_id in [1, 2, 999]:
+            reply = await _request(
+                other_reader,
+                other_writer,
+                {"type": "cancel", "client_order_id": 3, "order_id": order_id},
+            )
+            assert reply["type"] == "reject"
+        for reply_type in ["cancel_ack", "reject"]:
+            reply = await _request(
+                reader, writer, {"type": "cancel", "client_order_id": 3, "order_id": 1}
+            )
+            assert reply["type"] == reply_type
+        reply = await _request(reader, writer, _add(4, "buy", 0, 99))
+        assert reply["type"] == "reject"
+
+        market_data = [await read_frame(subscriber_reader) for _ in range(4)]
+        assert [message["type"] for message in market_data] == [
+            "book_update",
+            "trade",
+            "book_update",
+            "book_update",
+        ]
+        assert market_data[1] == {
+            "type": "trade",
+            "trade_price": 101,
+            "quantity": 4,
+            "aggressor_side": "buy",
+            "maker_order_id": 1,
+            "taker_order_id": 2,
+            "bid": None,
+            "ask": 101,
+        }
+        assert market_data[3]["levels"] == [["ask", 101, 0]]
+
+        writer.close()
+        other_writer.close()
+        subscriber_writer.close()
+        await gateway.close()
+
+    asyncio.run(run())
+
+
+def test_gateway_reports_later_fills_of_queued_orders():
+    async def run():
+        gateway = OrderGateway()
+        port = await gateway.start()
+        reader, writer = await _connect(port)
+        other_reader, other_writer = await _connect(port)
+
+        market_order = {**_add(1, "buy", 5, 0), "order_type": "market", "price": None}
+        report = await _request(reader, writer, market_order)
+        assert report["resting_quantity"] == 5
+        # The queued market order takes the new limit order as soon as it rests
+        report = await _request(other_reader, other_writer, _add(2, "sell", 8, 101))
+        assert report["fills"] == []
+        assert report["resting_quantity"] == 3
+        assert await read_frame(other_reader) == {
+            "type": "execution_report",
+            "client_order_id": 2,
+            "order_id": 2,
+            "fills": [[101, 5, 1]],
+            "resting_quantity": 3,
+        }
+        assert await read_frame(reader) == {
+            "type": "execution_report",
+            "client_order_id": 1,
+            "order_id": 1,
+            "fills": [[101, 5, 2]],
+            "resting_quantity": 0,
+        }
+        assert list(gateway.order_owners) == [2]
+
+        writer.close()
+        other_writer.close()
+        await gateway.close()
+
+    asyncio.run(run())
+
+
+def test_gateway_expires_good_till_time_orders():
+    async def run():
+        gateway = OrderGateway()
+        port = await gateway.start()
+        reader, writer = await _connect(port)
+
+        report = await _request(
+            reader, writer, {**_add(1, "buy", 5, 99), "expire_time": 10}
+        )
+        assert report["resting_quantity"] == 5
+        report = await _request(reader, writer, _add(2, "buy", 5, 98))
+        gateway.advance_time(9)
+        assert gateway.order_book.bid_queue.get_best_price() == 99
+        gateway.advance_time(10)
+        assert await read_frame(reader) == {
+            "type": "expired",
+            "client_order_id": 1,
+            "order_id": 1,
+        }
+        assert gateway.order_book.bid_queue.get_best_price() == 98
+        assert list(gateway.order_owners) == [2]
+        reply = await _request(
+            reader, writer, {**_add(3, "buy", 5, 99), "expire_time": 10}
+        )
+        assert reply["type"] == "reject"
+        assert reply["reason"] == "expired"
+
+        writer.close()
+        await gateway.close()
+
+    asyncio.run(run())
+
+
+def test_gateway_disconnects_slow_subscriber():
+    async def run():
+        gateway = OrderGateway(outbound_queue_size=2)
+        port = await gateway.start()
+        subscriber_reader, subscriber_writer = await _connect(port)
+        subscriber_writer.write(encode_frame({"type": "subscribe"}))
+        await subscriber_writer.drain()
+        reader, writer = await _connect(port)
+        while not gateway.subscribers:
+            await asyncio.sleep(0)
+        # Stands in for a consumer whose socket stopped draining
+        (subscriber,) = gateway.subscribers
+        subscriber.writer_task.cancel()
+
+        for i in range(5):
+            report = await _request(reader, writer, _add(i, "buy", 1, 90 + i))
+            assert report["order_id"] == i + 1
+        assert not gateway.subscribers
+        assert subscriber.closed
+
+        writer.close()
+        subscriber_writer.close()
+        await gateway.close()
+
+    asyncio.run(run())
+
+
+def test_gateway_rejects_malformed_requests_and_keeps_matching():
+    async def run():
+        gateway = OrderGateway()
+        port = await gateway.start()
+        reader, writer = await _connect(port)
+        other_reader, other_writer = await _connect(port)
+
+        for client_order_id, request in enumerate(
+            [
+                {**_add(0, "buy", 5, 99), "quantity": "5"},
+                {**_add(0, "buy", 5, 99), "side": ["buy"]},
+                {**_add(0, "buy", 5, 99), "price": "99"},
+            ]
+        ):
+            request["client_order_id"] = client_order_id
+            reply = await _request(reader, writer, request)
+            assert reply["type"] == "reject"
+            assert reply["client_order_id"] == client_order_id
+
+        # Frames that are not JSON objects are rejected and the connection stays open
+        for payload in [b"{not json", b"\xff", b"[1]", b"null"]:
+            writer.write(FRAME_HEADER.pack(len(payload)) + payload)
+            await writer.drain()
+            reply = await read_frame(reader)
+            assert reply["type"] == "reject"
+
+        def fail(order):
+            raise RuntimeError("Matching failed")
+
+        # An unexpected error is rejected for its request alone
+        submit_order = gateway.order_book.submit_order
+        gateway.order_book.submit_order = fail
+        reply = await _request(reader, writer, _add(3, "buy", 5, 99))
+        assert reply["type"] == "reject"
+        gateway.order_book.submit_order = submit_order
+        report = await _request(other_reader, other_writer, _add(4, "sell", 5, 101))
+        assert report["type"] == "execution_report"
+        assert report["order_id"] == 1
+
+        writer.close()
+        other_writer.close()
+        await gateway.close()
+
+    asyncio.run(run())
+
+
+def test_load_generator_reports_latency_percentiles():
+    async def run():
+        gateway = OrderGateway()
+        port = await gateway.start()
+        result = await run_load("127.0.0.1", port, 500, max_in_flight=32)
+        await gateway.close()
+        return result
+
+    result = asyncio.run(run())
+    assert result["orders"] == 500
+    assert 0 < result["latency_us"]["p50"] <= result["latency_us"]["p99"]
@@ -0,0 +1,277 @@
+import random
+import time
+import zlib
+
+from journal import (
+    FILE_HEADER,
+    FRAME_SIZE,
+    RECORD,
+    RECORD_CRC,
+    Journal,
+    iter_journal,
+    replay_journal,
+)
+from order import create_order
+from orderbook import OrderBook
+from risk import RiskLimits, RiskManager
+from trade_buffer import TradeBuffer
+
+
+def _add_random_orders(order_book: OrderBook, n: int):
+    for _ in range(n):
+        if random.random() < 0.2 and order_book.sequence_number > 0:
+            order_book.cancel_order(random.randint(1, order_book.sequence_number))
+            continue
+        side = random.choice(["buy", "sell"])
+        order_type = random.choice(["limit", "limit", "market"])
+        price = None
+        if order_type == "limit":
+            price = random.randint(90, 110)
+        order_book.add_order(
+            create_order(side, order_type, random.randint(1, 50), price)
+        )
+
+
+def test_journal_replay_rebuilds_book(tmp_path):
+    random.seed(3)
+    journal_path = str(tmp_path / "book.journal")
+    journal = Journal(journal_path, group_commit_size=64)
+    order_book = OrderBook(journal=journal)
+    _add_random_orders(order_book, 2_000)
+    journal.close()
+
+    result = replay_journal(journal_path)
+    assert result.mismatched_positions == []
+    assert result.order_book.sequence_number == order_book.sequence_number
+    assert result.order_book.depth(50) == order_book.depth(50)
+
+
+def test_journal_replays_tail_after_snapshot(tmp_path):
+    random.seed(4)
+    journal_path = str(tmp_path / "book.journal")
+    snapshot_path = str(tmp_path / "book.snapshot")
+    journal = Journal(journal_path)
+    order_book = OrderBook(journal=journal)
+    _add_random_orders(order_book, 1_000)
+    order_book.snapshot(snapshot_path)
+    _add_random_orders(order_book, 1_000)
+    journal.close()
+
+    result = replay_journal(journal_path, snapshot_path)
+    assert result.mismatched_positions == []
+    assert result.records < 2_000
+    assert result.order_book.depth(50) == order_book.depth(50)
+    assert list(result.order_book.market_bid_queue.iter_orders()) == list(
+        order_book.market_bid_queue.iter_orders()
+    )
+
+
+def test_journal_commits_last_group_without_further_records(tmp_path):
+    journal_path = str(tmp_path / "book.journal")
+    journal = Journal(journal_path, max_commit_delay_seconds=0.01)
+    order_book = OrderBook(journal=journal)
+    order_book.add_order(create_order("buy", "limit", 10, 99))
+    order_book.add_order(create_order("sell", "limit", 10, 101))
+    # Nothing else is recorded, the flusher thread commits the group on its own
+    deadline = time.monotonic() + 5
+    while journal.pending_records and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert [record.kind for record in iter_journal(journal_path)] == [1, 1]
+    journal.close()
+    assert not journal.flusher.is_alive()
+
+
+def test_journal_skips_unrecognized_cancels_and_torn_tail(tmp_path):
+    journal_path = str(tmp_path / "book.journal")
+    journal = Journal(journal_path, group_commit_size=1)
+    order_book = OrderBook(journal=journal)
+    order_book.add_order(create_order("buy", "limit", 10, 99))
+    order_book.cancel_order(5)
+    order_book.cancel_order(1)
+    order_book.add_order(create_order("sell", "limit", 10, 101))
+    journal.close()
+    assert journal.commits >= 4
+
+    with open(journal_path, "r+b") as f:
+        f.truncate(f.seek(0, 2) - 3)
+    records = list(iter_journal(journal_path))
+    assert [(record.kind, record.order_id) for record in records] == [(1, 0), (2, 1)]
+
+
+def test_journal_reopened_after_torn_tail_appends_after_last_record(tmp_path):
+    journal_path = str(tmp_path / "book.journal")
+    journal = Journal(journal_path, group_commit_size=1)
+    order_book = OrderBook(journal=journal)
+    order_book.add_order(create_order("buy", "limit", 10, 99))
+    order_book.add_order(create_order("sell", "limit", 10, 101))
+    journal.close()
+    with open(journal_path, "r+b") as f:
+        f.truncate(f.seek(0, 2) - 3)
+
+    journal = Journal(journal_path, group_commit_size=1)
+    assert journal.records == 1
+    restored = replay_journal(journal_path).order_book
+    restored.journal = journal
+    for price in [101, 102, 103]:
+        restored.add_order(create_order("sell", "limit", 10, price))
+    journal.close()
+    result = replay_journal(journal_path)
+    assert result.records == 4
+    assert result.mismatched_positions == []
+    assert result.order_book.depth(5) == restored.depth(5)
+
+
+def test_journal_checks_trades_of_trade_buffer_books(tmp_path):
+    journal_paths = []
+    for trade_buffer in [None, TradeBuffer()]:
+        random.seed(5)
+        journal_paths.append(str(tmp_path / f"{len(journal_paths)}.journal"))
+        journal = Journal(journal_paths[-1])
+        order_book = OrderBook(journal=journal, trade_buffer=trade_buffer)
+        _add_random_orders(order_book, 500)
+        order_book.amend_order(order_book.sequence_number, 100, 150)
+        journal.close()
+    # Both journals hash the same trades
+    assert list(iter_journal(journal_paths[0])) == list(iter_journal(journal_paths[1]))
+    assert any(record.messages_crc != 0 for record in iter_journal(journal_paths[1]))
+    for trade_buffer in [None, TradeBuffer()]:
+        result = replay_journal(journal_paths[1], trade_buffer=trade_buffer)
+        assert result.mismatched_positions == []
+
+    records = list(iter_journal(journal_paths[1]))
+    with open(journal_paths[1], "r+b") as f:
+        # A wrong trade is now caught in trade buffer mode too
+        position = next(i for i, record in enumerate(records) if record.quantity > 40)
+        f.seek(FILE_HEADER.size + position * FRAME_SIZE)
+        record = records[position]._replace(quantity=1)
+        frame = RECORD.pack(*record)
+        f.write(frame + RECORD_CRC.pack(zlib.crc32(frame)))
+    result = replay_journal(journal_paths[1], trade_buffer=TradeBuffer())
+    assert result.mismatched_positions
+
+
+def test_journal_replays_amends_after_snapshot(tmp_path):
+    random.seed(5)
+    journal_path = str(tmp_path / "book.journal")
+    snapshot_path = str(tmp_path / "book.snapshot")
+    journal = Journal(journal_path)
+    order_book = OrderBook(journal=journal)
+    for i in range(2_000):
+        _add_random_orders(order_book, 1)
+        if i == 1_000:
+            order_book.snapshot(snapshot_path)
+        order_id = random.randint(1, order_book.sequence_number)
+        order_book.amend_order(
+            order_id, random.randint(1, 50), random.choice([None, 95, 100, 105])
+        )
+    journal.close()
+
+    result = replay_journal(journal_path, snapshot_path)
+    assert result.mismatched_positions == []
+    assert result.order_book.depth(50) == order_book.depth(50)
+    for price in order_book.bid_queue.iter_prices():
+        assert list(result.order_book.bid_queue.iter_level_orders(price)) == list(
+            order_book.bid_queue.iter_level_orders(price)
+        )
+
+
+def test_journal_replays_conditional_and_stop_orders(tmp_path):
+    random.seed(6)
+    journal_path = str(tmp_path / "book.journal")
+    snapshot_path = str(tmp_path / "book.snapshot")
+    journal = Journal(journal_path)
+    order_book = OrderBook(journal=journal)
+    for i in range(3_000):
+        if i == 1_500:
+            order_book.snapshot(snapshot_path)
+        side = random.choice(["buy", "sell"])
+        order_type = random.choice(
+            [
+                "limit",
+                "limit",
+                "market",
+                "ioc",
+                "fok",
+                "post_only",
+                "stop",
+                "stop_limit",
+            ]
+        )
+        price = random.randint(90, 110)
+        stop_price = None
+        if order_type in ("stop", "stop_limit"):
+            stop_price = price + random.choice([-3, 3])
+        if order_type in ("market", "stop"):
+            price = None
+        order_book.add_order(
+            create_order(side, order_type, random.randint(1, 50), price, stop_price)
+        )
+    journal.close()
+
+    result = replay_journal(journal_path, snapshot_path)
+    assert result.mismatched_positions == []
+    assert result.order_book.depth(50) == order_book.depth(50)
+    for side in ["stop_bid_queue", "stop_ask_queue"]:
+        assert list(getattr(result.order_book, side).iter_orders()) == list(
+            getattr(order_book, side).iter_orders()
+        )
+
+
+def test_journal_replays_expiry_and_clock_advances(tmp_path):
+    random.seed(7)
+    journal_path = str(tmp_path / "book.journal")
+    snapshot_path = str(tmp_path / "book.snapshot")
+    journal = Journal(journal_path)
+    order_book = OrderBook(journal=journal)
+    for i in range(3_000):
+        if i == 1_500:
+            order_book.snapshot(snapshot_path)
+        if i % 50 == 0:
+            order_book.advance_time(i)
+        side = random.choice(["buy", "sell"])
+        order_type = random.choice(["limit", "limit", "market"])
+        price = random.randint(90, 110) if order_type == "limit" else None
+        expire_time = random.choice([None, i + random.randint(1, 400)])
+        order_book.add_order(
+            create_order(
+                side, order_type, random.randint(1, 50), price, expire_time=expire_time
+            )
+        )
+    journal.close()
+
+    result = replay_journal(journal_path, snapshot_path)
+    assert result.mismatched_positions == []
+    assert result.order_book.depth(50) == order_book.depth(50)
+    assert result.order_book.current_time == order_book.current_time
+    assert result.order_book.advance_time(10_000) == order_book.advance_time(10_000)
+
+
+def test_journal_replays_accounts_through_risk_checks(tmp_path):
+    random.seed(8)
+    limits = RiskLimits(max_order_quantity=40, max_open_quantity=200, price_band=5)
+    journal_path = str(tmp_path / "book.journal")
+    snapshot_path = str(tmp_path / "book.snapshot")
+    journal = Journal(journal_path)
+    order_book = OrderBook(journal=journal, risk=RiskManager(limits))
+    for i in range(3_000):
+        if i == 1_500:
+            order_book.snapshot(snapshot_path)
+        side = random.choice(["buy", "sell"])
+        order_type = random.choice(["limit", "limit", "market", "ioc"])
+        price = random.randint(90, 110) if order_type != "market" else None
+        order_book.add_order(
+            create_order(
+                side,
+                order_type,
+                random.randint(1, 50),
+                price,
+                account=random.randint(1, 4),
+            )
+        )
+    journal.close()
+
+    result = replay_journal(journal_path, snapshot_path, risk=RiskManager(limits))
+    assert result.mismatched_positions == []
+    assert result.order_book.depth(50) == order_book.depth(50)
+    assert result.order_book.risk.open_orders == order_book.risk.open_orders
+    assert result.order_book.risk.open_quantities == order_book.risk.open_quantities
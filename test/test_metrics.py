@@ -0,0 +1,79 @@
+import functools
+
+from metrics import Histogram, OrderBookMetrics
+from order import create_order
+from orderbook import OrderBook
+from price_ladder import PriceLadderOrderQueue
+
+
+def _run_scenario(order_book: OrderBook):
+    for price in [99, 97, 98]:
+        order_book.add_order(create_order("buy", "limit", 10, price))
+    order_book.add_order(create_order("sell", "limit", 5, 101))
+    order_book.add_order(create_order("sell", "market", 25, None))
+    order_book.add_order(create_order("sell", "market", 10, None))
+    order_book.add_order(create_order("buy", "limit", 10, 96))
+    order_book.cancel_order(4)
+
+
+def test_metrics_count_orders_levels_and_flushes():
+    metrics = OrderBookMetrics(latency_sample_every=1)
+    _run_scenario(OrderBook(metrics=metrics))
+    snapshot = metrics.snapshot()
+
+    assert snapshot["orders"] == {
+        "limit_buy": 4,
+        "limit_sell": 1,
+        "market_sell": 2,
+    }
+    assert snapshot["cancels"] == 1
+    # The first market order takes 3 fills, the second 1 before its rest is queued
+    assert snapshot["fills_per_aggressive_order"] == {
+        "count": 2,
+        "sum": 4,
+        "buckets": {1: 1, 3: 1},
+    }
+    # Once finding no bids, then filling against 96 and finding the queue empty
+    assert snapshot["market_flushes"] == 2
+    assert snapshot["market_flush_iterations"] == 3
+    assert snapshot["bid"]["levels_created"] == 4
+    assert snapshot["bid"]["levels_destroyed"] == 3
+    # Only inserting 98 shifts a price, 97
+    assert snapshot["bid"]["insort_shifts"]["buckets"] == {0: 3, 1: 1}
+    assert snapshot["ask"]["levels_created"] == 1
+    assert snapshot["ask"]["levels_destroyed"] == 1
+    assert snapshot["latency_ns"]["add_order"]["count"] == 7
+    assert snapshot["latency_ns"]["cancel_order"]["count"] == 1
+
+
+def test_metrics_latency_is_sampled():
+    metrics = OrderBookMetrics(latency_sample_every=4)
+    order_book = OrderBook(metrics=metrics)
+    for i in range(10):
+        order_book.add_order(create_order("buy", "limit", 10, 90 + i))
+    assert metrics.add_order_latency_ns.count == 2
+    assert metrics.orders["limit", "buy"] == 10
+
+
+def test_metrics_count_price_ladder_levels():
+    metrics = OrderBookMetrics()
+    _run_scenario(
+        OrderBook(
+            functools.partial(PriceLadderOrderQueue, min_price=50, max_price=150),
+            metrics=metrics,
+        )
+    )
+    assert metrics.bid.levels_created == 4
+    assert metrics.bid.levels_destroyed == 3
+    assert metrics.bid.insort_shifts.count == 0
+
+
+def test_histogram_buckets_by_bit_length():
+    histogram = Histogram()
+    for value in [0, 1, 2, 3, 4, 1_000]:
+        histogram.record(value)
+    assert histogram.snapshot() == {
+        "count": 6,
+        "sum": 1_010,
+        "buckets": {0: 1, 1: 1, 3: 2, 7: 1, 1023: 1},
+    }
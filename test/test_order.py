@@ -1,6 +1,14 @@
 import pytest
 
-from order import VALID_SIDES, create_order
+from order import (
+    LIMIT,
+    MARKET,
+    SIDE_TO_CODE,
+    VALID_SIDES,
+    CompactOrder,
+    create_compact_order,
+    create_order,
+)
 
 
 @pytest.mark.parametrize("side", VALID_SIDES)
@@ -71,3 +79,55 @@ def test_invalid_side_assertion(order_type):
     for invalid_side in invalid_sides:
         with pytest.raises(AssertionError, match=expected_side_assertion):
             create_order(invalid_side, order_type, 10, price)
+
+
+@pytest.mark.parametrize("side", VALID_SIDES)
+def test_create_compact_order(side):
+    order = create_compact_order(side, "limit", 10, 101)
+
+    assert order == CompactOrder(SIDE_TO_CODE[side], LIMIT, 10, 101)
+    assert not hasattr(order, "__dict__")
+    assert create_compact_order(side, "market", 5, None).order_type == MARKET
+    with pytest.raises(AssertionError, match="Unknown side type "):
+        create_compact_order("Buy", "limit", 10, 101)
+
+
+@pytest.mark.parametrize("order_type", ["ioc", "fok", "post_only"])
+def test_create_priced_order_types(order_type):
+    order = create_order("buy", order_type, 10, 101)
+
+    assert order.price == 101
+    assert order.stop_price is None
+    with pytest.raises(AssertionError, match="Must choose one of market order"):
+        create_order("buy", order_type, 10, None)
+
+
+def test_stop_price_assertions():
+    expected_stop_price_assertion = "Stop price must be a positive int for stop orders"
+    assert create_order("sell", "stop", 10, None, 95).stop_price == 95
+    assert create_order("sell", "stop_limit", 10, 94, 95).price == 94
+    for order_type, price, stop_price in [
+        ("stop", None, None),
+        ("stop_limit", 94, -1),
+        ("stop_limit", 94, 95.0),
+        ("limit", 94, 95),
+    ]:
+        with pytest.raises(AssertionError, match=expected_stop_price_assertion):
+            create_order("sell", order_type, 10, price, stop_price)
+
+
+def test_expire_time_assertions():
+    order = create_compact_order("buy", "limit", 10, 101, expire_time=60)
+    assert order.expire_time == 60
+    assert create_order("buy", "limit", 10, 101).expire_time is None
+    for expire_time in [0, -5, 60.0]:
+        with pytest.raises(AssertionError, match="Expire time must be int"):
+            create_order("buy", "limit", 10, 101, expire_time=expire_time)
+
+
+def test_account_assertions():
+    assert create_order("buy", "limit", 10, 101, account=7).account == 7
+    assert create_compact_order("buy", "market", 10, None, account=7).account == 7
+    for account in [0, "7"]:
+        with pytest.raises(AssertionError, match="Account must be int"):
+            create_order("buy", "limit", 10, 101, account=account)
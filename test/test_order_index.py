@@ -0,0 +1,59 @@
+from order import create_order
+from order_index import ASK, BID, MARKET_ASK, MARKET_BID, NO_ORDER, OrderIndex
+from orderbook import OrderBook
+
+
+def test_index_sets_gets_and_clears():
+    index = OrderIndex()
+    index.set(1, BID)
+    index.set(4, ASK)
+    assert [index.get(order_id) for order_id in range(6)] == [
+        NO_ORDER,
+        BID,
+        NO_ORDER,
+        NO_ORDER,
+        ASK,
+        NO_ORDER,
+    ]
+    index.clear(1)
+    index.clear(7)
+    assert index.get(1) == NO_ORDER
+
+
+def test_index_compaction_keeps_long_lived_orders():
+    index = OrderIndex(compact_at=8)
+    index.set(1, MARKET_BID)
+    for order_id in range(2, 100):
+        index.set(order_id, BID)
+        index.clear(order_id)
+    assert len(index.locations) < 8
+    assert index.overflow == {1: MARKET_BID}
+    assert index.get(1) == MARKET_BID
+    assert index.get(50) == NO_ORDER
+    index.clear(1)
+    assert index.overflow == {}
+
+
+def test_order_book_index_follows_fills_and_cancels():
+    order_book = OrderBook()
+    order_book.order_index = index = OrderIndex(compact_at=4)
+    for queue in order_book.queues_by_location[1:]:
+        queue.order_index = index
+    order_book.add_order(create_order("buy", "limit", 10, 99))
+    order_book.add_order(create_order("sell", "limit", 10, 101))
+    order_book.add_order(create_order("sell", "market", 15, None))
+    assert [index.get(order_id) for order_id in [1, 2, 3]] == [
+        NO_ORDER,
+        ASK,
+        MARKET_ASK,
+    ]
+    for price in range(80, 90):
+        order_book.add_order(create_order("buy", "limit", 1, price))
+    assert index.get(3) == NO_ORDER
+    order_book.cancel_order(2)
+    order_book.cancel_order(2)
+    assert index.get(2) == NO_ORDER
+    assert order_book.ask_queue.prices == []
+    assert order_book.cancel_orders(range(1, 20)) == list(range(9, 14))
+    assert index.overflow == {}
+    assert order_book.bid_queue.prices == []
@@ -0,0 +1,112 @@
+import random
+
+from order import create_order
+from order_pool import (
+    NO_SLOT,
+    OrderPool,
+    PooledDoublyLinkedList,
+    create_pooled_order_book,
+)
+from orderbook import OrderBook
+
+
+def test_pool_reuses_released_slots():
+    pool = OrderPool(2)
+    first = pool.allocate(1, 10, 100)
+    second = pool.allocate(2, 5, None)
+    pool.release(first)
+
+    assert pool.allocate(3, 7, 101) == first
+    assert pool.get_entry(first).order_id == 3
+    assert pool.get_entry(second).price is None
+    assert pool.size == 2
+    assert pool.capacity == 2
+
+
+def test_pool_grows_when_full():
+    pool = OrderPool(1)
+    slots = [pool.allocate(order_id, 1, 100) for order_id in range(1, 6)]
+
+    assert sorted(slots) == [0, 1, 2, 3, 4]
+    assert pool.capacity == 8
+    assert [pool.order_ids[slot] for slot in slots] == [1, 2, 3, 4, 5]
+
+
+def test_pooled_list_links_through_pool():
+    pool = OrderPool(4)
+    order_list = PooledDoublyLinkedList(pool)
+    slots = [pool.allocate(order_id, 1, 100) for order_id in range(3)]
+    for slot in slots:
+        order_list.add_to_tail(slot)
+    order_list.remove(slots[1])
+
+    assert order_list.length == 2
+    assert order_list.head == slots[0]
+    assert order_list.tail == slots[2]
+    assert pool.next[slots[0]] == slots[2]
+    assert pool.prev[slots[2]] == slots[0]
+
+    order_list.remove(slots[0])
+    order_list.remove(slots[2])
+    assert order_list.head == NO_SLOT
+    assert order_list.tail == NO_SLOT
+
+
+def test_pooled_order_book_matches_order_book():
+    random.seed(11)
+    order_book = OrderBook()
+    pooled_order_book = create_pooled_order_book(capacity=16)
+    for _ in range(5_000):
+        if random.random() < 0.2 and order_book.sequence_number > 0:
+            order_id = random.randint(1, order_book.sequence_number)
+            order_book.cancel_order(order_id)
+            pooled_order_book.cancel_order(order_id)
+            continue
+        if random.random() < 0.1 and order_book.sequence_number > 0:
+            order_id = random.randint(1, order_book.sequence_number)
+            quantity = random.randint(1, 50)
+            price = random.choice([None, random.randint(90, 110)])
+            assert order_book.amend_order(
+                order_id, quantity, price
+            ) == pooled_order_book.amend_order(order_id, quantity, price)
+            continue
+        side = random.choice(["buy", "sell"])
+        order_type = random.choice(["limit", "limit", "market"])
+        price = None
+        if order_type == "limit":
+            price = random.randint(90, 110)
+        order = create_order(side, order_type, random.randint(1, 50), price)
+        assert order_book.add_order(order) == pooled_order_book.add_order(order)
+        assert pooled_order_book.bid_queue.prices == order_book.bid_queue.prices
+        assert pooled_order_book.ask_queue.prices == order_book.ask_queue.prices
+        assert pooled_order_book.depth(5) == order_book.depth(5)
+        assert (
+            pooled_order_book.market_bid_queue.orders.quantity
+            == order_book.market_bid_queue.orders.quantity
+        )
+
+    pool = pooled_order_book.bid_queue.pool
+    resting_orders = sum(
+        len(queue.order_id_to_order)
+        for queue in [
+            order_book.bid_queue,
+            order_book.ask_queue,
+            order_book.market_bid_queue,
+            order_book.market_ask_queue,
+        ]
+    )
+    assert pool.size == resting_orders
+
+
+def test_pooled_bulk_cancels_release_slots():
+    order_book = create_pooled_order_book(capacity=8)
+    for price in [97, 98, 99, 99, 101, 102]:
+        side = "buy" if price < 100 else "sell"
+        order_book.add_order(create_order(side, "limit", 10, price))
+
+    assert order_book.cancel_price_range("buy", 98, 99) == [3, 4, 2]
+    assert order_book.cancel_orders([1, 5]) == [1, 5]
+    assert order_book.bid_queue.pool.size == 1
+    assert order_book.depth(5) == {"bid": [], "ask": [(102, 10, 1)]}
+    assert order_book.cancel_all_orders() == [6]
+    assert order_book.bid_queue.pool.size == 0
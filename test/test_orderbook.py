@@ -1,8 +1,20 @@
+import random
+from concurrent.futures import ThreadPoolExecutor
+
 import pytest
 
 from doubly_linked_list import OrderBookEntry
-from order import create_order
-from orderbook import OrderBook
+from order import create_compact_order, create_order
+from order_index import NO_ORDER
+from order_pool import create_pooled_order_book
+from orderbook import (
+    REJECT_EXPIRED,
+    REJECT_NOT_FILLABLE,
+    REJECT_WOULD_CROSS,
+    BookUpdate,
+    OrderBook,
+)
+from trade_buffer import TradeBuffer
 
 
 @pytest.fixture()
@@ -293,7 +305,7 @@ def test_add_limit_large_cross(full_primed_order_book):
         {"bid": None, "ask": 90, "trade_price": 97},
     ]
 
-    assert full_primed_order_book.sequence_number == 14
+    assert full_primed_order_book.sequence_number == 13
 
     assert full_primed_order_book.bid_queue.queue_price_multiple == -1
     assert list(full_primed_order_book.bid_queue.order_id_to_order.keys()) == []
@@ -316,12 +328,12 @@ def test_add_limit_large_cross(full_primed_order_book):
         10,
         11,
         12,
-        14,
+        13,
     ]
     assert [
         node.order.order_id
         for node in full_primed_order_book.ask_queue.order_id_to_order.values()
-    ] == [7, 8, 9, 10, 11, 12, 14]
+    ] == [7, 8, 9, 10, 11, 12, 13]
     assert list(full_primed_order_book.ask_queue.price_to_order_list) == [
         101,
         102,
@@ -331,7 +343,7 @@ def test_add_limit_large_cross(full_primed_order_book):
     assert [
         dll.head.order.order_id
         for dll in full_primed_order_book.ask_queue.price_to_order_list.values()
-    ] == [7, 8, 10, 14]
+    ] == [7, 8, 10, 13]
     assert full_primed_order_book.ask_queue.prices == [90, 101, 102, 103]
 
 
@@ -388,3 +400,563 @@ def test_flush_market_orders(market_primed_order_book):
         list(market_primed_order_book.market_ask_queue.order_id_to_order.values()) == []
     )
     assert market_primed_order_book.market_ask_queue.orders.length == 0
+
+
+def test_add_orders_matches_add_order():
+    orders = [
+        create_order("buy", "market", 5, None),
+        create_order("sell", "limit", 10, 101),
+        create_order("buy", "limit", 10, 99),
+        create_order("buy", "limit", 8, 102),
+        create_order("sell", "market", 15, None),
+    ]
+    order_book = OrderBook()
+    expected_messages = [
+        (i, message)
+        for i, order in enumerate(orders)
+        for message in order_book.add_order(order)
+    ]
+
+    batch_order_book = OrderBook()
+    messages = batch_order_book.add_orders(orders)
+
+    assert messages == expected_messages
+    assert [i for i, _ in messages] == [1, 3, 4, 4]
+    assert batch_order_book.sequence_number == order_book.sequence_number
+    assert batch_order_book.bid_queue.prices == order_book.bid_queue.prices
+    assert batch_order_book.ask_queue.prices == order_book.ask_queue.prices
+
+
+def test_add_order_fields_matches_add_order():
+    random.seed(20)
+    order_book = OrderBook()
+    fields_order_book = OrderBook()
+    for _ in range(500):
+        order_type = random.choice(["limit", "limit", "market"])
+        price = random.randint(95, 105) if order_type == "limit" else None
+        side = random.choice(["buy", "sell"])
+        quantity = random.randint(1, 30)
+        compact_order = create_compact_order(side, order_type, quantity, price)
+        assert fields_order_book.add_order_fields(
+            compact_order.side,
+            compact_order.order_type,
+            compact_order.quantity,
+            compact_order.price,
+        ) == order_book.add_order(create_order(side, order_type, quantity, price))
+    assert fields_order_book.depth(20) == order_book.depth(20)
+    assert fields_order_book.sequence_number == order_book.sequence_number
+
+
+def test_add_orders_batch_columns():
+    order_book = OrderBook()
+    messages = order_book.add_orders_batch(
+        ["sell", "sell", "buy"],
+        ["limit", "limit", "market"],
+        [10, 5, 12],
+        [101, 102, None],
+    )
+
+    assert messages == [
+        (2, {"bid": None, "ask": 102, "trade_price": 101}),
+        (2, {"bid": None, "ask": 102, "trade_price": 102}),
+    ]
+    assert order_book.ask_queue.prices == [102]
+
+
+def test_add_order_skips_flush_without_queued_market_orders(
+    full_primed_order_book, monkeypatch
+):
+    def fail_flush():
+        raise AssertionError("flush should not run")
+
+    monkeypatch.setattr(
+        full_primed_order_book, "_attempt_to_flush_market_order_queues", fail_flush
+    )
+    full_primed_order_book.add_order(create_order("buy", "limit", 1, 100))
+    full_primed_order_book.add_orders([create_order("sell", "market", 1, None)])
+
+
+def test_submit_order_reports_id_fills_and_rest(full_primed_order_book):
+    report = full_primed_order_book.submit_order(create_order("buy", "limit", 20, 102))
+
+    assert report.order_id == 13
+    assert [(price, quantity, maker) for price, quantity, maker, _ in report.fills] == [
+        (101, 10, 7),
+        (101, 2, 9),
+        (102, 4, 8),
+        (102, 4, 11),
+    ]
+    assert report.resting_quantity == 0
+    assert report.messages == [
+        {"bid": 99, "ask": 101, "trade_price": 101},
+        {"bid": 99, "ask": 102, "trade_price": 101},
+        {"bid": 99, "ask": 102, "trade_price": 102},
+        {"bid": 99, "ask": 102, "trade_price": 102},
+    ]
+
+
+def test_submit_order_reports_queued_market_order():
+    orderbook = OrderBook()
+    report = orderbook.submit_order(create_order("sell", "market", 10, None))
+
+    assert report.order_id == 1
+    assert report.fills == []
+    assert report.resting_quantity == 10
+
+    orderbook.cancel_order(report.order_id)
+    assert orderbook.market_ask_queue.orders.length == 0
+
+
+@pytest.mark.parametrize("order_book_factory", [OrderBook, create_pooled_order_book])
+def test_submit_order_reports_rest_after_market_order_flush(order_book_factory):
+    order_book = order_book_factory()
+    order_book.submit_order(create_order("buy", "market", 5, None))
+    report = order_book.submit_order(create_order("sell", "limit", 8, 101))
+
+    assert report.fills == []
+    assert report.resting_quantity == 3
+    assert order_book.depth(1)["ask"] == [(101, 3, 1)]
+    report = order_book.submit_order(create_order("buy", "market", 10, None))
+    assert report.resting_quantity == 7
+    report = order_book.submit_order(create_order("sell", "limit", 5, 105))
+    assert report.resting_quantity == 0
+    assert order_book.depth(1) == {"bid": [], "ask": []}
+
+
+def test_crossed_limit_remainder_rests_under_order_id(full_primed_order_book):
+    report = full_primed_order_book.submit_order(
+        create_order("sell", "limit", 1000, 90)
+    )
+
+    assert report.order_id == 13
+    assert report.resting_quantity == 939
+    assert full_primed_order_book.ask_queue.order_id_to_order[
+        13
+    ].order == OrderBookEntry(order_id=13, quantity=939, price=90)
+
+
+def test_depth(full_primed_order_book):
+    assert full_primed_order_book.depth(2) == {
+        "bid": [(99, 12, 2), (98, 19, 2)],
+        "ask": [(101, 12, 2), (102, 19, 2)],
+    }
+
+    full_primed_order_book.add_order(create_order("sell", "limit", 15, 99))
+    full_primed_order_book.cancel_order(5)
+
+    assert full_primed_order_book.depth(5) == {
+        "bid": [(98, 4, 1), (97, 30, 2)],
+        "ask": [(99, 3, 1), (101, 12, 2), (102, 19, 2), (103, 30, 2)],
+    }
+
+
+def test_depth_tracks_queued_market_quantity(market_primed_order_book):
+    assert market_primed_order_book.market_bid_queue.orders.quantity == 61
+
+    market_primed_order_book.add_order(create_order("sell", "limit", 12, 100))
+
+    assert market_primed_order_book.market_bid_queue.orders.quantity == 49
+    assert market_primed_order_book.market_bid_queue.orders.length == 5
+
+
+def test_book_updates_are_coalesced_per_input():
+    book_updates = []
+    order_book = OrderBook(book_update_callback=book_updates.append)
+    order_book.add_order(create_order("sell", "limit", 10, 101))
+    order_book.add_order(create_order("sell", "limit", 5, 102))
+    order_book.add_order(create_order("sell", "limit", 5, 103))
+    order_book.add_order(create_order("buy", "limit", 18, 103))
+    order_book.add_order(create_order("buy", "market", 1, None))
+    order_book.cancel_order(2)
+
+    assert book_updates == [
+        BookUpdate(1, (("ask", 101, 10),)),
+        BookUpdate(2, (("ask", 102, 5),)),
+        BookUpdate(3, (("ask", 103, 5),)),
+        BookUpdate(4, (("ask", 101, 0), ("ask", 102, 0), ("ask", 103, 2))),
+        BookUpdate(5, (("ask", 103, 1),)),
+    ]
+
+
+def test_book_updates_rebuild_mirror_book():
+    random.seed(5)
+    mirror = {"bid": {}, "ask": {}}
+
+    def apply_book_update(book_update):
+        for side, price, quantity in book_update.levels:
+            if quantity == 0:
+                # A level can be created and emptied by the same input
+                mirror[side].pop(price, None)
+            else:
+                mirror[side][price] = quantity
+
+    order_book = OrderBook(book_update_callback=apply_book_update)
+    for _ in range(2_000):
+        if random.random() < 0.2 and order_book.sequence_number > 0:
+            order_book.cancel_order(random.randint(1, order_book.sequence_number))
+        else:
+            order_type = random.choice(["limit", "limit", "market"])
+            price = random.randint(90, 110) if order_type == "limit" else None
+            side = random.choice(["buy", "sell"])
+            order_book.add_order(
+                create_order(side, order_type, random.randint(1, 50), price)
+            )
+        depth = order_book.depth(100)
+        for side in ["bid", "ask"]:
+            assert mirror[side] == {
+                price: quantity for price, quantity, _ in depth[side]
+            }
+
+
+def test_side_parallel_matches_serial_trade_stream():
+    random.seed(14)
+    orders = []
+    for i in range(20_000):
+        side = random.choice(["buy", "sell"])
+        # Mostly passive flow with occasional crossing and market orders
+        if i % 50 == 0:
+            orders.append(create_order(side, "market", random.randint(50, 200), None))
+            continue
+        if side == "buy":
+            price = random.randint(80, 99) + (5 if i % 17 == 0 else 0)
+        else:
+            price = random.randint(101, 120) - (5 if i % 17 == 0 else 0)
+        orders.append(create_order(side, "limit", random.randint(1, 50), price))
+
+    serial_order_book = OrderBook()
+    parallel_order_book = OrderBook()
+    with ThreadPoolExecutor(1) as executor:
+        parallel_messages = parallel_order_book.add_orders_side_parallel(
+            orders, executor, min_parallel_run=1
+        )
+    assert parallel_messages == serial_order_book.add_orders(orders)
+    assert parallel_order_book.sequence_number == serial_order_book.sequence_number
+    assert parallel_order_book.depth(100) == serial_order_book.depth(100)
+    for side in ["bid", "ask"]:
+        serial_queue = getattr(serial_order_book, f"{side}_queue")
+        parallel_queue = getattr(parallel_order_book, f"{side}_queue")
+        for price in serial_queue.iter_prices():
+            assert list(parallel_queue.iter_level_orders(price)) == list(
+                serial_queue.iter_level_orders(price)
+            )
+
+
+def flush_market_orders_one_at_a_time(order_book):
+    """Reference flush, executing a single queued market order per pass"""
+    messages = []
+    while True:
+        bid_head_order_id = order_book.market_bid_queue.get_head_order_id()
+        ask_head_order_id = order_book.market_ask_queue.get_head_order_id()
+        has_bids = order_book.bid_queue.get_best_price() is not None
+        has_asks = order_book.ask_queue.get_best_price() is not None
+        if ask_head_order_id is not None and bid_head_order_id is not None:
+            if ask_head_order_id < bid_head_order_id and has_bids:
+                side = "sell"
+            elif has_asks:
+                side = "buy"
+            else:
+                return messages
+        elif ask_head_order_id is not None and has_bids:
+            side = "sell"
+        elif bid_head_order_id is not None and has_asks:
+            side = "buy"
+        else:
+            return messages
+        if side == "buy":
+            trades_and_best = order_book.market_bid_queue.execute_head_order(
+                order_book.ask_queue
+            )
+            taker_order_id = bid_head_order_id
+        else:
+            trades_and_best = order_book.market_ask_queue.execute_head_order(
+                order_book.bid_queue
+            )
+            taker_order_id = ask_head_order_id
+        messages.extend(
+            order_book._convert_trades_and_best_to_messages(
+                trades_and_best, side, taker_order_id
+            )
+        )
+
+
+@pytest.mark.parametrize("trade_buffer", [False, True])
+def test_market_queue_sweep_matches_one_at_a_time_flush(trade_buffer):
+    random.seed(21)
+    order_book = OrderBook(trade_buffer=TradeBuffer() if trade_buffer else None)
+    reference_order_book = OrderBook(
+        trade_buffer=TradeBuffer() if trade_buffer else None
+    )
+    reference_order_book._attempt_to_flush_market_order_queues = lambda: (
+        flush_market_orders_one_at_a_time(reference_order_book)
+    )
+    for _ in range(5_000):
+        side = random.choice(["buy", "sell"])
+        if random.random() < 0.1 and order_book.sequence_number > 0:
+            order_id = random.randint(1, order_book.sequence_number)
+            assert order_book.cancel_order(order_id) == (
+                reference_order_book.cancel_order(order_id)
+            )
+            continue
+        # Market orders mostly outsize the book, so both market queues build up
+        if random.random() < 0.4:
+            order = create_order(side, "market", random.randint(1, 40), None)
+        else:
+            order = create_order(
+                side, "limit", random.randint(1, 60), random.randint(95, 105)
+            )
+        assert order_book.add_order(order) == reference_order_book.add_order(order)
+    assert order_book.depth(20) == reference_order_book.depth(20)
+    if trade_buffer:
+        assert len(order_book.trade_buffer) > 0
+        assert {
+            name: column.tolist()
+            for name, column in order_book.trade_buffer.columns().items()
+        } == {
+            name: column.tolist()
+            for name, column in reference_order_book.trade_buffer.columns().items()
+        }
+
+
+def test_cancel_price_range(full_primed_order_book):
+    assert full_primed_order_book.cancel_price_range("buy", 98, 100) == [1, 3, 2, 5]
+    assert full_primed_order_book.bid_queue.prices == [97]
+    assert full_primed_order_book.cancel_price_range("sell", 103, 110) == [10, 12]
+    assert full_primed_order_book.ask_queue.prices == [101, 102]
+    assert full_primed_order_book.cancel_price_range("sell", 90, 100) == []
+    assert set(full_primed_order_book.bid_queue.order_id_to_order) == {4, 6}
+
+
+def test_cancel_orders_removes_emptied_levels(market_primed_order_book):
+    cancelled = market_primed_order_book.cancel_orders([1, 3, 4, 7, 50, 2])
+    assert cancelled == [1, 3, 4, 7, 2]
+    assert market_primed_order_book.depth(5) == {
+        "bid": [(98, 15, 1), (97, 10, 1)],
+        "ask": [],
+    }
+    market_bid_queue = market_primed_order_book.market_bid_queue
+    assert [order_id for order_id, _ in market_bid_queue.iter_orders()] == [
+        8,
+        9,
+        10,
+        11,
+        12,
+    ]
+
+
+def test_cancel_orders_ignores_repeated_ids():
+    order_book = OrderBook()
+    order_book.add_order(create_order("buy", "limit", 10, 99))
+    order_book.add_order(create_order("buy", "limit", 5, 98))
+    order_book.add_order(create_order("sell", "market", 5, None))
+    order_book.add_order(create_order("sell", "limit", 5, 101))
+
+    assert order_book.cancel_orders([2, 2, 4, 4, 2]) == [2, 4]
+    assert order_book.depth(5) == {"bid": [(99, 5, 1)], "ask": []}
+    messages = order_book.add_order(create_order("sell", "limit", 10, 98))
+    assert [message["trade_price"] for message in messages] == [99]
+    assert order_book.depth(5) == {"bid": [], "ask": [(98, 5, 1)]}
+
+
+def test_cancel_side_and_all(market_primed_order_book):
+    assert market_primed_order_book.cancel_side("buy") == [1, 3, 2, 5, 4, 6] + list(
+        range(7, 13)
+    )
+    assert market_primed_order_book.bid_queue.prices == []
+    assert market_primed_order_book.market_bid_queue.orders.length == 0
+
+    market_primed_order_book.add_order(create_order("sell", "limit", 5, 120))
+    market_primed_order_book.add_order(create_order("buy", "limit", 5, 110))
+    assert market_primed_order_book.cancel_side("buy") == [14]
+    assert market_primed_order_book.ask_queue.prices == [120]
+    market_primed_order_book.add_order(create_order("buy", "limit", 5, 110))
+    assert market_primed_order_book.cancel_all_orders() == [15, 13]
+    assert market_primed_order_book.depth(5) == {"bid": [], "ask": []}
+    assert market_primed_order_book.ask_queue.order_id_to_order == {}
+
+
+def test_bulk_cancel_publishes_one_book_update():
+    book_updates = []
+    order_book = OrderBook(book_update_callback=book_updates.append)
+    for price in [97, 98, 99, 101, 102]:
+        side = "buy" if price < 100 else "sell"
+        order_book.add_order(create_order(side, "limit", 10, price))
+    book_updates.clear()
+
+    order_book.cancel_orders([1, 2, 4])
+    order_book.cancel_all_orders()
+    assert book_updates == [
+        BookUpdate(6, (("bid", 97, 0), ("bid", 98, 0), ("ask", 101, 0))),
+        BookUpdate(7, (("bid", 99, 0), ("ask", 102, 0))),
+    ]
+
+
+def test_amend_reduction_keeps_priority(full_primed_order_book):
+    node = full_primed_order_book.bid_queue.order_id_to_order[1]
+    assert full_primed_order_book.amend_order(1, 4) == []
+    assert full_primed_order_book.bid_queue.order_id_to_order[1] is node
+    assert list(full_primed_order_book.bid_queue.iter_level_orders(99)) == [
+        (1, 4),
+        (3, 2),
+    ]
+    assert full_primed_order_book.depth(1)["bid"] == [(99, 6, 2)]
+
+
+def test_amend_increase_and_reprice_move_to_back(full_primed_order_book):
+    bid_queue = full_primed_order_book.bid_queue
+    full_primed_order_book.amend_order(1, 12)
+    assert list(bid_queue.iter_level_orders(99)) == [(3, 2), (1, 12)]
+
+    node = bid_queue.order_id_to_order[3]
+    full_primed_order_book.amend_order(3, 2, 98)
+    assert bid_queue.order_id_to_order[3] is node
+    assert list(bid_queue.iter_level_orders(98)) == [(2, 4), (5, 15), (3, 2)]
+    full_primed_order_book.amend_order(1, 5, 100)
+    assert bid_queue.prices == [100, 98, 97]
+    assert full_primed_order_book.depth(3)["bid"] == [
+        (100, 5, 1),
+        (98, 21, 3),
+        (97, 30, 2),
+    ]
+
+
+def test_amend_crossing_price_trades_and_rests(full_primed_order_book):
+    messages = full_primed_order_book.amend_order(2, 20, 101)
+    assert [message["trade_price"] for message in messages] == [101, 101]
+    assert full_primed_order_book.ask_queue.prices == [102, 103]
+    assert list(full_primed_order_book.bid_queue.iter_level_orders(101)) == [(2, 8)]
+    assert full_primed_order_book.bid_queue.prices == [101, 99, 98, 97]
+    assert full_primed_order_book.sequence_number == 12
+
+
+def test_amend_ignores_unknown_and_market_orders(market_primed_order_book):
+    assert market_primed_order_book.amend_order(7, 1) == []
+    assert market_primed_order_book.amend_order(40, 1) == []
+    assert market_primed_order_book.market_bid_queue.orders.quantity == 61
+
+
+def test_ioc_cancels_unfilled_remainder(full_primed_order_book):
+    report = full_primed_order_book.submit_order(create_order("buy", "ioc", 40, 102))
+    assert [fill[:3] for fill in report.fills] == [
+        (101, 10, 7),
+        (101, 2, 9),
+        (102, 4, 8),
+        (102, 15, 11),
+    ]
+    assert report.resting_quantity == 0
+    assert full_primed_order_book.bid_queue.prices == [99, 98, 97]
+    assert full_primed_order_book.ask_queue.prices == [103]
+    report = full_primed_order_book.submit_order(create_order("sell", "ioc", 5, 100))
+    assert report.fills == [] and report.resting_quantity == 0
+    assert full_primed_order_book.order_index.get(report.order_id) == NO_ORDER
+
+
+def test_fok_checks_level_quantity_before_trading(full_primed_order_book):
+    depth = full_primed_order_book.depth(10)
+    report = full_primed_order_book.submit_order(create_order("buy", "fok", 32, 102))
+    assert report.reject_reason == REJECT_NOT_FILLABLE
+    assert report.order_id == 13
+    assert report.fills == [] and report.messages == []
+    assert full_primed_order_book.depth(10) == depth
+    report = full_primed_order_book.submit_order(create_order("buy", "fok", 31, 102))
+    assert report.reject_reason is None
+    assert sum(fill[1] for fill in report.fills) == 31
+    assert report.resting_quantity == 0
+    assert full_primed_order_book.ask_queue.prices == [103]
+
+
+def test_post_only_rests_or_rejects(full_primed_order_book):
+    report = full_primed_order_book.submit_order(
+        create_order("sell", "post_only", 5, 99)
+    )
+    assert report.reject_reason == REJECT_WOULD_CROSS
+    assert full_primed_order_book.depth(1)["bid"] == [(99, 12, 2)]
+    report = full_primed_order_book.submit_order(
+        create_order("sell", "post_only", 5, 100)
+    )
+    assert report.reject_reason is None and report.resting_quantity == 5
+    assert full_primed_order_book.depth(1)["ask"] == [(100, 5, 1)]
+
+
+def test_stop_orders_trigger_on_trade_prices_and_cascade(full_primed_order_book):
+    order_book = full_primed_order_book
+    assert (
+        order_book.submit_order(
+            create_order("buy", "stop", 15, None, 102)
+        ).resting_quantity
+        == 15
+    )
+    order_book.add_order(create_order("buy", "stop_limit", 2, 103, 103))
+    order_book.add_order(create_order("sell", "stop_limit", 3, 97, 98))
+    assert len(order_book.stop_bid_queue) == 2
+    # Trades at 101 stay below both buy stops
+    order_book.add_order(create_order("buy", "market", 12, None))
+    assert len(order_book.stop_bid_queue) == 2
+    # A trade at 102 triggers the stop, whose fill at 103 triggers the stop limit
+    messages = order_book.add_order(create_order("buy", "market", 5, None))
+    assert [message["trade_price"] for message in messages] == [
+        102,
+        102,
+        102,
+        103,
+        103,
+    ]
+    assert len(order_book.stop_bid_queue) == 0
+    assert order_book.depth(1)["ask"] == [(103, 27, 2)]
+    order_book.add_order(create_order("sell", "market", 13, None))
+    assert len(order_book.stop_ask_queue) == 0
+    assert order_book.depth(1)["bid"] == [(98, 15, 1)]
+
+
+def test_stop_orders_cancel_by_id_and_in_bulk(full_primed_order_book):
+    order_book = full_primed_order_book
+    order_book.add_order(create_order("buy", "stop", 5, None, 105))
+    order_book.add_order(create_order("sell", "stop", 5, None, 95))
+    order_book.add_order(create_order("sell", "stop_limit", 5, 94, 95))
+    order_book.cancel_order(14)
+    assert [order.order_id for order in order_book.stop_ask_queue.iter_orders()] == [15]
+    assert order_book.cancel_side("buy")[-1] == 13
+    assert order_book.cancel_all_orders()[-1] == 15
+    assert order_book.order_index.get(15) == NO_ORDER
+    assert len(order_book.stop_ask_queue) == 0
+
+
+def test_advance_time_expires_due_orders_in_one_update():
+    book_updates = []
+    order_book = OrderBook(book_update_callback=book_updates.append)
+    order_book.add_order(create_order("buy", "limit", 10, 99, expire_time=50))
+    order_book.add_order(create_order("buy", "limit", 10, 98, expire_time=20))
+    order_book.add_order(create_order("buy", "limit", 10, 98))
+    order_book.add_order(create_order("sell", "limit", 5, 101, expire_time=20))
+    order_book.add_order(create_order("sell", "stop", 5, None, 90, expire_time=20))
+    order_book.add_order(create_order("sell", "market", 10, None, expire_time=50))
+    # Filled and cancelled orders are skipped when their time comes
+    order_book.add_order(create_order("buy", "limit", 5, 97, expire_time=20))
+    order_book.cancel_order(7)
+    book_updates.clear()
+
+    assert order_book.advance_time(10) == []
+    assert order_book.advance_time(30) == [2, 4, 5]
+    assert book_updates == [BookUpdate(8, (("bid", 98, 10), ("ask", 101, 0)))]
+    assert len(order_book.stop_ask_queue) == 0
+    assert order_book.order_index.get(6) == NO_ORDER
+    assert order_book.advance_time(50) == []
+    assert order_book.depth(5) == {"bid": [(98, 10, 1)], "ask": []}
+    assert len(order_book.expiry_queue) == 0
+
+
+def test_advance_time_rejects_expired_orders_and_going_back():
+    order_book = OrderBook()
+    order_book.advance_time(100)
+    report = order_book.submit_order(
+        create_order("buy", "limit", 10, 99, expire_time=100)
+    )
+    assert report.reject_reason == REJECT_EXPIRED
+    assert report.resting_quantity == 0 and order_book.depth(1)["bid"] == []
+    assert (
+        order_book.submit_order(
+            create_order("buy", "limit", 10, 99, expire_time=101)
+        ).resting_quantity
+        == 10
+    )
+    with pytest.raises(AssertionError, match="Time must not go backwards"):
+        order_book.advance_time(99)
@@ -0,0 +1,135 @@
+import functools
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from order import create_order
+from orderbook import REJECT_INVALID_PRICE, OrderBook
+from price_ladder import PriceLadderOrderQueue
+
+
+@pytest.fixture()
+def ladder_order_book():
+    return OrderBook(
+        functools.partial(PriceLadderOrderQueue, min_price=50, max_price=150)
+    )
+
+
+def test_ladder_tracks_best_price(ladder_order_book):
+    for price in [97, 99, 98]:
+        ladder_order_book.add_order(create_order("buy", "limit", 10, price))
+    for price in [103, 101, 102]:
+        ladder_order_book.add_order(create_order("sell", "limit", 10, price))
+
+    assert ladder_order_book.bid_queue.get_best_price() == 99
+    assert ladder_order_book.ask_queue.get_best_price() == 101
+    assert ladder_order_book.bid_queue.prices == [99, 98, 97]
+    assert ladder_order_book.ask_queue.prices == [101, 102, 103]
+
+    ladder_order_book.cancel_order(2)
+    assert ladder_order_book.bid_queue.get_best_price() == 98
+
+    messages = ladder_order_book.add_order(create_order("buy", "market", 25, None))
+    assert [message["trade_price"] for message in messages] == [101, 102, 103]
+    assert ladder_order_book.ask_queue.get_best_price() == 103
+    assert ladder_order_book.ask_queue.prices == [103]
+
+
+def test_ladder_rejects_price_off_ladder(ladder_order_book):
+    ladder_order_book.add_order(create_order("sell", "limit", 10, 100))
+    ladder_order_book.add_order(create_order("buy", "limit", 10, 90))
+    # Rejected before matching, so the ask it crosses is not taken
+    for order in [
+        create_order("buy", "limit", 20, 200),
+        create_order("sell", "post_only", 10, 151),
+        create_order("buy", "stop_limit", 10, 160, 120),
+    ]:
+        report = ladder_order_book.submit_order(order)
+        assert report.reject_reason == REJECT_INVALID_PRICE
+        assert report.fills == [] and report.resting_quantity == 0
+    with ThreadPoolExecutor(1) as executor:
+        ladder_order_book.add_orders_side_parallel(
+            [create_order("sell", "limit", 10, 160)], executor, min_parallel_run=1
+        )
+    assert ladder_order_book.amend_order(1, 10, 30) == []
+    assert ladder_order_book.depth(5) == {"bid": [(90, 10, 1)], "ask": [(100, 10, 1)]}
+
+
+def test_ladder_respects_tick_size():
+    queue = PriceLadderOrderQueue("ask", min_price=100, max_price=200, tick_size=5)
+    with pytest.raises(ValueError, match="is not on the ladder"):
+        queue._price_to_index(102)
+    assert queue._price_to_index(105) == 1
+    assert not queue.is_valid_price(102) and not queue.is_valid_price(205)
+
+
+def test_ladder_matches_sorted_list_queue(ladder_order_book):
+    random.seed(7)
+    order_book = OrderBook()
+    for _ in range(5_000):
+        if random.random() < 0.2 and order_book.sequence_number > 0:
+            order_id = random.randint(1, order_book.sequence_number)
+            order_book.cancel_order(order_id)
+            ladder_order_book.cancel_order(order_id)
+            continue
+        if random.random() < 0.1 and order_book.sequence_number > 0:
+            order_id = random.randint(1, order_book.sequence_number)
+            quantity = random.randint(1, 50)
+            price = random.choice([None, random.randint(90, 110)])
+            assert order_book.amend_order(
+                order_id, quantity, price
+            ) == ladder_order_book.amend_order(order_id, quantity, price)
+            continue
+        side = random.choice(["buy", "sell"])
+        order_type = random.choice(["limit", "limit", "market"])
+        price = None
+        if order_type == "limit":
+            price = random.randint(90, 110)
+        order = create_order(side, order_type, random.randint(1, 50), price)
+        assert order_book.add_order(order) == ladder_order_book.add_order(order)
+        assert ladder_order_book.bid_queue.prices == order_book.bid_queue.prices
+        assert ladder_order_book.ask_queue.prices == order_book.ask_queue.prices
+        assert ladder_order_book.depth(5) == order_book.depth(5)
+
+
+def test_ladder_bulk_cancels_match_sorted_list_queue(ladder_order_book):
+    random.seed(16)
+    order_book = OrderBook()
+    for i in range(3_000):
+        if i % 100 == 99:
+            side = random.choice(["buy", "sell"])
+            low = random.randint(40, 120)
+            high = low + random.randint(0, 20)
+            if random.random() < 0.3:
+                # Reversed bounds cancel the same range
+                low, high = high, low
+            assert order_book.cancel_price_range(
+                side, low, high
+            ) == ladder_order_book.cancel_price_range(side, low, high)
+        elif i % 100 == 49:
+            order_ids = random.sample(range(1, order_book.sequence_number + 1), 30)
+            assert order_book.cancel_orders(
+                order_ids
+            ) == ladder_order_book.cancel_orders(order_ids)
+        else:
+            side = random.choice(["buy", "sell"])
+            if side == "buy":
+                price = random.randint(80, 99)
+            else:
+                price = random.randint(101, 120)
+            order = create_order(side, "limit", random.randint(1, 50), price)
+            assert order_book.add_order(order) == ladder_order_book.add_order(order)
+        assert ladder_order_book.bid_queue.prices == order_book.bid_queue.prices
+        assert ladder_order_book.ask_queue.prices == order_book.ask_queue.prices
+        assert ladder_order_book.bid_queue.get_best_price() == (
+            order_book.bid_queue.get_best_price()
+        )
+        assert ladder_order_book.ask_queue.get_best_price() == (
+            order_book.ask_queue.get_best_price()
+        )
+    order_ids = order_book.cancel_price_range("buy", 96, 94)
+    assert order_ids
+    assert ladder_order_book.cancel_price_range("buy", 96, 94) == order_ids
+    assert ladder_order_book.cancel_side("sell") == order_book.cancel_side("sell")
+    assert ladder_order_book.ask_queue.level_count == 0
@@ -0,0 +1,160 @@
+import random
+
+from order import create_order
+from orderbook import OrderBook
+from replay import (
+    ADD,
+    AMEND,
+    CANCEL,
+    FILE_HEADER,
+    MAGIC,
+    VERSION_1_EVENT,
+    CsvTradeSink,
+    Event,
+    iter_binary_events,
+    iter_csv_events,
+    iter_generated_events,
+    replay_events,
+    write_binary_events,
+)
+from trade_buffer import TradeBuffer
+
+CSV_EVENTS = """event,side,order_type,quantity,price,order_id
+add,sell,limit,10,101,
+add,sell,limit,5,102,
+add,buy,limit,4,99,
+
+amend,,,8,,1
+add,buy,market,12,,
+cancel,,,,,3
+bogus,,,,,
+add,sell,limit,3,103,
+"""
+
+EXPECTED_EVENTS = [
+    Event(ADD, "sell", "limit", 10, 101, 0),
+    Event(ADD, "sell", "limit", 5, 102, 0),
+    Event(ADD, "buy", "limit", 4, 99, 0),
+    Event(AMEND, None, None, 8, None, 1),
+    Event(ADD, "buy", "market", 12, None, 0),
+    Event(CANCEL, None, None, 0, None, 3),
+    Event(ADD, "sell", "limit", 3, 103, 0),
+]
+
+
+def test_csv_events_are_parsed_across_chunks(tmp_path):
+    path = tmp_path / "events.csv"
+    path.write_text(CSV_EVENTS)
+    for chunk_bytes in [7, 64, 1 << 20]:
+        assert list(iter_csv_events(str(path), chunk_bytes)) == EXPECTED_EVENTS
+
+
+def test_binary_events_round_trip(tmp_path):
+    path = str(tmp_path / "events.bin")
+    assert write_binary_events(EXPECTED_EVENTS, path) == 7
+    assert list(iter_binary_events(path, chunk_events=2)) == EXPECTED_EVENTS
+
+
+def test_every_order_type_is_replayed(tmp_path):
+    orders = [
+        create_order("sell", "limit", 10, 101),
+        create_order("sell", "limit", 5, 102),
+        create_order("sell", "post_only", 5, 103),
+        create_order("buy", "stop", 4, None, 102),
+        create_order("buy", "stop_limit", 3, 104, 102),
+        create_order("buy", "ioc", 12, 102),
+        create_order("buy", "fok", 20, 103),
+        create_order("buy", "limit", 3, 100),
+    ]
+    path = tmp_path / "events.csv"
+    path.write_text(
+        "".join(
+            f"add,{order.side},{order.order_type},{order.quantity},"
+            f"{order.price or ''},,{order.stop_price or ''}\n"
+            for order in orders
+        )
+    )
+    events = list(iter_csv_events(str(path)))
+    assert [event.order_type for event in events] == [
+        order.order_type for order in orders
+    ]
+    assert events[4].stop_price == 102
+    binary_path = str(tmp_path / "events.bin")
+    write_binary_events(events, binary_path)
+    assert list(iter_binary_events(binary_path)) == events
+
+    replay_order_book = OrderBook(trade_buffer=TradeBuffer())
+    stats = replay_events(events, replay_order_book)
+    order_book = OrderBook()
+    trades = sum(len(order_book.add_order(order)) for order in orders)
+    # The ioc order triggers both stops and the fok order cannot fill
+    assert stats.trades == trades == 5
+    assert len(replay_order_book.stop_bid_queue) == 0
+    assert replay_order_book.depth(5) == order_book.depth(5)
+
+
+def test_version_1_binary_events_are_read(tmp_path):
+    path = tmp_path / "events.bin"
+    path.write_bytes(
+        FILE_HEADER.pack(MAGIC, 1)
+        + VERSION_1_EVENT.pack(ADD, 1, 0, 10, 101, 0)
+        + VERSION_1_EVENT.pack(CANCEL, 0, 0, 0, 0, 1)
+    )
+    assert list(iter_binary_events(str(path))) == [
+        Event(ADD, "sell", "limit", 10, 101, 0),
+        Event(CANCEL, None, None, 0, None, 1),
+    ]
+
+
+def test_replay_writes_fills_to_sink(tmp_path):
+    events_path = tmp_path / "events.csv"
+    events_path.write_text(CSV_EVENTS)
+    trades_path = str(tmp_path / "trades.csv")
+    sink = CsvTradeSink(trades_path)
+    stats = replay_events(
+        iter_csv_events(str(events_path)),
+        OrderBook(trade_buffer=TradeBuffer(capacity=1)),
+        sink,
+        batch_size=2,
+    )
+    sink.close()
+
+    assert (stats.events, stats.trades) == (7, 2)
+    with open(trades_path) as f:
+        assert f.read().splitlines() == [
+            "trade_price,quantity,aggressor_side,maker_order_id,taker_order_id,"
+            "best_bid,best_ask",
+            "101,8,1,1,4,99,102",
+            "102,4,1,2,4,99,102",
+        ]
+
+
+def test_replay_matches_order_book(tmp_path):
+    random.seed(19)
+    path = str(tmp_path / "events.bin")
+    write_binary_events(iter_generated_events(5_000), path)
+
+    batches = []
+    replay_order_book = OrderBook(trade_buffer=TradeBuffer())
+    stats = replay_events(
+        iter_binary_events(path, chunk_events=100),
+        replay_order_book,
+        lambda columns: batches.append(columns["trade_price"].tolist()),
+        batch_size=100,
+    )
+
+    order_book = OrderBook()
+    trade_prices = []
+    for kind, side, order_type, quantity, price, order_id, _ in iter_binary_events(
+        path
+    ):
+        if kind == ADD:
+            messages = order_book.add_order(
+                create_order(side, order_type, quantity, price)
+            )
+            trade_prices.extend(message["trade_price"] for message in messages)
+        else:
+            order_book.cancel_order(order_id)
+    assert stats.events == 5_000
+    assert [price for batch in batches for price in batch] == trade_prices
+    assert replay_order_book.depth(20) == order_book.depth(20)
@@ -0,0 +1,194 @@
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+from order import create_order
+from order_index import NO_ORDER
+from order_pool import PooledMarketOrderQueue, PooledOrderQueue
+from orderbook import REJECT_NOT_FILLABLE, MarketOrderQueue, OrderBook, OrderQueue
+from risk import (
+    REJECT_OPEN_QUANTITY,
+    REJECT_ORDER_QUANTITY,
+    REJECT_PRICE_BAND,
+    RiskLimits,
+    RiskManager,
+)
+from trade_buffer import TradeBuffer
+
+
+def test_pre_trade_checks_reject_orders():
+    order_book = OrderBook(
+        risk=RiskManager(
+            RiskLimits(max_order_quantity=50, max_open_quantity=60, price_band=5)
+        )
+    )
+    order_book.add_order(create_order("sell", "limit", 10, 100))
+    order_book.add_order(create_order("buy", "limit", 10, 95))
+    for order, reject_reason in [
+        (create_order("buy", "limit", 51, 95, account=1), REJECT_ORDER_QUANTITY),
+        (create_order("buy", "limit", 10, 106), REJECT_PRICE_BAND),
+        (create_order("sell", "ioc", 10, 89), REJECT_PRICE_BAND),
+        (create_order("buy", "limit", 40, 90, account=1), None),
+        (create_order("sell", "stop", 30, None, 80, account=1), REJECT_OPEN_QUANTITY),
+        (create_order("sell", "stop", 20, None, 80, account=1), None),
+        (create_order("buy", "market", 1, None, account=1), REJECT_OPEN_QUANTITY),
+        (create_order("buy", "market", 1, None, account=2), None),
+    ]:
+        assert order_book.submit_order(order).reject_reason == reject_reason
+    assert order_book.risk.open_quantities == {1: [40, 20]}
+
+
+def test_parallel_adds_run_risk_checks():
+    orders = [
+        create_order(side, "limit", quantity, price)
+        for quantity in [1000, 5]
+        for side, price in [("buy", 99), ("sell", 101)]
+        for _ in range(100)
+    ]
+    order_books = [
+        OrderBook(risk=RiskManager(RiskLimits(max_order_quantity=10))) for _ in range(2)
+    ]
+    order_books[0].add_orders(orders)
+    with ThreadPoolExecutor(1) as executor:
+        order_books[1].add_orders_side_parallel(orders, executor, min_parallel_run=1)
+    assert order_books[0].depth(1) == order_books[1].depth(1)
+    assert order_books[1].depth(1) == {
+        "bid": [(99, 500, 100)],
+        "ask": [(101, 500, 100)],
+    }
+
+
+def test_open_quantity_follows_fills_amends_and_cancels():
+    risk = RiskManager(RiskLimits(max_open_quantity=100))
+    order_book = OrderBook(risk=risk)
+    order_book.add_order(create_order("buy", "limit", 30, 99, account=1))
+    order_book.add_order(create_order("sell", "limit", 20, 101, account=1))
+    order_book.add_order(create_order("sell", "market", 10, None, account=2))
+    order_book.add_order(create_order("sell", "limit", 5, 99, account=2))
+    # Account 2's orders filled on arrival and were never open
+    assert risk.open_quantities == {1: [15, 20]}
+
+    order_book.amend_order(1, 90)
+    assert order_book.depth(1)["bid"] == [(99, 15, 1)]
+    order_book.amend_order(1, 60)
+    assert risk.open_quantities[1] == [60, 20]
+    order_book.cancel_order(2)
+    assert risk.open_quantities[1] == [60, 0]
+    # Queued market orders and triggered stops are open until they fill
+    order_book.add_order(create_order("buy", "stop", 30, None, 99, account=1))
+    assert risk.open_quantities[1] == [90, 0]
+    order_book.add_order(create_order("sell", "limit", 50, 99, account=2))
+    assert risk.open_quantities[1] == [40, 0]
+    assert risk.open_orders == {1: [1, 0, 10], 5: [1, 0, 30]}
+    order_book.add_order(create_order("sell", "limit", 10, 100, account=2))
+    assert risk.open_quantities == {1: [30, 0], 2: [0, 0]}
+    assert risk.open_orders == {1: [1, 0, 10], 5: [1, 0, 20]}
+    order_book.cancel_all_orders()
+    assert risk.open_orders == {}
+    assert risk.open_quantities == {1: [0, 0], 2: [0, 0]}
+
+
+def test_self_trade_prevention_cancels_resting_orders_in_reach():
+    order_book = OrderBook(risk=RiskManager())
+    order_book.add_order(create_order("sell", "limit", 10, 100, account=1))
+    order_book.add_order(create_order("sell", "limit", 5, 100, account=2))
+    order_book.add_order(create_order("sell", "limit", 10, 101, account=1))
+    order_book.add_order(create_order("sell", "limit", 10, 102, account=1))
+
+    report = order_book.submit_order(create_order("buy", "limit", 12, 101, account=1))
+    # The own order at 100 is cancelled, the one at 101 is reached after the fill of
+    # account 2's order and the one at 102 is beyond the limit price
+    assert [fill[2] for fill in report.fills] == [2]
+    assert report.resting_quantity == 7
+    assert [order_book.order_index.get(order_id) for order_id in [1, 3]] == [
+        NO_ORDER,
+        NO_ORDER,
+    ]
+    assert order_book.depth(2) == {"bid": [(101, 7, 1)], "ask": [(102, 10, 1)]}
+    # An own market order is not filled by its account's resting bid
+    report = order_book.submit_order(create_order("sell", "market", 4, None, account=1))
+    assert report.fills == [] and report.resting_quantity == 4
+    assert order_book.depth(1)["bid"] == []
+
+
+def test_rejected_fok_cancels_no_own_orders():
+    order_book = OrderBook(risk=RiskManager())
+    order_book.add_order(create_order("sell", "limit", 10, 100, account=1))
+    order_book.add_order(create_order("sell", "limit", 5, 100, account=2))
+
+    # Only account 2's 5 can fill it, so it is rejected before account 1's ask goes
+    report = order_book.submit_order(create_order("buy", "fok", 10, 100, account=1))
+    assert report.reject_reason == REJECT_NOT_FILLABLE
+    assert order_book.depth(1)["ask"] == [(100, 15, 2)]
+    report = order_book.submit_order(create_order("buy", "fok", 5, 100, account=1))
+    assert report.reject_reason is None
+    assert [fill[2] for fill in report.fills] == [2]
+    assert order_book.depth(1)["ask"] == []
+
+
+def test_self_trade_prevention_covers_queued_market_orders():
+    order_book = OrderBook(risk=RiskManager())
+    order_book.add_order(create_order("sell", "market", 10, None, account=1))
+    order_book.add_order(create_order("sell", "market", 10, None, account=2))
+    messages = order_book.add_order(create_order("buy", "limit", 15, 99, account=1))
+    assert len(messages) == 1
+    assert list(order_book.market_ask_queue.iter_orders()) == []
+    assert order_book.depth(1)["bid"] == [(99, 5, 1)]
+
+
+def test_self_trade_prevention_matches_across_queue_types():
+    results = []
+    for queue_factory, market_queue_factory in [
+        (OrderQueue, MarketOrderQueue),
+        (PooledOrderQueue, PooledMarketOrderQueue),
+    ]:
+        random.seed(11)
+        risk = RiskManager(RiskLimits(max_open_quantity=500))
+        order_book = OrderBook(
+            queue_factory=queue_factory,
+            market_queue_factory=market_queue_factory,
+            trade_buffer=TradeBuffer(),
+            risk=risk,
+        )
+        order_accounts = {}
+        for _ in range(2_000):
+            side = random.choice(["buy", "sell"])
+            order_type = random.choice(["limit", "limit", "market", "ioc", "stop"])
+            price = random.randint(95, 105)
+            stop_price = None
+            if order_type == "stop":
+                stop_price = price
+            if order_type in ("market", "stop"):
+                price = None
+            account = random.randint(1, 3)
+            report = order_book.submit_order(
+                create_order(
+                    side,
+                    order_type,
+                    random.randint(1, 20),
+                    price,
+                    stop_price,
+                    account=account,
+                )
+            )
+            order_accounts[report.order_id] = account
+        columns = order_book.trade_buffer.columns()
+        trades = list(zip(*(column.tolist() for column in columns.values())))
+        assert trades
+        for column in columns.values():
+            column.release()
+        for trade in trades:
+            assert order_accounts[trade[3]] != order_accounts[trade[4]]
+        # Tracked open quantity matches what is resting or waiting
+        open_orders = {}
+        for queue in [order_book.bid_queue, order_book.ask_queue]:
+            for price in queue.iter_prices():
+                open_orders.update(queue.iter_level_orders(price))
+        for queue in [order_book.market_bid_queue, order_book.market_ask_queue]:
+            open_orders.update(queue.iter_orders())
+        for queue in [order_book.stop_bid_queue, order_book.stop_ask_queue]:
+            open_orders.update((order[0], order[2]) for order in queue.iter_orders())
+        assert {
+            order_id: open_order[2] for order_id, open_order in risk.open_orders.items()
+        } == open_orders
+        results.append((trades, order_book.depth(20)))
+    assert results[0] == results[1]
@@ -0,0 +1,89 @@
+import random
+
+import pytest
+
+from demo import generate_orders
+from order import create_order
+from orderbook import OrderBook
+from simulator import order_columns, simulate
+from trade_buffer import COLUMN_TYPECODES, TradeBuffer
+
+
+def _order_book_fills(orders):
+    order_book = OrderBook(trade_buffer=TradeBuffer())
+    order_book.add_orders(orders)
+    return _rows(order_book.trade_buffer)
+
+
+def _rows(trade_buffer):
+    columns = trade_buffer.columns()
+    rows = list(zip(*(columns[name].tolist() for name in COLUMN_TYPECODES)))
+    for column in columns.values():
+        column.release()
+    return rows
+
+
+def _random_orders(n, market_share, quantities, spread):
+    orders = []
+    for _ in range(n):
+        side = random.choice(["buy", "sell"])
+        if random.random() < market_share:
+            orders.append(create_order(side, "market", random.choice(quantities), None))
+        else:
+            price = random.randint(100 - spread, 100 + spread)
+            orders.append(create_order(side, "limit", random.choice(quantities), price))
+    return orders
+
+
+def test_simulate_matches_order_book_on_demo_orders():
+    random.seed(404)
+    orders = generate_orders(20_000)
+    rows = _rows(simulate(*order_columns(orders)))
+    assert len(rows) > 10_000
+    assert rows == _order_book_fills(orders)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_simulate_matches_order_book_on_random_flows(seed):
+    random.seed(seed)
+    # Crossing limit orders, sweeps through several levels and long market queues
+    for market_share, quantities, spread in [
+        (0.3, [1, 5, 10], 3),
+        (0.5, [1, 50], 10),
+        (0.8, [1, 2, 3, 100], 1),
+        (0.1, [20], 0),
+    ]:
+        orders = _random_orders(3_000, market_share, quantities, spread)
+        assert _rows(simulate(*order_columns(orders))) == _order_book_fills(orders)
+
+
+def test_simulate_handles_wide_price_ranges():
+    random.seed(9)
+    orders = [create_order("buy", "limit", 5, 1), create_order("sell", "limit", 5, 2)]
+    for _ in range(1_000):
+        side = random.choice(["buy", "sell"])
+        price = random.choice([1, 1_000, 2_000_000, 10**12])
+        orders.append(create_order(side, "limit", random.randint(1, 10), price))
+        orders.append(create_order(side, "market", random.randint(1, 10), None))
+    rows = _rows(simulate(*order_columns(orders)))
+    assert {row[0] for row in rows} >= {1, 2_000_000}
+    assert rows == _order_book_fills(orders)
+
+
+def test_simulate_handles_queued_market_orders_only():
+    orders = [
+        create_order("sell", "market", 5, None),
+        create_order("buy", "market", 5, None),
+        create_order("buy", "limit", 3, 99),
+        create_order("sell", "limit", 10, 101),
+    ]
+    rows = _rows(simulate(*order_columns(orders)))
+    assert rows == _order_book_fills(orders)
+    assert [row[:5] for row in rows] == [(99, 3, -1, 3, 1), (101, 5, 1, 4, 2)]
+    assert len(simulate([], [], [], [])) == 0
+
+
+def test_simulate_rejects_unsupported_order_types():
+    columns = order_columns([create_order("buy", "ioc", 5, 100)])
+    with pytest.raises(AssertionError):
+        simulate(*columns)
@@ -0,0 +1,145 @@
+import functools
+import random
+
+from demo import generate_orders
+from order import create_order
+from order_pool import PooledMarketOrderQueue, PooledOrderQueue
+from orderbook import OrderBook
+from price_ladder import PriceLadderOrderQueue
+from snapshot import EXPIRY_RECORD, HEADER, ORDER_RECORD, STOP_ORDER_RECORD
+
+
+def assert_same_book(order_book, restored_order_book):
+    assert restored_order_book.sequence_number == order_book.sequence_number
+    for side in ["bid_queue", "ask_queue"]:
+        queue = getattr(order_book, side)
+        restored_queue = getattr(restored_order_book, side)
+        assert list(restored_queue.iter_prices()) == list(queue.iter_prices())
+        for price in queue.iter_prices():
+            assert list(restored_queue.iter_level_orders(price)) == list(
+                queue.iter_level_orders(price)
+            )
+    for side in [
+        "market_bid_queue",
+        "market_ask_queue",
+        "stop_bid_queue",
+        "stop_ask_queue",
+    ]:
+        assert list(getattr(restored_order_book, side).iter_orders()) == list(
+            getattr(order_book, side).iter_orders()
+        )
+
+
+def test_snapshot_round_trip(tmp_path):
+    order_book = OrderBook()
+    for order in [
+        create_order("buy", "limit", 10, 99),
+        create_order("buy", "limit", 4, 98),
+        create_order("buy", "limit", 2, 99),
+        create_order("sell", "limit", 5, 101),
+        create_order("buy", "market", 8, None),
+        create_order("buy", "market", 4, None),
+    ]:
+        order_book.add_order(order)
+    path = str(tmp_path / "book.snapshot")
+    order_book.snapshot(path)
+    restored_order_book = OrderBook.restore(path)
+
+    assert_same_book(order_book, restored_order_book)
+    assert list(restored_order_book.bid_queue.iter_level_orders(99)) == [
+        (1, 10),
+        (3, 2),
+    ]
+    assert list(restored_order_book.market_bid_queue.iter_orders()) == [
+        (5, 3),
+        (6, 4),
+    ]
+    assert restored_order_book.depth(2) == order_book.depth(2)
+    assert (tmp_path / "book.snapshot").stat().st_size == HEADER.size + (
+        5 * ORDER_RECORD.size
+    )
+
+
+def test_restored_book_continues_matching(tmp_path):
+    random.seed(21)
+    orders = generate_orders(4_000)
+    order_book = OrderBook()
+    for order in orders[:2_000]:
+        order_book.add_order(order)
+    path = str(tmp_path / "book.snapshot")
+    order_book.snapshot(path)
+
+    restored_order_books = [
+        OrderBook.restore(path),
+        OrderBook.restore(
+            path,
+            queue_factory=functools.partial(
+                PriceLadderOrderQueue, min_price=1, max_price=200
+            ),
+        ),
+        OrderBook.restore(
+            path,
+            queue_factory=PooledOrderQueue,
+            market_queue_factory=PooledMarketOrderQueue,
+        ),
+    ]
+    for restored_order_book in restored_order_books:
+        assert_same_book(order_book, restored_order_book)
+    for order in orders[2_000:]:
+        messages = order_book.add_order(order)
+        for restored_order_book in restored_order_books:
+            assert restored_order_book.add_order(order) == messages
+
+
+def test_snapshot_round_trip_keeps_stop_orders(tmp_path):
+    order_book = OrderBook()
+    for order in [
+        create_order("buy", "limit", 10, 99),
+        create_order("sell", "limit", 5, 101),
+        create_order("buy", "stop", 8, None, 102),
+        create_order("buy", "stop_limit", 4, 103, 102),
+        create_order("sell", "stop_limit", 3, 97, 98),
+    ]:
+        order_book.add_order(order)
+    path = str(tmp_path / "book.snapshot")
+    order_book.snapshot(path)
+    restored_order_book = OrderBook.restore(path)
+
+    assert_same_book(order_book, restored_order_book)
+    assert (tmp_path / "book.snapshot").stat().st_size == HEADER.size + (
+        2 * ORDER_RECORD.size + 3 * STOP_ORDER_RECORD.size
+    )
+    # The restored stops are indexed and trigger as before
+    restored_order_book.cancel_order(4)
+    messages = restored_order_book.add_order(create_order("buy", "limit", 5, 101))
+    assert [message["trade_price"] for message in messages] == [101]
+    restored_order_book.add_order(create_order("sell", "limit", 8, 102))
+    restored_order_book.add_order(create_order("buy", "limit", 1, 102))
+    assert len(restored_order_book.stop_bid_queue) == 0
+    assert restored_order_book.depth(1)["ask"] == []
+
+
+def test_snapshot_round_trip_keeps_expiry_times(tmp_path):
+    order_book = OrderBook()
+    for order in [
+        create_order("buy", "limit", 10, 99, expire_time=30),
+        create_order("buy", "limit", 10, 98, expire_time=20),
+        create_order("sell", "limit", 5, 101, expire_time=30),
+        create_order("sell", "limit", 5, 102),
+        create_order("buy", "limit", 5, 97, expire_time=20),
+    ]:
+        order_book.add_order(order)
+    order_book.cancel_order(5)
+    order_book.advance_time(10)
+    path = str(tmp_path / "book.snapshot")
+    order_book.snapshot(path)
+    restored_order_book = OrderBook.restore(path)
+
+    assert_same_book(order_book, restored_order_book)
+    # The cancelled order's expiry is not written
+    assert (tmp_path / "book.snapshot").stat().st_size == HEADER.size + (
+        4 * ORDER_RECORD.size + 3 * EXPIRY_RECORD.size
+    )
+    assert restored_order_book.current_time == 10
+    assert restored_order_book.advance_time(30) == [2, 1, 3]
+    assert restored_order_book.depth(1) == {"bid": [], "ask": [(102, 5, 1)]}
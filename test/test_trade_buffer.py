@@ -0,0 +1,56 @@
+from order import create_order
+from orderbook import OrderBook
+from trade_buffer import NO_PRICE, TradeBuffer
+
+
+def test_order_book_writes_fills_to_trade_buffer():
+    trade_buffer = TradeBuffer(capacity=2)
+    order_book = OrderBook(trade_buffer=trade_buffer)
+    order_book.add_order(create_order("buy", "limit", 5, 99))
+    order_book.add_order(create_order("sell", "limit", 10, 101))
+    order_book.add_order(create_order("sell", "limit", 4, 102))
+    messages = order_book.add_order(create_order("buy", "market", 12, None))
+
+    assert messages == []
+    assert len(trade_buffer) == 2
+    columns = trade_buffer.columns()
+    assert columns["trade_price"].tolist() == [101, 102]
+    assert columns["quantity"].tolist() == [10, 2]
+    assert columns["aggressor_side"].tolist() == [1, 1]
+    assert columns["maker_order_id"].tolist() == [2, 3]
+    assert columns["taker_order_id"].tolist() == [4, 4]
+    assert columns["best_bid"].tolist() == [99, 99]
+    assert columns["best_ask"].tolist() == [102, 102]
+
+
+def test_trade_buffer_matches_messages():
+    orders = [
+        create_order("sell", "market", 3, None),
+        create_order("buy", "limit", 10, 99),
+        create_order("buy", "limit", 4, 98),
+        create_order("sell", "limit", 20, 97),
+    ]
+    order_book = OrderBook()
+    messages = [message for order in orders for message in order_book.add_order(order)]
+    trade_buffer = TradeBuffer(capacity=1)
+    buffered_order_book = OrderBook(trade_buffer=trade_buffer)
+    buffered_order_book.add_orders(orders)
+
+    columns = trade_buffer.columns()
+    assert columns["trade_price"].tolist() == [m["trade_price"] for m in messages]
+    assert columns["best_bid"].tolist() == [m["bid"] or NO_PRICE for m in messages]
+    assert columns["best_ask"].tolist() == [m["ask"] or NO_PRICE for m in messages]
+    assert columns["quantity"].tolist() == [3, 7, 4]
+    assert columns["aggressor_side"].tolist() == [-1, -1, -1]
+    assert columns["taker_order_id"].tolist() == [1, 4, 4]
+
+
+def test_trade_buffer_clear_keeps_capacity():
+    trade_buffer = TradeBuffer(capacity=1)
+    trade_buffer.append_trades([(100, 1, 1, None), (101, 2, 3, 102)], "buy", 9, 99)
+    capacity = trade_buffer.capacity
+    trade_buffer.clear()
+
+    assert len(trade_buffer) == 0
+    assert trade_buffer.capacity == capacity
+    assert trade_buffer.columns()["trade_price"].tolist() == []
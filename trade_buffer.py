@@ -0,0 +1,148 @@
+from array import array
+from typing import Dict, List, Literal, Optional
+
+# Prices must be positive so 0 marks an empty side of the book
+NO_PRICE = 0
+AGGRESSOR_SIDE_TO_CODE = {"buy": 1, "sell": -1}
+
+COLUMN_TYPECODES = {
+    "trade_price": "q",
+    "quantity": "q",
+    "aggressor_side": "b",
+    "maker_order_id": "q",
+    "taker_order_id": "q",
+    "best_bid": "q",
+    "best_ask": "q",
+}
+
+
+class TradeBuffer:
+    """
+    Growable columnar store of fills, one array.array column per field.
+
+    Columns are preallocated and doubled when full, only the first size rows are valid.
+    columns() hands out memoryviews so consumers can read the data without copies, e.g.
+    numpy.frombuffer(buffer.columns()["trade_price"], dtype=numpy.int64). Arrays cannot
+    grow while a view is held, so release views (or copy them) before matching resumes.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        assert capacity > 0, f"Capacity must be positive, given {capacity}"
+        self.capacity = capacity
+        self.size = 0
+        self.trade_price = self._new_column("trade_price", capacity)
+        self.quantity = self._new_column("quantity", capacity)
+        self.aggressor_side = self._new_column("aggressor_side", capacity)
+        self.maker_order_id = self._new_column("maker_order_id", capacity)
+        self.taker_order_id = self._new_column("taker_order_id", capacity)
+        self.best_bid = self._new_column("best_bid", capacity)
+        self.best_ask = self._new_column("best_ask", capacity)
+
+    @staticmethod
+    def _new_column(name: str, length: int) -> array:
+        column = array(COLUMN_TYPECODES[name])
+        column.frombytes(bytes(column.itemsize * length))
+        return column
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _grow(self, required: int):
+        additional = self.capacity
+        while self.capacity + additional < required:
+            additional *= 2
+        for name in COLUMN_TYPECODES:
+            getattr(self, name).extend(self._new_column(name, additional))
+        self.capacity += additional
+
+    def append_trades(
+        self,
+        trades_and_best: list,
+        side: Literal["buy", "sell"],
+        taker_order_id: int,
+        opposite_best: Optional[int],
+    ):
+        """
+        Appends the fills of one execution, trades_and_best as returned by OrderQueue
+        and opposite_best the best price on the aggressor's own side
+        """
+        self._append(
+            trades_and_best,
+            side,
+            array("q", [taker_order_id]) * len(trades_and_best),
+            opposite_best,
+        )
+
+    def append_sweep(
+        self,
+        trades_and_best: list,
+        side: Literal["buy", "sell"],
+        taker_order_ids: List[int],
+        opposite_best: Optional[int],
+    ):
+        """append_trades for fills of several aggressors, taker_order_ids per fill"""
+        self._append(trades_and_best, side, array("q", taker_order_ids), opposite_best)
+
+    def _append(
+        self,
+        trades_and_best: list,
+        side: Literal["buy", "sell"],
+        taker_order_ids: array,
+        opposite_best: Optional[int],
+    ):
+        start = self.size
+        end = start + len(trades_and_best)
+        if end > self.capacity:
+            self._grow(end)
+        if side == "buy":
+            own_best, opposite_best_column = self.best_ask, self.best_bid
+        else:
+            own_best, opposite_best_column = self.best_bid, self.best_ask
+        side_code = AGGRESSOR_SIDE_TO_CODE[side]
+        opposite_best = NO_PRICE if opposite_best is None else opposite_best
+        trade_price = self.trade_price
+        quantity = self.quantity
+        maker_order_id = self.maker_order_id
+        i = start
+        for price, fill_quantity, fill_maker_order_id, best_price in trades_and_best:
+            trade_price[i] = price
+            quantity[i] = fill_quantity
+            maker_order_id[i] = fill_maker_order_id
+            own_best[i] = NO_PRICE if best_price is None else best_price
+            i += 1
+        count = end - start
+        self.aggressor_side[start:end] = array("b", [side_code]) * count
+        self.taker_order_id[start:end] = taker_order_ids
+        opposite_best_column[start:end] = array("q", [opposite_best]) * count
+        self.size = end
+
+    def messages(self, start: int = 0) -> List[dict]:
+        """Fills from row start as the messages OrderBook returns without a buffer"""
+        end = self.size
+        return [
+            {
+                "bid": None if bid == NO_PRICE else bid,
+                "ask": None if ask == NO_PRICE else ask,
+                "trade_price": trade_price,
+            }
+            for trade_price, bid, ask in zip(
+                self.trade_price[start:end],
+                self.best_bid[start:end],
+                self.best_ask[start:end],
+            )
+        ]
+
+    def rows(self, start: int = 0) -> List[tuple]:
+        """Fills from row start as tuples of the COLUMN_TYPECODES fields in order"""
+        end = self.size
+        return list(zip(*(getattr(self, name)[start:end] for name in COLUMN_TYPECODES)))
+
+    def columns(self) -> Dict[str, memoryview]:
+        return {
+            name: memoryview(getattr(self, name))[: self.size]
+            for name in COLUMN_TYPECODES
+        }
+
+    def clear(self):
+        """Drops buffered fills, the allocated capacity is kept for reuse"""
+        self.size = 0